@@ -1,11 +1,11 @@
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.middleware.cors import CORSMiddleware
 from mangum import Mangum
 import os
 import sys
 
-# Add the current directory to the Python path
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# The app lives in backend/, next to this directory
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+# Defer the database client and startup work to the first request (see backend/database.py)
+os.environ.setdefault("LAZY_INIT", "1")
 
 # Import your existing server
 from server import app
@@ -15,4 +15,4 @@ handler = Mangum(app)
 
 # Export for Vercel
 def main(request):
-    return handler(request, {})
\ No newline at end of file
+    return handler(request, {})
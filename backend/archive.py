@@ -0,0 +1,111 @@
+"""Hot/cold tiering of the games collection
+
+Games older than ARCHIVE_AFTER_DAYS (90 by default) are moved in batches to
+the `games_archive` collection, in a compact form: the game id becomes the
+`_id`, so the archive needs no second unique index, and fields holding their
+default value (no player, standard mode, no NFT, ...) are left out. NFT
+metadata is already stored by template reference (see nft_templates).
+
+Each batch is upserted into the archive before it is deleted from the hot
+collection, so an interrupted run loses nothing and can simply be started
+again. `get_game` falls back to the archive for ids it cannot find, the
+export streams archived games ahead of the hot ones, and the rollups that
+are recomputed from the games (stats reconcile, leaderboard rebuilds, player
+backfill) read both collections. Run it from cron:
+
+    python archive.py [--older-than-days 90]
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+ARCHIVE_BATCH_SIZE = 1000
+# Values left out of archived games, restored when they are read back
+DEFAULT_VALUES: Dict[str, Any] = {"network": "sepolia", "game_mode": "standard", "nft_generated": False}
+OPTIONAL_FIELDS = ("player_address", "nft_metadata", "nft_id", "nft_template_id", "environment_id", "fhe_data")
+
+
+def compact_game(game: dict) -> dict:
+    """Archive document for a stored game"""
+    document = {"_id": game["id"]}
+    for field, value in game.items():
+        if field in ("_id", "id") or value is None:
+            continue
+        if field in DEFAULT_VALUES and value == DEFAULT_VALUES[field]:
+            continue
+        document[field] = value
+    return document
+
+
+def expand_game(document: dict) -> dict:
+    """Stored game, as returned by the API, for an archive document"""
+    game = {"id": document["_id"], **dict.fromkeys(OPTIONAL_FIELDS), **DEFAULT_VALUES}
+    game.update((field, value) for field, value in document.items() if field != "_id")
+    return game
+
+
+def archive_filter(query: dict) -> dict:
+    """Archive query for a games query, matching archived games whose filtered field was left out as a default"""
+    archived = dict(query)
+    for field, value in query.items():
+        if field in DEFAULT_VALUES and value == DEFAULT_VALUES[field]:
+            archived[field] = {"$in": [value, None]}
+    return archived
+
+
+def union_archive(archive_collection) -> List[dict]:
+    """Pipeline prefix adding the archived games to an aggregation over the games"""
+    if archive_collection is None:
+        return []
+    return [{"$unionWith": archive_collection.name}]
+
+
+class GameArchive:
+    """Moves old games to the archive collection and reads them back"""
+
+    def __init__(self, games_collection, archive_collection, older_than_days: float = 90,
+                 batch_size: int = ARCHIVE_BATCH_SIZE):
+        self.games_collection = games_collection
+        self.archive_collection = archive_collection
+        self.older_than_days = older_than_days
+        self.batch_size = batch_size
+
+    async def find_game(self, game_id: str) -> Optional[dict]:
+        document = await self.archive_collection.find_one({"_id": game_id})
+        return expand_game(document) if document is not None else None
+
+    async def archive(self, older_than_days: Optional[float] = None) -> Dict[str, Any]:
+        """Move the games older than the cutoff, oldest first, returning how many were moved"""
+        from pymongo import ReplaceOne
+
+        days = self.older_than_days if older_than_days is None else older_than_days
+        cutoff = datetime.now() - timedelta(days=days)
+        archived = 0
+        while True:
+            games = await self.games_collection.find({"timestamp": {"$lt": cutoff}}).sort(
+                [("timestamp", 1), ("id", 1)]
+            ).limit(self.batch_size).to_list(self.batch_size)
+            if not games:
+                break
+            await self.archive_collection.bulk_write(
+                [ReplaceOne({"_id": game["id"]}, compact_game(game), upsert=True) for game in games], ordered=False
+            )
+            await self.games_collection.delete_many({"_id": {"$in": [game["_id"] for game in games]}})
+            archived += len(games)
+        return {"archived": archived, "cutoff": cutoff}
+
+
+async def _main(argv=None) -> None:
+    from server import game_archive
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--older-than-days", type=float,
+                        help="Archive games older than this (default: ARCHIVE_AFTER_DAYS)")
+    args = parser.parse_args(argv)
+    result = await game_archive.archive(args.older_than_days)
+    print(f"Archived {result['archived']} games played before {result['cutoff']:%Y-%m-%d %H:%M}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
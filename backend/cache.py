@@ -0,0 +1,108 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+FOREVER = float("inf")
+
+
+class TTLCache:
+    """Small in-process cache whose entries expire after `ttl_seconds`
+
+    `get_or_load` is single-flight: concurrent misses for the same key share
+    one loader call instead of each hitting the backend. With `max_size` the
+    cache is bounded and evicts the least recently used entry. A loader
+    returning None (not found) is cached for `negative_ttl_seconds`, so
+    repeated lookups of a missing key stop reaching the backend; 0 disables
+    negative caching. Hits and misses are counted for the metrics endpoint.
+    """
+
+    def __init__(self, ttl_seconds: Optional[float], max_size: Optional[int] = None,
+                 negative_ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = FOREVER if ttl_seconds is None else ttl_seconds
+        self.max_size = max_size
+        self.negative_ttl_seconds = self.ttl_seconds if negative_ttl_seconds is None else negative_ttl_seconds
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self._values: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        found, value = self._lookup(key)
+        if found:
+            return value
+
+        self.misses += 1
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        else:
+            self._store(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    def get(self, key: Hashable) -> Any:
+        """Cached value for `key`, or None when it is not cached or has expired"""
+        found, value = self._lookup(key)
+        if not found:
+            self.misses += 1
+        return value
+
+    def _lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        cached = self._values.get(key)
+        if cached is None or cached[0] <= time.monotonic():
+            return False, None
+        if cached[1] is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        if self.max_size is not None:
+            self._values.move_to_end(key)
+        return True, cached[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Fill the cache on write, replacing any cached value or miss"""
+        self._store(key, value)
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        ttl = self.negative_ttl_seconds if value is None else self.ttl_seconds
+        if ttl <= 0:
+            self._values.pop(key, None)
+            return
+        self._values[key] = (time.monotonic() + ttl, value)
+        if self.max_size is not None:
+            self._values.move_to_end(key)
+            while len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._values.pop(key, None)
+
+    def clear(self) -> None:
+        self._values.clear()
+
+    def counters(self) -> Dict[str, int]:
+        return {"hit": self.hits, "negative_hit": self.negative_hits, "miss": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+class LRUCache(TTLCache):
+    """Bounded cache for immutable values, which never expire"""
+
+    def __init__(self, max_size: int, negative_ttl_seconds: float = 0):
+        super().__init__(None, max_size=max_size, negative_ttl_seconds=negative_ttl_seconds)
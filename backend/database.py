@@ -0,0 +1,253 @@
+"""MongoDB client lifecycle, connection pool settings and pool statistics
+
+Importing this module does not import Motor or open a client, which keeps
+serverless cold starts short. The client is created by `connect()` at
+startup, or by the first database call when startup work is deferred, and
+is then reused for as long as the process (or warm lambda) lives. `close()`
+releases its connections on shutdown.
+
+Pool settings come from the environment, so pools can be sized per worker:
+    MONGO_MAX_POOL_SIZE=100                 connections per server, per worker
+    MONGO_MIN_POOL_SIZE=0                   connections kept open when idle
+    MONGO_MAX_CONNECTING=2                  connections being opened at once
+    MONGO_MAX_IDLE_TIME_MS                  close connections idle this long
+    MONGO_WAIT_QUEUE_TIMEOUT_MS             give up waiting for a free connection
+    MONGO_SERVER_SELECTION_TIMEOUT_MS=5000  fail fast when no server is reachable
+    MONGO_CONNECT_TIMEOUT_MS                time allowed to open a connection
+    MONGO_SOCKET_TIMEOUT_MS                 per-operation socket timeout
+    MONGO_COMPRESSORS=zstd,snappy,zlib      wire compression, in order of preference
+    MONGO_ZLIB_LEVEL=-1
+
+STORAGE_BACKEND=memory swaps MongoDB for the in-process engine in
+memory_store.py (optionally persisted to MEMORY_STORAGE_PATH), behind the
+same collection interface; the default is STORAGE_BACKEND=mongo.
+"""
+import asyncio
+import importlib.util
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from logging_config import log_event
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
+DB_NAME = os.environ.get('DB_NAME', 'zama_dice_game')
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo')
+
+# Environment variable -> (client option, parser)
+POOL_OPTIONS = {
+    'MONGO_MAX_POOL_SIZE': ('maxPoolSize', int),
+    'MONGO_MIN_POOL_SIZE': ('minPoolSize', int),
+    'MONGO_MAX_CONNECTING': ('maxConnecting', int),
+    'MONGO_MAX_IDLE_TIME_MS': ('maxIdleTimeMS', int),
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': ('waitQueueTimeoutMS', int),
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': ('serverSelectionTimeoutMS', int),
+    'MONGO_CONNECT_TIMEOUT_MS': ('connectTimeoutMS', int),
+    'MONGO_SOCKET_TIMEOUT_MS': ('socketTimeoutMS', int),
+    'MONGO_ZLIB_LEVEL': ('zlibCompressionLevel', int),
+}
+DEFAULT_OPTIONS = {'serverSelectionTimeoutMS': 5000, 'appname': 'zama-dice-game'}
+# Compressors needing an optional package; zlib is always available
+COMPRESSOR_MODULES = {'zstd': 'zstandard', 'snappy': 'snappy', 'zlib': 'zlib'}
+
+
+class PoolStats:
+    """Connection pool counters per server, fed by pymongo pool events"""
+
+    def __init__(self):
+        self.pools: Dict[str, Dict[str, int]] = {}
+
+    def _pool(self, address: Tuple[str, int]) -> Dict[str, int]:
+        key = f"{address[0]}:{address[1]}"
+        pool = self.pools.get(key)
+        if pool is None:
+            pool = self.pools[key] = {
+                "open": 0, "in_use": 0, "waiting": 0, "created": 0, "closed": 0,
+                "check_outs": 0, "check_out_failures": 0, "cleared": 0,
+            }
+        return pool
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {address: {**pool, "idle": pool["open"] - pool["in_use"]} for address, pool in self.pools.items()}
+
+    def totals(self) -> Dict[str, int]:
+        """Counters summed over every server, without naming them"""
+        totals = {"servers": len(self.pools)}
+        for pool in self.snapshot().values():
+            for counter, value in pool.items():
+                totals[counter] = totals.get(counter, 0) + value
+        return totals
+
+    def pool_created(self, event):
+        self._pool(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._pool(event.address)["cleared"] += 1
+
+    def pool_closed(self, event):
+        self.pools.pop(f"{event.address[0]}:{event.address[1]}", None)
+
+    def connection_created(self, event):
+        pool = self._pool(event.address)
+        pool["open"] += 1
+        pool["created"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pool = self._pool(event.address)
+        pool["open"] -= 1
+        pool["closed"] += 1
+
+    def connection_check_out_started(self, event):
+        self._pool(event.address)["waiting"] += 1
+
+    def connection_check_out_failed(self, event):
+        pool = self._pool(event.address)
+        pool["waiting"] -= 1
+        pool["check_out_failures"] += 1
+
+    def connection_checked_out(self, event):
+        pool = self._pool(event.address)
+        pool["waiting"] -= 1
+        pool["in_use"] += 1
+        pool["check_outs"] += 1
+
+    def connection_checked_in(self, event):
+        self._pool(event.address)["in_use"] -= 1
+
+
+# Replaced by the listener registered with the client when it is created
+pool_stats = PoolStats()
+_client = None
+_memory_db = None
+
+
+def parse_compressors(value: str) -> list:
+    """Requested compressors whose library is installed, keeping their order"""
+    compressors = []
+    for name in filter(None, (part.strip() for part in value.split(","))):
+        module = COMPRESSOR_MODULES.get(name)
+        if module is None or importlib.util.find_spec(module) is None:
+            log_event("mongo_compressor_unavailable", logging.WARNING, compressor=name)
+            continue
+        compressors.append(name)
+    return compressors
+
+
+def client_options() -> Dict[str, Any]:
+    """Keyword arguments for the Mongo client, from the environment"""
+    options: Dict[str, Any] = dict(DEFAULT_OPTIONS)
+    for variable, (option, parse) in POOL_OPTIONS.items():
+        value = os.environ.get(variable)
+        if value:
+            options[option] = parse(value)
+    compressors = parse_compressors(os.environ.get('MONGO_COMPRESSORS', ''))
+    if compressors:
+        options['compressors'] = compressors
+    return options
+
+
+def _pool_listener() -> PoolStats:
+    from pymongo.monitoring import ConnectionPoolListener
+
+    # pymongo only accepts subclasses of its listener classes
+    class PoolStatsListener(PoolStats, ConnectionPoolListener):
+        pass
+
+    return PoolStatsListener()
+
+
+def get_client():
+    global _client, pool_stats
+    if _client is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        pool_stats = _pool_listener()
+        _client = AsyncIOMotorClient(MONGO_URL, event_listeners=[pool_stats], **client_options())
+    return _client
+
+
+def _memory_database():
+    global _memory_db
+    if _memory_db is None:
+        from indexes import INDEXES
+        from memory_store import MemoryDatabase
+
+        _memory_db = MemoryDatabase(DB_NAME, os.environ.get('MEMORY_STORAGE_PATH') or None,
+                                    fsync=os.environ.get('MEMORY_STORAGE_FSYNC') == '1')
+        # The engine relies on its indexes, so they are always declared
+        for name, indexes in INDEXES.items():
+            for index in indexes:
+                _memory_db[name].add_index(index.document)
+    return _memory_db
+
+
+def get_db():
+    if STORAGE_BACKEND == 'memory':
+        return _memory_database()
+    return get_client()[DB_NAME]
+
+
+async def connect() -> None:
+    """Create the client and open a first connection, so the first request does not pay for it"""
+    start = time.perf_counter()
+    try:
+        await get_db().command("ping")
+    except Exception as e:
+        # The pool keeps retrying; requests fail until a server is reachable
+        log_event("database_connect_failed", logging.WARNING, backend=STORAGE_BACKEND, error=str(e))
+        return
+    log_event("database_connected", backend=STORAGE_BACKEND,
+              duration_ms=round((time.perf_counter() - start) * 1000, 1))
+
+
+def close() -> None:
+    """Close every pooled connection; the client reopens if used again"""
+    if _client is not None:
+        _client.close()
+    if _memory_db is not None:
+        _memory_db.close()
+
+
+async def readiness(timeout: float = 2.0) -> Dict[str, Any]:
+    """Ping the database and report the round trip and pool statistics
+
+    Served unauthenticated, so the pool counters are totals: per-server
+    counters would name internal hosts.
+    """
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(get_db().command("ping"), timeout)
+        status: Optional[str] = None
+    except Exception as e:
+        # Only the error type: the message can name internal hosts
+        status = type(e).__name__
+    report: Dict[str, Any] = {
+        "status": "ok" if status is None else "unavailable",
+        "backend": STORAGE_BACKEND,
+        "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+        "pool": pool_stats.totals(),
+    }
+    if status is not None:
+        report["error"] = status
+    return report
+
+
+class LazyCollection:
+    """Stand-in for a Motor collection that resolves it on first use"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._collection = None
+
+    def __getattr__(self, attribute):
+        collection = self._collection
+        if collection is None:
+            collection = self._collection = get_db()[self.name]
+        return getattr(collection, attribute)
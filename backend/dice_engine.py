@@ -0,0 +1,83 @@
+"""Vectorized dice rolling and scoring
+
+Batched equivalents of `roll_dice` in server.py and of `calculate_score`
+and `determine_nft_rarity` in scoring.py, working on `(n_games, n_dice)`
+arrays.
+"""
+import argparse
+import time
+from typing import Optional
+
+import numpy as np
+
+RARITIES = ("Common", "Uncommon", "Rare", "Epic", "Legendary")
+COMMON, UNCOMMON, RARE, EPIC, LEGENDARY = range(len(RARITIES))
+
+
+def roll_dice_batch(n_games: int, n_dice: int = 2, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """Roll `n_games` games of `n_dice` dice each"""
+    if n_dice < 1:
+        raise ValueError("Number of dice must be at least 1")
+    n_dice = min(n_dice, 6)  # Cap at maximum, like roll_dice
+    rng = rng if rng is not None else np.random.default_rng()
+    return rng.integers(1, 7, size=(n_games, n_dice), dtype=np.int8)
+
+
+def _combination_flags(dice: np.ndarray):
+    dice = np.asarray(dice)
+    totals = dice.sum(axis=1, dtype=np.int32)
+    all_same = dice.min(axis=1) == dice.max(axis=1)
+    return dice, totals, all_same
+
+
+def score_batch(dice: np.ndarray) -> np.ndarray:
+    """Score every row of `dice` the same way as `calculate_score`"""
+    dice, totals, all_same = _combination_flags(dice)
+    ordered = np.sort(dice, axis=1)
+    # A sequence is n distinct consecutive faces: every step is exactly 1
+    sequence = np.all(np.diff(ordered, axis=1) == 1, axis=1) & ~all_same
+    return np.where(all_same, totals * 2, np.where(sequence, totals + 10, totals))
+
+
+def rarity_codes_batch(dice: np.ndarray, game_mode: str = "standard") -> np.ndarray:
+    """Rarity of every row of `dice` as indexes into RARITIES"""
+    dice, totals, all_same = _combination_flags(dice)
+    fhe = game_mode == "fhe"
+    codes = np.full(len(totals), COMMON, dtype=np.uint8)
+    codes[totals >= 7] = UNCOMMON if fhe else COMMON
+    codes[totals >= 10] = RARE if fhe else UNCOMMON
+    codes[all_same] = LEGENDARY if fhe else EPIC
+    return codes
+
+
+def rarity_batch(dice: np.ndarray, game_mode: str = "standard") -> np.ndarray:
+    """Rarity names of every row of `dice`, as `determine_nft_rarity` would return them"""
+    return np.asarray(RARITIES, dtype=object)[rarity_codes_batch(dice, game_mode)]
+
+
+def simulate(n_games: int, n_dice: int = 2, game_mode: str = "standard", seed: Optional[int] = None) -> dict:
+    """Roll and score `n_games` games, returning score and rarity distributions"""
+    dice = roll_dice_batch(n_games, n_dice, np.random.default_rng(seed))
+    scores = score_batch(dice)
+    rarities = np.bincount(rarity_codes_batch(dice, game_mode), minlength=len(RARITIES))
+    return {
+        "games": n_games,
+        "mean_score": float(scores.mean()),
+        "max_score": int(scores.max()),
+        "rarities": {name: int(count) for name, count in zip(RARITIES, rarities) if count},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline dice game simulation")
+    parser.add_argument("--games", type=int, default=1_000_000)
+    parser.add_argument("--dice", type=int, default=2)
+    parser.add_argument("--mode", choices=["standard", "fhe"], default="standard")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = simulate(args.games, args.dice, args.mode, args.seed)
+    elapsed = time.perf_counter() - start
+    print(result)
+    print(f"{args.games / elapsed:,.0f} games/s")
@@ -0,0 +1,76 @@
+"""In-process fan-out of live game events
+
+`EventHub.publish` is called from the play write path; every connected
+`/api/stream` client has its own bounded queue. A client that falls
+`queue_size` events behind is dropped rather than slowing everyone else
+down, and reconnects with `Last-Event-ID` to catch up from the replay buffer.
+"""
+import asyncio
+import itertools
+from collections import deque
+from typing import AsyncIterator, Deque, Optional, Set, Tuple
+
+from serialization import dumps
+
+HEARTBEAT_SECONDS = 15.0
+
+
+class Subscription:
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = asyncio.Event()
+
+
+class EventHub:
+    def __init__(self, replay_size: int = 256, queue_size: int = 64):
+        self.queue_size = queue_size
+        self._ids = itertools.count(1)
+        self._replay: Deque[Tuple[int, bytes]] = deque(maxlen=replay_size)
+        self._subscribers: Set[Subscription] = set()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event_type: str, data) -> int:
+        """Send an event to every subscriber, returning its id"""
+        event_id = next(self._ids)
+        message = f"id: {event_id}\nevent: {event_type}\ndata: ".encode() + dumps(data) + b"\n\n"
+        self._replay.append((event_id, message))
+        for subscription in list(self._subscribers):
+            try:
+                subscription.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._drop(subscription)
+        return event_id
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> Subscription:
+        """Register a subscriber, replaying buffered events newer than `last_event_id`"""
+        subscription = Subscription(self.queue_size)
+        if last_event_id is not None:
+            missed = [message for event_id, message in self._replay if event_id > last_event_id]
+            for message in missed[-self.queue_size:]:
+                subscription.queue.put_nowait(message)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+
+    def _drop(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+        subscription.dropped.set()
+
+    async def stream(self, subscription: Subscription) -> AsyncIterator[bytes]:
+        """Server-Sent Events byte stream for a subscription"""
+        try:
+            yield b"retry: 2000\n\n"
+            while not subscription.dropped.is_set() or not subscription.queue.empty():
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if subscription.dropped.is_set():
+                        break
+                    yield b": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscription)
@@ -0,0 +1,159 @@
+"""Streaming export of the game history, as NDJSON or CSV
+
+Games are read with a cursor in (timestamp, id) order, `batch_size`
+documents per round trip, archived games first (see archive), and encoded into chunks of about CHUNK_BYTES that
+are handed on as soon as they fill, optionally through a streaming gzip
+compressor. Memory use depends on the batch and chunk sizes, not on how many
+games are exported. Served by `GET /api/export/games` and usable directly:
+
+    python export.py --format csv --gzip --mode fhe --since 2024-01-01 > games.csv.gz
+"""
+import argparse
+import asyncio
+import csv
+import io
+import sys
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Dict, Optional
+
+from archive import archive_filter, expand_game
+from serialization import dumps
+
+EXPORT_FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+CSV_FIELDS = ("id", "timestamp", "player_address", "game_mode", "dice_results", "total_score",
+              "nft_generated", "nft_id", "network", "environment_id")
+DEFAULT_BATCH_SIZE = 1000
+MAX_BATCH_SIZE = 10000
+CHUNK_BYTES = 64 * 1024
+
+
+def local_time(value: datetime) -> datetime:
+    # Games are stored with naive local timestamps
+    if value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def export_filter(player: Optional[str] = None, mode: Optional[str] = None,
+                  since: Optional[datetime] = None, until: Optional[datetime] = None) -> dict:
+    """Games query for the export filters; `since` is inclusive and `until` exclusive"""
+    query: Dict[str, object] = {}
+    if player:
+        query["player_address"] = player
+    if mode:
+        query["game_mode"] = mode
+    timestamp = {}
+    if since is not None:
+        timestamp["$gte"] = local_time(since)
+    if until is not None:
+        timestamp["$lt"] = local_time(until)
+    if timestamp:
+        query["timestamp"] = timestamp
+    return query
+
+
+def csv_row(game: dict) -> list:
+    row = []
+    for field in CSV_FIELDS:
+        value = game.get(field)
+        if field == "dice_results" and value is not None:
+            value = " ".join(str(die) for die in value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        row.append("" if value is None else value)
+    return row
+
+
+async def stored_games(collection, query: dict, projection: dict, batch_size: int,
+                       archive_collection=None) -> AsyncIterator[dict]:
+    """Games matching `query`, oldest first, the archived ones included"""
+    last = None
+    if archive_collection is not None:
+        # Archived games are all older than the hot ones, as the oldest are archived first
+        archived = archive_collection.find(archive_filter(query)).sort([("timestamp", 1), ("_id", 1)])
+        async for document in archived.batch_size(batch_size):
+            last = document
+            yield expand_game(document)
+    if last is not None:
+        # Skip games caught between their copy to the archive and their deletion
+        query = {"$and": [query, {"$or": [
+            {"timestamp": {"$gt": last["timestamp"]}}, {"timestamp": last["timestamp"], "id": {"$gt": last["_id"]}}
+        ]}]}
+    async for game in collection.find(query, projection).sort([("timestamp", 1), ("id", 1)]).batch_size(batch_size):
+        yield game
+
+
+async def export_games(collection, query: dict, export_format: str = "ndjson",
+                       batch_size: int = DEFAULT_BATCH_SIZE, archive_collection=None) -> AsyncIterator[bytes]:
+    """Encoded chunks of the games matching `query`, oldest first, archived ones included if `archive_collection`"""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    projection = {"_id": 0}
+    if export_format == "csv":
+        projection = {**projection, **{field: 1 for field in CSV_FIELDS}}
+    games = stored_games(collection, query, projection, batch_size, archive_collection)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == "csv" else None
+    chunk = bytearray()
+    if writer is not None:
+        writer.writerow(CSV_FIELDS)
+    async for game in games:
+        if writer is not None:
+            writer.writerow(csv_row(game))
+            chunk += buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        else:
+            chunk += dumps(game)
+            chunk += b"\n"
+        if len(chunk) >= CHUNK_BYTES:
+            yield bytes(chunk)
+            chunk.clear()
+    if writer is not None:
+        chunk += buffer.getvalue().encode("utf-8")
+    if chunk:
+        yield bytes(chunk)
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Compress a stream of chunks into a single gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+async def _main(argv=None) -> None:
+    from server import games_archive_collection, games_collection
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--gzip", action="store_true", help="Compress the output")
+    parser.add_argument("--player", help="Only games of this wallet address")
+    parser.add_argument("--mode", help="Only games of this game mode")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Games at or after this ISO time")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Games before this ISO time")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--output", help="File to write (default: stdout)")
+    args = parser.parse_args(argv)
+
+    chunks = export_games(games_collection, export_filter(args.player, args.mode, args.since, args.until),
+                          args.format, args.batch_size, games_archive_collection)
+    if args.gzip:
+        chunks = gzip_chunks(chunks)
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        async for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,165 @@
+"""FHE ciphertext verification, offloaded from the event loop
+
+Verifying a ciphertext is CPU-bound, so it never runs on the event loop:
+`FHEVerifier` submits batches of payloads to a process pool, started on
+first use. FHE_EXECUTOR=thread uses a thread pool instead; it is the default
+on Vercel, whose functions cannot create the semaphores a process pool
+needs, and the verifier also falls back to threads wherever creating the
+process pool fails.
+
+- FHE_WORKERS                 processes (default: one per CPU)
+- FHE_MAX_PENDING=256         ciphertexts queued or being verified; beyond
+                              this `verify` raises FHEVerifierBusy (503)
+- FHE_TIMEOUT_SECONDS=5       a batch not verified in time raises
+                              FHEVerificationTimeout (504)
+- FHE_WORK_FACTOR=20000       cost of the simulated verification
+
+The verifier itself is a stand-in until ciphertexts are checked against
+the coprocessor: PBKDF2 over the ciphertext models the cost of real
+verification. The dice mix in a random nonce drawn by the server for every
+play, so a client cannot search for a ciphertext that rolls what it wants.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from logging_config import log_event
+
+MAX_CIPHERTEXT_BYTES = 64 * 1024
+NONCE_BYTES = 16
+
+
+class FHEVerifierBusy(Exception):
+    """Too many ciphertexts are already waiting for verification"""
+
+
+class FHEVerificationTimeout(Exception):
+    """A batch was not verified within the timeout"""
+
+
+def ciphertext(encrypted_data: Dict[str, Any]) -> bytes:
+    """Ciphertext bytes of a play payload ({"dice1": [byte, ...], ...}), raising ValueError if malformed"""
+    chunks = []
+    for key in sorted(encrypted_data):
+        value = encrypted_data[key]
+        if not isinstance(value, list):
+            continue
+        if not all(isinstance(byte, int) and 0 <= byte <= 255 for byte in value):
+            raise ValueError(f"encrypted_data.{key} must be a list of bytes")
+        chunks.append(bytes(value))
+    data = b"".join(chunks)
+    if not data:
+        raise ValueError("encrypted_data holds no ciphertext")
+    if len(data) > MAX_CIPHERTEXT_BYTES:
+        raise ValueError(f"encrypted_data is larger than {MAX_CIPHERTEXT_BYTES} bytes")
+    return data
+
+
+def verify_ciphertexts(jobs: Sequence[Tuple[bytes, bytes, int]], work_factor: int) -> List[List[int]]:
+    """Dice for each verified (ciphertext, server nonce, num_dice); runs in a worker"""
+    results = []
+    for data, nonce, num_dice in jobs:
+        dice = []
+        for die in range(num_dice):
+            digest = hashlib.pbkdf2_hmac("sha256", data, nonce + b"die%d" % die, work_factor)
+            dice.append(int.from_bytes(digest[:8], "big") % 6 + 1)
+        results.append(dice)
+    return results
+
+
+class FHEVerifier:
+    """Bounded, timed verification of ciphertext batches on a worker pool"""
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: int = 256,
+                 timeout_seconds: float = 5.0, work_factor: int = 20000, use_threads: bool = False):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.timeout_seconds = timeout_seconds
+        self.work_factor = work_factor
+        self.use_threads = use_threads
+        self.pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._executor = None
+        # Slots are released from pool threads, possibly after the event loop is gone
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+            if not self.use_threads:
+                import multiprocessing
+
+                try:
+                    # Spawned, not forked: the parent holds database client threads
+                    self._executor = ProcessPoolExecutor(self.max_workers,
+                                                         mp_context=multiprocessing.get_context("spawn"))
+                except (OSError, NotImplementedError) as e:
+                    # No semaphores or process support, as in serverless runtimes
+                    log_event("fhe_process_pool_unavailable", logging.WARNING, error=str(e))
+                    self.use_threads = True
+            if self.use_threads:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="fhe")
+        return self._executor
+
+    async def verify(self, payloads: Sequence[Tuple[Dict[str, Any], int]]) -> List[List[int]]:
+        """Dice for each (encrypted_data, num_dice), in order
+
+        Raises ValueError for malformed payloads, FHEVerifierBusy when the
+        queue is full and FHEVerificationTimeout when the batch takes too long.
+        """
+        jobs = [(ciphertext(encrypted_data), secrets.token_bytes(NONCE_BYTES), num_dice)
+                for encrypted_data, num_dice in payloads]
+        if not jobs:
+            return []
+        with self._lock:
+            if self.pending + len(jobs) > self.max_pending:
+                self.rejected += len(jobs)
+                raise FHEVerifierBusy()
+            self.pending += len(jobs)
+
+        # Spread the batch over the workers, one chunk each
+        executor = self._get_executor()
+        size = -(-len(jobs) // self.max_workers)
+        futures = []
+        for start in range(0, len(jobs), size):
+            chunk = jobs[start:start + size]
+            work = executor.submit(verify_ciphertexts, chunk, self.work_factor)
+            # Released when the worker is done, not when the caller gives up, so the bound holds
+            work.add_done_callback(lambda _, count=len(chunk): self._release(count))
+            futures.append(asyncio.wrap_future(work))
+        try:
+            chunks = await asyncio.wait_for(asyncio.gather(*futures), self.timeout_seconds)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise FHEVerificationTimeout()
+        return [dice for chunk in chunks for dice in chunk]
+
+    def _release(self, count: int) -> None:
+        with self._lock:
+            self.pending -= count
+
+    def counters(self) -> Dict[str, int]:
+        return {"pending": self.pending, "rejected": self.rejected, "timeouts": self.timeouts}
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def create_fhe_verifier() -> FHEVerifier:
+    """Verifier configured from the environment"""
+    workers = os.environ.get('FHE_WORKERS')
+    return FHEVerifier(
+        max_workers=int(workers) if workers else None,
+        max_pending=int(os.environ.get('FHE_MAX_PENDING', '256')),
+        timeout_seconds=float(os.environ.get('FHE_TIMEOUT_SECONDS', '5')),
+        work_factor=int(os.environ.get('FHE_WORK_FACTOR', '20000')),
+        use_threads=os.environ.get('FHE_EXECUTOR', 'thread' if os.environ.get('VERCEL') else 'process') == 'thread',
+    )
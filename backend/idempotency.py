@@ -0,0 +1,162 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, Optional, Sequence
+
+from cache import TTLCache
+from serialization import dumps
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    """The key is held by a request still in progress"""
+
+
+class IdempotencyKeyReused(IdempotencyConflict):
+    """The key was already used for a request with different parameters"""
+
+
+def fingerprint(*values: Any) -> str:
+    """Digest of the request parameters a key is bound to, whatever the order of their object keys"""
+    return hashlib.sha256(dumps(values, sort_keys=True)).hexdigest()
+
+
+def utc_now() -> datetime:
+    # Naive UTC, the way TTL indexes compare expires_at
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def outstanding(record: dict) -> bool:
+    """Whether a completed record still has rollups that are not known to be applied"""
+    return any(state != "done" for state in record.get("rollups", {}).values())
+
+
+class IdempotencyStore:
+    """Results of requests sent with an Idempotency-Key, replayed on retries
+
+    `lookup` answers retries of completed requests before any other work is
+    done. `claim` inserts a pending record keyed by the idempotency key, so
+    of two concurrent attempts only one runs; the other gets
+    IdempotencyConflict. The claim names the game the attempt is about to
+    save, so if the attempt stops before `complete`, the retry that takes
+    over the expired claim can still find that game rather than playing a
+    second one.
+
+    `complete` stores the response along with the rollups (derived writes
+    such as player totals) the request still has to apply, each marked
+    "running". The attempt marks them "done" or "failed" with
+    `finish_rollups`; a retry takes the failed ones, and those left running
+    past `lock_seconds`, with `take_rollups`, one atomic update each, so a
+    rollup is never applied by two attempts at once.
+
+    A completed record lives for `ttl_seconds` and a pending one for
+    `lock_seconds`; a TTL index on `expires_at` removes them. Completed
+    records with every rollup done are also kept in an in-process cache, so
+    most retries are answered without a database call.
+    """
+
+    def __init__(self, collection, ttl_seconds: float = 86400, lock_seconds: float = 60,
+                 cache_size: int = 10000):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        self._cache = TTLCache(ttl_seconds, max_size=cache_size)
+
+    async def lookup(self, key: str, request_fingerprint: str) -> Optional[dict]:
+        """Completed record of `key`, if any, raising IdempotencyConflict while it is in progress"""
+        record = self._cache.get(key)
+        if record is None:
+            record = await self.collection.find_one({"_id": key})
+            if record is None:
+                return None
+            if record["status"] != "completed":
+                if record["expires_at"] <= utc_now():
+                    return None
+                raise IdempotencyConflict("Request with this Idempotency-Key is in progress")
+            self._remember(record)
+        return self._replay(record, request_fingerprint)
+
+    async def claim(self, key: str, request_fingerprint: str, game_id: Optional[str] = None) -> Optional[dict]:
+        """Reserve `key` for this request, about to save `game_id`
+
+        Returns None when the key was free, the completed record to replay,
+        or the pending record of an abandoned attempt whose claim this
+        request took over, so that the attempt's game can be recovered.
+        """
+        from pymongo.errors import DuplicateKeyError
+
+        record = self._cache.get(key)
+        if record is not None:
+            return self._replay(record, request_fingerprint)
+
+        now = utc_now()
+        claim = {"_id": key, "status": "pending", "fingerprint": request_fingerprint, "game_id": game_id,
+                 "expires_at": now + timedelta(seconds=self.lock_seconds)}
+        try:
+            await self.collection.insert_one(claim)
+            return None
+        except DuplicateKeyError:
+            existing = await self.collection.find_one({"_id": key})
+        if existing is None:
+            # Expired between the insert and the read
+            raise IdempotencyConflict("Request with this Idempotency-Key is in progress")
+        if existing["status"] == "completed":
+            self._remember(existing)
+            return self._replay(existing, request_fingerprint)
+        if existing["expires_at"] <= now:
+            # The attempt holding the key never finished; take over its claim
+            result = await self.collection.replace_one({"_id": key, "expires_at": existing["expires_at"]}, claim)
+            if result.matched_count:
+                if existing.get("game_id") is None or existing["fingerprint"] != request_fingerprint:
+                    return None
+                return existing
+        raise IdempotencyConflict("Request with this Idempotency-Key is in progress")
+
+    async def complete(self, key: str, request_fingerprint: str, response: dict,
+                       rollups: Sequence[str] = ()) -> dict:
+        """Store the response of `key`, with the rollups this attempt is about to apply"""
+        now = utc_now()
+        record = {"_id": key, "status": "completed", "fingerprint": request_fingerprint, "response": response,
+                  "rollups": dict.fromkeys(rollups, "running"),
+                  "rollups_until": now + timedelta(seconds=self.lock_seconds),
+                  "expires_at": now + timedelta(seconds=self.ttl_seconds)}
+        await self.collection.replace_one({"_id": key}, record, upsert=True)
+        self._remember(record)
+        return record
+
+    async def finish_rollups(self, key: str, done: Sequence[str], failed: Sequence[str] = ()) -> None:
+        """Record which of the rollups taken by this attempt were applied"""
+        states = {**{f"rollups.{name}": "done" for name in done}, **{f"rollups.{name}": "failed" for name in failed}}
+        if states:
+            await self.collection.update_one({"_id": key}, {"$set": states})
+
+    async def take_rollups(self, key: str, record: dict) -> List[str]:
+        """Take the rollups of a completed record that earlier attempts failed or abandoned"""
+        taken = []
+        for name, state in record.get("rollups", {}).items():
+            if state == "done":
+                continue
+            now = utc_now()
+            result = await self.collection.update_one(
+                {"_id": key, "$or": [{f"rollups.{name}": "failed"},
+                                     {f"rollups.{name}": "running", "rollups_until": {"$lte": now}}]},
+                {"$set": {f"rollups.{name}": "running", "rollups_until": now + timedelta(seconds=self.lock_seconds)}}
+            )
+            if result.modified_count:
+                taken.append(name)
+        return taken
+
+    async def release(self, key: str) -> None:
+        """Drop a pending claim whose request failed before saving anything, so a retry can run"""
+        await self.collection.delete_one({"_id": key, "status": "pending"})
+
+    def _remember(self, record: dict) -> None:
+        # Records with rollups left are read again, to pick up their progress
+        if not outstanding(record):
+            self._cache.set(record["_id"], record)
+
+    @staticmethod
+    def _replay(record: dict, request_fingerprint: str) -> dict:
+        if record["fingerprint"] != request_fingerprint:
+            raise IdempotencyKeyReused("Idempotency-Key was already used for a different request")
+        return record
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import sys
+from datetime import datetime
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+# Indexes required by the hot queries, per collection
+INDEXES: Dict[str, List[IndexModel]] = {
+    "games": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)], name="timestamp_id"),
+        IndexModel([("player_address", ASCENDING), ("timestamp", DESCENDING)], name="player_timestamp"),
+    ],
+    "games_archive": [
+        # Archived games are keyed by game id (_id); the export walks them in (timestamp, _id)
+        # order, and range rebuilds use the timestamp prefix
+        IndexModel([("timestamp", ASCENDING), ("_id", ASCENDING)], name="timestamp_id"),
+    ],
+    "users": [
+        IndexModel([("wallet_address", ASCENDING)], name="wallet_address_unique", unique=True),
+        # All-time leaderboard
+        IndexModel([("total_score", DESCENDING), ("wallet_address", ASCENDING)], name="total_score", sparse=True),
+        # All-time leaderboards per game mode
+        IndexModel([("modes.standard.total_score", DESCENDING), ("wallet_address", ASCENDING)],
+                   name="standard_total_score", sparse=True),
+        IndexModel([("modes.fhe.total_score", DESCENDING), ("wallet_address", ASCENDING)],
+                   name="fhe_total_score", sparse=True),
+    ],
+    "nfts": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("owner_address", ASCENDING), ("created_at", DESCENDING)], name="owner_created_at"),
+    ],
+    "leaderboard_rollups": [
+        # Rollups are read by _id; the day serves rebuilds
+        IndexModel([("day", ASCENDING)], name="day"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "leaderboard_days": [
+        IndexModel([("mode", ASCENDING), ("day", ASCENDING)], name="mode_day"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "idempotency_keys": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "rate_limits": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+
+def hot_queries(db) -> Dict[str, object]:
+    """The queries issued by the API handlers, as explainable cursors"""
+    return {
+        "get_game": db["games"].find({"id": "explain"}).limit(1),
+        "get_games": db["games"].find({}).sort([("timestamp", -1), ("id", -1)]).limit(10),
+        "player_games": db["games"].find({"player_address": "0x0"}).sort("timestamp", -1).limit(10),
+        "export_archive": db["games_archive"].find({"timestamp": {"$gte": datetime(2024, 1, 1)}}).sort(
+            [("timestamp", 1), ("_id", 1)]
+        ),
+        "get_user": db["users"].find({"wallet_address": "0x0"}).limit(1),
+        "get_leaderboard": db["users"].find({"total_score": {"$gt": 0}}).sort(
+            [("total_score", -1), ("wallet_address", 1)]
+        ).limit(10),
+        "get_weekly_leaderboard": db["leaderboard_days"].find(
+            {"mode": "fhe", "day": {"$gte": datetime(2024, 1, 1)}}
+        ),
+        "get_mode_leaderboard": db["users"].find({"modes.fhe.total_score": {"$gt": 0}}).sort(
+            [("modes.fhe.total_score", -1), ("wallet_address", 1)]
+        ).limit(10),
+    }
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create any missing index; existing identical indexes are left alone"""
+    created = {}
+    for name, indexes in INDEXES.items():
+        created[name] = await db[name].create_indexes(indexes)
+    return created
+
+
+async def index_usage(db) -> Dict[str, Dict[str, int]]:
+    """Number of operations that used each index since the server started"""
+    usage = {}
+    for name in INDEXES:
+        stats = await db[name].aggregate([{"$indexStats": {}}]).to_list(None)
+        usage[name] = {stat["name"]: stat["accesses"]["ops"] for stat in stats}
+    return usage
+
+
+def _plan_stages(plan: dict) -> List[dict]:
+    stages = [plan]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(_plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+async def explain_hot_queries(db) -> Dict[str, dict]:
+    """Report the winning plan of every hot query and flag collection scans"""
+    report = {}
+    for name, cursor in hot_queries(db).items():
+        explain = await cursor.explain()
+        stages = _plan_stages(explain["queryPlanner"]["winningPlan"])
+        report[name] = {
+            "stages": [stage["stage"] for stage in stages],
+            "indexes": [stage["indexName"] for stage in stages if "indexName" in stage],
+            "collection_scan": any(stage["stage"] == "COLLSCAN" for stage in stages),
+        }
+    return report
+
+
+async def _main(argv: List[str]) -> None:
+    from database import get_db
+
+    db = get_db()
+    print(json.dumps({"created": await ensure_indexes(db)}, indent=2))
+    if "--usage" in argv:
+        print(json.dumps({"usage": await index_usage(db)}, indent=2))
+    if "--explain" in argv:
+        report = await explain_hot_queries(db)
+        print(json.dumps({"explain": report}, indent=2))
+        if any(plan["collection_scan"] for plan in report.values()):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
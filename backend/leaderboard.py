@@ -0,0 +1,306 @@
+import asyncio
+import bisect
+import heapq
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from cache import TTLCache
+
+GAME_MODES = ("standard", "fhe")
+# Days covered by each time window, today included
+WINDOW_DAYS = {"day": 1, "week": 7}
+# Optimistic rewrites of a daily bucket before giving up
+BUCKET_WRITE_ATTEMPTS = 10
+
+
+class Leaderboard:
+    """All-time top-K players, read from the per-player totals on the users
+
+    Totals are kept by PlayerStats, the single source of per-player
+    aggregates; this class only ranks them. The top `max_size` entries are
+    kept sorted in memory: totals returned by local writes are offered to it
+    directly and it is reloaded from the users `total_score` index every
+    `refresh_seconds` to pick up writes made by other workers.
+    """
+
+    def __init__(self, users_collection, max_size: int = 100, refresh_seconds: float = 5.0):
+        self.users_collection = users_collection
+        self.max_size = max_size
+        self.refresh_seconds = refresh_seconds
+        self._top: List[dict] = []
+        self._keys: List[tuple] = []
+        self._loaded_at: Optional[float] = None
+        self._refresh_lock: Optional[asyncio.Lock] = None
+
+    def offer(self, entries: Iterable[dict]) -> bool:
+        """Take in players' updated totals, as returned by PlayerStats, returning whether the top-K changed"""
+        changed = False
+        for entry in entries:
+            changed |= self._offer(entry)
+        return changed
+
+    async def top(self, limit: int = 10) -> List[dict]:
+        """Return the top `limit` players by total score"""
+        limit = max(0, min(limit, self.max_size))
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_seconds:
+            await self._refresh()
+        return [dict(entry) for entry in self._top[:limit]]
+
+    def _offer(self, entry: dict) -> bool:
+        # Totals only grow, so an entry either moves up within the top-K or
+        # enters it by pushing out the current minimum
+        player = entry["_id"]
+        for i, existing in enumerate(self._top):
+            if existing["_id"] == player:
+                del self._top[i]
+                del self._keys[i]
+                break
+        key = (-entry["total_score"], player)
+        if len(self._top) >= self.max_size and key > self._keys[-1]:
+            return False
+        index = bisect.bisect_left(self._keys, key)
+        self._keys.insert(index, key)
+        self._top.insert(index, entry)
+        del self._top[self.max_size:]
+        del self._keys[self.max_size:]
+        return True
+
+    async def _refresh(self) -> None:
+        # Created lazily so the lock binds to the running event loop
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at <= self.refresh_seconds:
+                return
+            users = await self.users_collection.find(
+                {"total_score": {"$gt": 0}}, {"_id": 0, "wallet_address": 1, "total_score": 1, "games_played": 1}
+            ).sort([("total_score", -1), ("wallet_address", 1)]).limit(self.max_size).to_list(self.max_size)
+            entries = [{"_id": user["wallet_address"], "total_score": user["total_score"],
+                        "games_played": user.get("games_played", 0)} for user in users]
+            self._top = entries
+            self._keys = [(-entry["total_score"], entry["_id"]) for entry in entries]
+            self._loaded_at = time.monotonic()
+
+
+class WindowedLeaderboard:
+    """Daily and weekly leaderboards per game mode, merged from daily top-K buckets
+
+    Each play `$inc`s the player's rollup for its (mode, day), which holds
+    their exact daily totals, and offers the updated totals to the bucket of
+    that (mode, day): one document keeping the day's top `bucket_size`
+    players. A weekly FHE leaderboard reads the 7 buckets of the week and
+    merges them, whatever the number of players. A player outside a day's
+    top-K is left out of that day when merging, so `bucket_size` is kept
+    above `max_size` to make such misses unlikely in the weekly ranking.
+
+    Buckets are rewritten whole, guarded by a version number so concurrent
+    writers retry instead of overwriting each other. Once a bucket is full,
+    totals below its lowest entry are not offered, so most plays of a busy
+    day only write their rollup. Rollups and buckets carry an `expires_at`,
+    in UTC as TTL indexes require, that drops them `retention_days` after
+    their (local) day. Rankings are cached for `cache_seconds`.
+
+    All-time rankings per mode come from the per-player mode totals kept on
+    the user documents (see player_stats), read through an index.
+    """
+
+    def __init__(self, collection, buckets_collection, users_collection, retention_days: int = 35,
+                 max_size: int = 100, bucket_size: int = 200, cache_seconds: float = 5.0):
+        self.collection = collection
+        self.buckets_collection = buckets_collection
+        self.users_collection = users_collection
+        self.retention_days = retention_days
+        self.max_size = max_size
+        self.bucket_size = bucket_size
+        self._cache = TTLCache(cache_seconds)
+        # Lowest total of each full bucket; buckets only ever raise it
+        self._floors = TTLCache(86400, max_size=64)
+
+    @staticmethod
+    def rollup_id(game_mode: str, day: datetime, player_address: str) -> str:
+        return f"{game_mode}:{day:%Y-%m-%d}:{player_address}"
+
+    @staticmethod
+    def bucket_id(game_mode: str, day: datetime) -> str:
+        return f"{game_mode}:{day:%Y-%m-%d}"
+
+    def bucket(self, game_mode: str, day: datetime) -> dict:
+        """Fields identifying the bucket of a (mode, day)"""
+        expires_at = (day + timedelta(days=self.retention_days + 1)).astimezone(timezone.utc)
+        return {"mode": game_mode, "day": day, "expires_at": expires_at.replace(tzinfo=None)}
+
+    def rollup(self, game_mode: str, day: datetime, player_address: str) -> dict:
+        """Fields identifying a rollup, set when it is created"""
+        return {**self.bucket(game_mode, day), "player": player_address}
+
+    def updates(self, games: Iterable) -> Dict[str, dict]:
+        """Update document per rollup for a set of games (GameResult-like objects)"""
+        updates: Dict[str, dict] = {}
+        for game in games:
+            if not game.player_address:
+                continue
+            game_mode = "fhe" if game.game_mode == "fhe" else "standard"
+            day = datetime(game.timestamp.year, game.timestamp.month, game.timestamp.day)
+            rollup = self.rollup_id(game_mode, day, game.player_address)
+            update = updates.get(rollup)
+            if update is None:
+                update = updates[rollup] = {"$inc": {"total_score": 0, "games_played": 0},
+                                            "$setOnInsert": self.rollup(game_mode, day, game.player_address)}
+            update["$inc"]["total_score"] += game.total_score
+            update["$inc"]["games_played"] += 1
+        return updates
+
+    async def record_games(self, games: Iterable) -> None:
+        from pymongo import ReturnDocument, UpdateOne
+
+        updates = self.updates(games)
+        if not updates:
+            return
+        if len(updates) == 1:
+            (rollup, update), = updates.items()
+            rollups = [await self.collection.find_one_and_update(
+                {"_id": rollup}, update, upsert=True, return_document=ReturnDocument.AFTER
+            )]
+        else:
+            await self.collection.bulk_write(
+                [UpdateOne({"_id": rollup}, update, upsert=True) for rollup, update in updates.items()], ordered=False
+            )
+            rollups = await self.collection.find({"_id": {"$in": list(updates)}}).to_list(len(updates))
+        days: Dict[tuple, List[dict]] = {}
+        for rollup in rollups:
+            days.setdefault((rollup["mode"], rollup["day"]), []).append(rollup)
+        for (game_mode, day), day_rollups in days.items():
+            await self._offer(game_mode, day, day_rollups)
+
+    async def _offer(self, game_mode: str, day: datetime, rollups: List[dict]) -> None:
+        """Merge players' updated daily totals into the top-K bucket of their day"""
+        from pymongo.errors import DuplicateKeyError
+
+        bucket_id = self.bucket_id(game_mode, day)
+        floor = self._floors.get(bucket_id)
+        entries = [{"_id": rollup["player"], "total_score": rollup["total_score"],
+                    "games_played": rollup["games_played"]}
+                   for rollup in rollups if floor is None or rollup["total_score"] >= floor]
+        if not entries:
+            return
+        for _ in range(BUCKET_WRITE_ATTEMPTS):
+            bucket = await self.buckets_collection.find_one({"_id": bucket_id})
+            version = bucket["version"] if bucket is not None else 0
+            top = {entry["_id"]: entry for entry in (bucket["top"] if bucket is not None else [])}
+            for entry in entries:
+                current = top.get(entry["_id"])
+                # Totals only grow: a concurrent writer may already have stored a later one
+                if current is None or entry["games_played"] > current["games_played"]:
+                    top[entry["_id"]] = entry
+            ranked = sorted(top.values(), key=lambda entry: (-entry["total_score"], entry["_id"]))
+            document = {**self.bucket(game_mode, day), "version": version + 1, "top": ranked[:self.bucket_size]}
+            try:
+                if bucket is None:
+                    await self.buckets_collection.insert_one({"_id": bucket_id, **document})
+                elif not (await self.buckets_collection.replace_one({"_id": bucket_id, "version": version},
+                                                                    document)).matched_count:
+                    continue
+            except DuplicateKeyError:
+                continue
+            if len(ranked) >= self.bucket_size:
+                self._floors.set(bucket_id, ranked[self.bucket_size - 1]["total_score"])
+            return
+        raise RuntimeError(f"Leaderboard bucket {bucket_id} kept changing while being updated")
+
+    async def top(self, window: str, game_mode: Optional[str] = None, limit: int = 10) -> List[dict]:
+        """Top players of a window ("day", "week" or "all"), in one game mode or all of them"""
+        limit = max(0, min(limit, self.max_size))
+        ranking = await self._cache.get_or_load((window, game_mode), lambda: self._load(window, game_mode))
+        return [dict(entry) for entry in ranking[:limit]]
+
+    async def _load(self, window: str, game_mode: Optional[str]) -> List[dict]:
+        if window == "all":
+            return await self._load_all_time(game_mode)
+        today = datetime.now()
+        start = datetime(today.year, today.month, today.day) - timedelta(days=WINDOW_DAYS[window] - 1)
+        query = {"mode": game_mode if game_mode else {"$in": list(GAME_MODES)}, "day": {"$gte": start}}
+        totals: Dict[str, List[int]] = {}
+        async for bucket in self.buckets_collection.find(query, {"top": 1}):
+            for entry in bucket["top"]:
+                total = totals.get(entry["_id"])
+                if total is None:
+                    total = totals[entry["_id"]] = [0, 0]
+                total[0] += entry["total_score"]
+                total[1] += entry["games_played"]
+        top = heapq.nsmallest(self.max_size, totals.items(), key=lambda item: (-item[1][0], item[0]))
+        return [{"_id": player, "total_score": score, "games_played": games} for player, (score, games) in top]
+
+    async def _load_all_time(self, game_mode: Optional[str]) -> List[dict]:
+        if game_mode is None:
+            raise ValueError("All-time rankings across modes come from Leaderboard")
+        field = f"modes.{game_mode}"
+        users = await self.users_collection.find(
+            {f"{field}.total_score": {"$gt": 0}}, {"_id": 0, "wallet_address": 1, field: 1}
+        ).sort([(f"{field}.total_score", -1), ("wallet_address", 1)]).limit(self.max_size).to_list(self.max_size)
+        return [{
+            "_id": user["wallet_address"],
+            "total_score": user["modes"][game_mode]["total_score"],
+            "games_played": user["modes"][game_mode].get("games_played", 0),
+        } for user in users]
+
+    async def rebuild(self, games_collection, archive_collection=None) -> int:
+        """Recompute the rollups and buckets still within retention from the games, returning how many rollups"""
+        from pymongo import ReplaceOne
+
+        today = datetime.now()
+        start = datetime(today.year, today.month, today.day) - timedelta(days=self.retention_days)
+        rollups: Dict[str, dict] = {}
+        projection = {"_id": 0, "player_address": 1, "game_mode": 1, "total_score": 1, "timestamp": 1}
+        query = {"timestamp": {"$gte": start}, "player_address": {"$ne": None}}
+        sources = [games_collection] if archive_collection is None else [games_collection, archive_collection]
+        for collection in sources:
+            async for game in collection.find(query, projection):
+                game_mode = "fhe" if game.get("game_mode") == "fhe" else "standard"
+                timestamp = game["timestamp"]
+                day = datetime(timestamp.year, timestamp.month, timestamp.day)
+                rollup = self.rollup_id(game_mode, day, game["player_address"])
+                document = rollups.get(rollup)
+                if document is None:
+                    document = rollups[rollup] = {**self.rollup(game_mode, day, game["player_address"]),
+                                                  "total_score": 0, "games_played": 0}
+                document["total_score"] += game["total_score"]
+                document["games_played"] += 1
+        buckets: Dict[str, dict] = {}
+        for document in rollups.values():
+            bucket_id = self.bucket_id(document["mode"], document["day"])
+            bucket = buckets.get(bucket_id)
+            if bucket is None:
+                bucket = buckets[bucket_id] = {**self.bucket(document["mode"], document["day"]),
+                                               "version": 1, "top": []}
+            bucket["top"].append({"_id": document["player"], "total_score": document["total_score"],
+                                  "games_played": document["games_played"]})
+        for bucket in buckets.values():
+            bucket["top"] = heapq.nsmallest(self.bucket_size, bucket["top"],
+                                            key=lambda entry: (-entry["total_score"], entry["_id"]))
+        for collection, documents in ((self.collection, rollups), (self.buckets_collection, buckets)):
+            await collection.delete_many({"day": {"$gte": start}})
+            if documents:
+                await collection.bulk_write(
+                    [ReplaceOne({"_id": _id}, document, upsert=True) for _id, document in documents.items()],
+                    ordered=False
+                )
+        self._floors.clear()
+        self._cache.clear()
+        return len(rollups)
+
+
+async def _main(argv: List[str]) -> None:
+    from server import games_archive_collection, games_collection, windowed_leaderboard
+
+    # All-time totals are rebuilt with `python player_stats.py backfill`
+    if argv[1:] != ["rebuild-windows"]:
+        print("Usage: python leaderboard.py rebuild-windows")
+        sys.exit(2)
+    rollups = await windowed_leaderboard.rebuild(games_collection, games_archive_collection)
+    print(f"Windowed leaderboards rebuilt: {rollups} daily rollups")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv))
@@ -0,0 +1,134 @@
+"""Structured, non-blocking logging
+
+Records are handed to a queue on the event loop and formatted and written
+as JSON lines by a background listener thread, so handlers never block on
+stdout. `log_event` checks the level first and then the per-event sample
+rate, so a disabled or sampled-out event costs a couple of comparisons.
+Every record carries the request id of the request that emitted it.
+
+Configuration:
+    LOG_LEVEL=INFO                              minimum level
+    LOG_SAMPLE_RATES=game_played=0.01,...       fraction of events kept, per event
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+LOGGER_NAME = "zama_dice"
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+logger = logging.getLogger(LOGGER_NAME)
+_sample_rates: Dict[str, float] = {}
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "event": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = request_id_var.get()
+        return record
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        event, _, rate = item.partition("=")
+        rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+def setup_logging(stream=None) -> None:
+    """Route the app logger through a queue to a background writer thread"""
+    global _listener, _sample_rates
+    if _listener is not None:
+        return
+    _sample_rates = parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES', ''))
+    logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    logger.propagate = False
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JSONFormatter())
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    logger.addHandler(_DeferredQueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_event(event: str, level: int = logging.INFO, **fields) -> None:
+    """Log a structured event, subject to level gating and per-event sampling"""
+    if not logger.isEnabledFor(level):
+        return
+    rate = _sample_rates.get(event, 1.0)
+    if rate < 1.0 and random.random() >= rate:
+        return
+    logger.log(level, event, extra={"fields": fields})
+
+
+class RequestIdMiddleware:
+    """Tag each request with an id (X-Request-ID if the client sent one) for its log records"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            log_event("request", logging.DEBUG, method=scope["method"], path=scope["path"],
+                      duration_ms=round((time.perf_counter() - start) * 1000, 3))
+            request_id_var.reset(token)
@@ -0,0 +1,1018 @@
+"""In-memory storage engine speaking the subset of the Motor API the app uses
+
+`MemoryDatabase` stands in for a Motor database (STORAGE_BACKEND=memory), so
+the handlers, leaderboard, counters and CLIs run unchanged against it. It
+is meant for hermetic tests and benchmarks and for small single-process
+deployments: data lives in one process, so every worker would have its own.
+
+Documents are kept in a dict per collection. Indexes declared with
+`create_indexes` are maintained on every write:
+
+- a hash index on the first key of every index, used for equality and $in
+  lookups (`id`, `wallet_address`, ...) and to enforce unique indexes;
+- a sorted index in the directions the index declares (`timestamp, id`,
+  `total_score desc, wallet_address`), used to serve sorted, limited and
+  keyset-paginated queries in those directions, or all of them reversed,
+  without sorting the collection;
+- TTL indexes, whose expired documents are purged once a minute.
+
+Only the query shapes the app issues are implemented, each covered by
+tests/test_memory_store.py, and other operators raise ValueError. Queries
+support equality on scalar values (including dotted paths),
+$ne/$gt/$gte/$lt/$lte/$in and $and/$or; updates support
+$set/$inc/$max/$setOnInsert with upserts; aggregations support
+$match/$group ($sum, $max and $cond/$eq expressions)/$sort/$limit,
+$unionWith of a whole collection, and $indexStats.
+
+With a path (MEMORY_STORAGE_PATH) every write is also appended to a log of
+BSON records, replayed and compacted when the database is opened. Records
+are flushed to the OS after each write and fsynced only when
+MEMORY_STORAGE_FSYNC=1.
+"""
+import bisect
+import itertools
+import os
+import struct
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+MISSING = object()
+TTL_MONITOR_SECONDS = 60.0
+
+
+# Document helpers
+
+def get_path(document, path: str):
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return MISSING
+        value = value.get(part, MISSING)
+        if value is MISSING:
+            return MISSING
+    return value
+
+
+def set_path(document: dict, path: str, value) -> None:
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[last] = value
+
+
+def copy_value(value):
+    """Deep copy of the dicts and lists in a document, sharing immutable leaves"""
+    if isinstance(value, dict):
+        return {key: copy_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [copy_value(item) for item in value]
+    return value
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def naive_utc(value: datetime) -> datetime:
+    # Dates are stored as naive UTC, the way pymongo decodes them
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo is not None else value
+
+
+def sort_key(value) -> tuple:
+    """Key ordering values across types the way MongoDB does"""
+    if value is None or value is MISSING:
+        return (1,)
+    if isinstance(value, bool):
+        return (8, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    if isinstance(value, datetime):
+        return (9, naive_utc(value))
+    # ObjectId and other BSON types order by their string form
+    return (7, str(value))
+
+
+def hashable(value):
+    if isinstance(value, dict):
+        return tuple((key, hashable(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(hashable(item) for item in value)
+    if isinstance(value, bool):
+        # Keep True apart from 1
+        return ("bool", value)
+    return value
+
+
+# Queries
+
+def _equals(value, target) -> bool:
+    if value is MISSING:
+        return target is None
+    if isinstance(value, bool) != isinstance(target, bool):
+        return False
+    return value == target
+
+
+def _compare(value, target, accept) -> bool:
+    if value is MISSING:
+        return False
+    value_key, target_key = sort_key(value), sort_key(target)
+    # Comparisons only match values of the same type bracket
+    return value_key[0] == target_key[0] and accept(value_key, target_key)
+
+
+QUERY_OPERATORS = {
+    "$ne": lambda value, target: not _equals(value, target),
+    "$gt": lambda value, target: _compare(value, target, lambda a, b: a > b),
+    "$gte": lambda value, target: _compare(value, target, lambda a, b: a >= b),
+    "$lt": lambda value, target: _compare(value, target, lambda a, b: a < b),
+    "$lte": lambda value, target: _compare(value, target, lambda a, b: a <= b),
+    "$in": lambda value, targets: any(_equals(value, target) for target in targets),
+}
+
+
+def _is_operator_dict(condition) -> bool:
+    return isinstance(condition, dict) and bool(condition) and next(iter(condition)).startswith("$")
+
+
+def matches(document: dict, query: Optional[dict]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(document, branch) for branch in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, branch) for branch in condition):
+                return False
+        elif _is_operator_dict(condition):
+            value = get_path(document, key)
+            for operator, argument in condition.items():
+                test = QUERY_OPERATORS.get(operator)
+                if test is None:
+                    raise ValueError(f"Unsupported query operator {operator}")
+                if not test(value, argument):
+                    return False
+        elif not _equals(get_path(document, key), condition):
+            return False
+    return True
+
+
+def _equality_value(condition):
+    """The value a field condition pins the field to, or MISSING"""
+    return MISSING if _is_operator_dict(condition) else condition
+
+
+def _candidate_values(condition) -> Optional[list]:
+    """The values a field condition limits the field to, for index lookups, or None"""
+    if _is_operator_dict(condition):
+        return list(condition["$in"]) if "$in" in condition else None
+    return None if isinstance(condition, (dict, list)) else [condition]
+
+
+def _field_bounds(query: dict, field: str) -> Tuple[Optional[tuple], Optional[tuple]]:
+    """Inclusive (low, high) sort keys that every match of `query` has on `field`, None if unbounded"""
+    low = high = None
+
+    def narrow(bounds):
+        nonlocal low, high
+        if bounds[0] is not None and (low is None or bounds[0] > low):
+            low = bounds[0]
+        if bounds[1] is not None and (high is None or bounds[1] < high):
+            high = bounds[1]
+
+    condition = query.get(field, MISSING)
+    if condition is not MISSING:
+        if _is_operator_dict(condition):
+            for operator, argument in condition.items():
+                if operator in ("$gt", "$gte"):
+                    narrow((sort_key(argument), None))
+                elif operator in ("$lt", "$lte"):
+                    narrow((None, sort_key(argument)))
+        elif not isinstance(condition, list):
+            narrow((sort_key(condition), sort_key(condition)))
+    for branch in query.get("$and", ()):
+        narrow(_field_bounds(branch, field))
+    branches = [_field_bounds(branch, field) for branch in query.get("$or", ())]
+    if branches:
+        lows = [bounds[0] for bounds in branches]
+        highs = [bounds[1] for bounds in branches]
+        narrow((None if None in lows else min(lows), None if None in highs else max(highs)))
+    return low, high
+
+
+def project(document: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy_value(document)
+    included = [field for field, value in projection.items() if value and field != "_id"]
+    if included:
+        result = {}
+        if projection.get("_id", 1) and "_id" in document:
+            result["_id"] = copy_value(document["_id"])
+        top_level = {field.split(".")[0] for field in included}
+        for key, value in document.items():
+            if key in top_level and key != "_id":
+                if key in projection:
+                    result[key] = copy_value(value)
+                else:
+                    for field in included:
+                        if field.split(".")[0] == key:
+                            nested = get_path(document, field)
+                            if nested is not MISSING:
+                                set_path(result, field, copy_value(nested))
+        return result
+    return {key: copy_value(value) for key, value in document.items() if projection.get(key, 1)}
+
+
+def normalize_sort(key_or_list, direction=None) -> List[Tuple[str, int]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction if direction is not None else 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [(key, direction) for key, direction in key_or_list]
+
+
+def sort_documents(documents: List[dict], spec: List[Tuple[str, int]]) -> None:
+    # Stable sorts from the last key to the first give a multi-key sort
+    for field, direction in reversed(spec):
+        documents.sort(key=lambda document: sort_key(get_path(document, field)), reverse=direction < 0)
+
+
+# Updates
+
+def apply_update(document: dict, update: dict, inserting: bool) -> None:
+    for operator, fields in update.items():
+        if operator == "$setOnInsert":
+            if inserting:
+                for path, value in fields.items():
+                    set_path(document, path, copy_value(value))
+        elif operator == "$set":
+            for path, value in fields.items():
+                set_path(document, path, copy_value(value))
+        elif operator == "$inc":
+            for path, amount in fields.items():
+                current = get_path(document, path)
+                set_path(document, path, amount if current is MISSING else current + amount)
+        elif operator == "$max":
+            for path, value in fields.items():
+                current = get_path(document, path)
+                if current is MISSING or sort_key(value) > sort_key(current):
+                    set_path(document, path, copy_value(value))
+        elif operator.startswith("$"):
+            raise ValueError(f"Unsupported update operator {operator}")
+        else:
+            raise ValueError("Replacement documents are not supported by update_one")
+
+
+def _upsert_seed(query: dict) -> dict:
+    document: dict = {}
+    for key, condition in query.items():
+        if key == "$and":
+            for branch in condition:
+                document.update(_upsert_seed(branch))
+        elif not key.startswith("$"):
+            value = _equality_value(condition)
+            if value is not MISSING:
+                set_path(document, key, copy_value(value))
+    return document
+
+
+def _object_id():
+    from bson import ObjectId
+
+    return ObjectId()
+
+
+# Aggregation expressions
+
+def evaluate(expression, document):
+    if isinstance(expression, str):
+        if expression.startswith("$"):
+            value = get_path(document, expression[1:])
+            return None if value is MISSING else value
+        return expression
+    if isinstance(expression, list):
+        return [evaluate(item, document) for item in expression]
+    if isinstance(expression, dict):
+        if _is_operator_dict(expression) and len(expression) == 1:
+            (operator, argument), = expression.items()
+            handler = EXPRESSION_OPERATORS.get(operator)
+            if handler is None:
+                raise ValueError(f"Unsupported expression operator {operator}")
+            return handler(argument, document)
+        return {key: evaluate(value, document) for key, value in expression.items()}
+    return expression
+
+
+def _cond(argument, document):
+    condition, then, otherwise = argument
+    return evaluate(then if _truthy(evaluate(condition, document)) else otherwise, document)
+
+
+def _truthy(value) -> bool:
+    return value not in (None, False, 0) and value is not MISSING
+
+
+def _binary(compare):
+    def handler(argument, document):
+        left, right = (evaluate(item, document) for item in argument)
+        return compare(sort_key(left), sort_key(right))
+    return handler
+
+
+EXPRESSION_OPERATORS = {
+    "$cond": _cond,
+    "$eq": _binary(lambda a, b: a == b),
+}
+
+
+def _accumulate(operator: str, values: List):
+    if operator == "$sum":
+        return sum(value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool))
+    if operator == "$max":
+        present = [value for value in values if value is not None]
+        return max(present, key=sort_key) if present else None
+    raise ValueError(f"Unsupported accumulator {operator}")
+
+
+def _group(documents: Iterable[dict], spec: dict) -> List[dict]:
+    groups: Dict[Any, Tuple[Any, Dict[str, List]]] = {}
+    accumulators = {field: next(iter(expression.items())) for field, expression in spec.items() if field != "_id"}
+    for document in documents:
+        key = evaluate(spec["_id"], document)
+        group = groups.get(hashable(key))
+        if group is None:
+            group = groups[hashable(key)] = (key, {field: [] for field in accumulators})
+        for field, (_, expression) in accumulators.items():
+            group[1][field].append(evaluate(expression, document))
+    return [
+        {"_id": key, **{field: _accumulate(accumulators[field][0], values[field]) for field in accumulators}}
+        for key, values in groups.values()
+    ]
+
+
+# Indexes
+
+class HashIndex:
+    """Equality index on a tuple of fields, optionally unique"""
+
+    def __init__(self, name: str, fields: Tuple[str, ...], unique: bool = False):
+        self.name = name
+        self.fields = fields
+        self.unique = unique
+        self.entries: Dict[Any, set] = {}
+        self.accesses = 0
+
+    def key(self, document: dict):
+        values = tuple(get_path(document, field) for field in self.fields)
+        return hashable(tuple(None if value is MISSING else value for value in values))
+
+    def add(self, document: dict, seq: int) -> None:
+        self.entries.setdefault(self.key(document), set()).add(seq)
+
+    def remove(self, document: dict, seq: int) -> None:
+        key = self.key(document)
+        seqs = self.entries.get(key)
+        if seqs is not None:
+            seqs.discard(seq)
+            if not seqs:
+                del self.entries[key]
+
+    def conflict(self, document: dict, seq: Optional[int] = None) -> bool:
+        return any(other != seq for other in self.entries.get(self.key(document), ()))
+
+    def lookup(self, values: tuple) -> set:
+        self.accesses += 1
+        return self.entries.get(hashable(values), set())
+
+
+class Descending:
+    """Sort key of a descending index field, ordering before the keys below it"""
+    __slots__ = ("key",)
+
+    def __init__(self, key: tuple):
+        self.key = key
+
+    def __eq__(self, other) -> bool:
+        return self.key == other.key
+
+    def __lt__(self, other) -> bool:
+        return other.key < self.key
+
+
+class SortedIndex:
+    """Index keeping (key tuple, seq) entries in the order of its fields' directions, for ordered range scans"""
+
+    def __init__(self, name: str, keys: List[Tuple[str, int]]):
+        self.name = name
+        self.fields = tuple(field for field, _ in keys)
+        self.directions = tuple(direction for _, direction in keys)
+        self.entries: List[Tuple[tuple, int]] = []
+        # First key of each entry, to bound range scans on the leading field
+        self.leading: List = []
+        self.accesses = 0
+
+    def key(self, document: dict) -> tuple:
+        return tuple(
+            sort_key(get_path(document, field)) if direction > 0 else Descending(sort_key(get_path(document, field)))
+            for field, direction in zip(self.fields, self.directions)
+        )
+
+    def add(self, document: dict, seq: int) -> None:
+        entry = (self.key(document), seq)
+        position = bisect.bisect_left(self.entries, entry)
+        self.entries.insert(position, entry)
+        self.leading.insert(position, entry[0][0])
+
+    def remove(self, document: dict, seq: int) -> None:
+        entry = (self.key(document), seq)
+        position = bisect.bisect_left(self.entries, entry)
+        if position < len(self.entries) and self.entries[position] == entry:
+            del self.entries[position]
+            del self.leading[position]
+
+    def serves(self, sort: List[Tuple[str, int]]) -> Optional[bool]:
+        """Whether `sort` is read backwards from this index, or None if the index cannot serve it"""
+        if tuple(field for field, _ in sort) != self.fields:
+            return None
+        directions = tuple(direction for _, direction in sort)
+        if directions == self.directions:
+            return False
+        if directions == tuple(-direction for direction in self.directions):
+            return True
+        return None
+
+    def scan(self, low: Optional[tuple], high: Optional[tuple], backwards: bool) -> Iterator[int]:
+        """Seqs whose leading field lies within the inclusive sort key bounds `low` and `high`"""
+        self.accesses += 1
+        if self.directions[0] < 0:
+            low, high = (None if high is None else Descending(high)), (None if low is None else Descending(low))
+        entries = self.entries
+        start = 0 if low is None else bisect.bisect_left(self.leading, low)
+        stop = len(entries) if high is None else bisect.bisect_right(self.leading, high)
+        positions = range(stop - 1, start - 1, -1) if backwards else range(start, stop)
+        # Read by position: callers consume the scan without yielding to other writers
+        return (entries[position][1] for position in positions)
+
+
+# Results
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+        self.acknowledged = True
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids: List):
+        self.inserted_ids = inserted_ids
+        self.acknowledged = True
+
+
+class UpdateResult:
+    def __init__(self, matched_count: int, modified_count: int, upserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+        self.acknowledged = True
+
+
+class DeleteResult:
+    def __init__(self, deleted_count: int):
+        self.deleted_count = deleted_count
+        self.acknowledged = True
+
+
+class BulkWriteResult:
+    def __init__(self):
+        self.inserted_count = 0
+        self.matched_count = 0
+        self.modified_count = 0
+        self.deleted_count = 0
+        self.upserted_count = 0
+        self.upserted_ids: Dict[int, Any] = {}
+        self.acknowledged = True
+
+    @property
+    def bulk_api_result(self) -> dict:
+        return {
+            "nInserted": self.inserted_count, "nMatched": self.matched_count, "nModified": self.modified_count,
+            "nRemoved": self.deleted_count, "nUpserted": self.upserted_count,
+            "upserted": [{"index": index, "_id": _id} for index, _id in self.upserted_ids.items()],
+        }
+
+
+# Cursors
+
+class MemoryCursor:
+    def __init__(self, collection: "MemoryCollection", query: Optional[dict], projection: Optional[dict]):
+        self._collection = collection
+        self._query = query or {}
+        self._projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=None) -> "MemoryCursor":
+        self._sort = normalize_sort(key_or_list, direction)
+        return self
+
+    def limit(self, limit: int) -> "MemoryCursor":
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size: int) -> "MemoryCursor":
+        return self
+
+    def _documents(self, length: Optional[int] = None) -> List[dict]:
+        limit = self._limit
+        if length is not None and (not limit or length < limit):
+            limit = length
+        documents = self._collection._select(self._query, self._sort, limit)
+        return [project(document, self._projection) for document in documents]
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        return self._documents(length)
+
+    async def __aiter__(self):
+        for document in self._documents():
+            yield document
+
+    async def explain(self) -> dict:
+        return {"queryPlanner": {"winningPlan": self._collection._plan(self._query, self._sort)[2]}}
+
+
+class MemoryAggregateCursor:
+    def __init__(self, collection: "MemoryCollection", pipeline: List[dict]):
+        self._collection = collection
+        self._pipeline = pipeline
+
+    def batch_size(self, batch_size: int) -> "MemoryAggregateCursor":
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        documents = self._collection._aggregate(self._pipeline)
+        return documents if length is None else documents[:length]
+
+    async def __aiter__(self):
+        for document in self._collection._aggregate(self._pipeline):
+            yield document
+
+
+# Collections
+
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self._documents: Dict[int, dict] = {}
+        self._seq = itertools.count()
+        self._by_id = HashIndex("_id_", ("_id",), unique=True)
+        self._hash_indexes: List[HashIndex] = [self._by_id]
+        self._sorted_indexes: List[SortedIndex] = []
+        self._index_names = {"_id_"}
+        self._ttl: List[Tuple[str, float]] = []
+        self._next_purge = 0.0
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.database.name}.{self.name}"
+
+    # Storage primitives, the only code touching documents and indexes
+
+    def _check_unique(self, document: dict, seq: Optional[int] = None) -> None:
+        for index in self._hash_indexes:
+            if index.unique and index.conflict(document, seq):
+                from pymongo.errors import DuplicateKeyError
+
+                key = {field: get_path(document, field) for field in index.fields}
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.full_name} index: {index.name} dup key: {key}",
+                    11000, {"index": index.name, "keyValue": key, "code": 11000},
+                )
+
+    def _indexes(self):
+        return itertools.chain(self._hash_indexes, self._sorted_indexes)
+
+    def _insert(self, document: dict, log: bool = True) -> None:
+        self._check_unique(document)
+        seq = next(self._seq)
+        self._documents[seq] = document
+        for index in self._indexes():
+            index.add(document, seq)
+        if log:
+            self.database._log(self.name, "put", document)
+
+    def _replace(self, seq: int, document: dict) -> None:
+        self._check_unique(document, seq)
+        old = self._documents[seq]
+        for index in self._indexes():
+            index.remove(old, seq)
+            index.add(document, seq)
+        self._documents[seq] = document
+        self.database._log(self.name, "put", document)
+
+    def _delete(self, seq: int, log: bool = True) -> None:
+        document = self._documents.pop(seq)
+        for index in self._indexes():
+            index.remove(document, seq)
+        if log:
+            self.database._log(self.name, "delete", {"_id": document["_id"]})
+
+    def _purge_expired(self) -> None:
+        if not self._ttl or time.monotonic() < self._next_purge:
+            return
+        self._next_purge = time.monotonic() + TTL_MONITOR_SECONDS
+        now = utc_now()
+        for field, seconds in self._ttl:
+            expired = [
+                seq for seq, document in self._documents.items()
+                if isinstance(get_path(document, field), datetime)
+                and naive_utc(get_path(document, field)) + timedelta(seconds=seconds) <= now
+            ]
+            for seq in expired:
+                self._delete(seq)
+
+    # Query planning and execution
+
+    def _plan(self, query: dict, sort: List[Tuple[str, int]]) -> Tuple[Iterable[int], bool, dict]:
+        """Candidate seqs, whether they come in `sort` order, and an explain-style plan"""
+        candidates = {}
+        for field, condition in query.items():
+            if not field.startswith("$"):
+                values = _candidate_values(condition)
+                if values is not None:
+                    candidates[field] = values
+        best = None
+        for index in self._hash_indexes:
+            if all(field in candidates for field in index.fields):
+                if best is None or index.unique:
+                    best = index
+        if best is not None:
+            # One lookup per combination of the values: equality is one, $in one per value
+            seqs = set()
+            for values in itertools.product(*(candidates[field] for field in best.fields)):
+                seqs.update(best.lookup(values))
+            return sorted(seqs), False, {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": best.name}}
+
+        if sort:
+            for index in self._sorted_indexes:
+                backwards = index.serves(sort)
+                if backwards is not None:
+                    low, high = _field_bounds(query, index.fields[0])
+                    seqs = index.scan(low, high, backwards)
+                    return seqs, True, {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": index.name}}
+
+        return list(self._documents), False, {"stage": "COLLSCAN"}
+
+    def _select(self, query: dict, sort: List[Tuple[str, int]], limit: int = 0) -> List[dict]:
+        self._purge_expired()
+        seqs, ordered, _ = self._plan(query, sort)
+        documents = self._documents
+        if ordered:
+            results = []
+            for seq in seqs:
+                document = documents.get(seq)
+                if document is not None and matches(document, query):
+                    results.append(document)
+                    if limit and len(results) >= limit:
+                        break
+            return results
+        results = [documents[seq] for seq in seqs if seq in documents and matches(documents[seq], query)]
+        if sort:
+            sort_documents(results, sort)
+        return results[:limit] if limit else results
+
+    def _select_seqs(self, query: dict, limit: int = 0) -> List[int]:
+        self._purge_expired()
+        seqs, _, _ = self._plan(query, [])
+        selected = []
+        for seq in list(seqs):
+            document = self._documents.get(seq)
+            if document is not None and matches(document, query):
+                selected.append(seq)
+                if limit and len(selected) >= limit:
+                    break
+        return selected
+
+    def _aggregate(self, pipeline: List[dict]) -> List[dict]:
+        documents: Optional[List[dict]] = None
+        for stage in pipeline:
+            (operator, spec), = stage.items()
+            if operator == "$indexStats":
+                documents = [{"name": index.name, "key": dict.fromkeys(index.fields, 1),
+                              "accesses": {"ops": index.accesses, "since": self.database.started_at}}
+                             for index in self._indexes()]
+                continue
+            if documents is None:
+                if operator == "$match":
+                    documents = [copy_value(document) for document in self._select(spec, [])]
+                    continue
+                self._purge_expired()
+                documents = [copy_value(document) for document in self._documents.values()]
+            if operator == "$match":
+                documents = [document for document in documents if matches(document, spec)]
+            elif operator == "$group":
+                documents = _group(documents, spec)
+            elif operator == "$sort":
+                sort_documents(documents, normalize_sort(spec))
+            elif operator == "$limit":
+                documents = documents[:spec]
+            elif operator == "$unionWith":
+                if not isinstance(spec, str):
+                    raise ValueError("Only $unionWith of a whole collection is supported")
+                documents = documents + self.database[spec]._aggregate([])
+            else:
+                raise ValueError(f"Unsupported aggregation stage {operator}")
+        if documents is None:
+            documents = [copy_value(document) for document in self._documents.values()]
+        return documents
+
+    # Motor API
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None) -> MemoryCursor:
+        return MemoryCursor(self, filter, projection)
+
+    async def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None) -> Optional[dict]:
+        documents = await self.find(filter, projection).limit(1).to_list(1)
+        return documents[0] if documents else None
+
+    async def count_documents(self, filter: dict, **kwargs) -> int:
+        if not filter:
+            self._purge_expired()
+            return len(self._documents)
+        return len(self._select_seqs(filter))
+
+    def _insert_document(self, document: dict):
+        if "_id" not in document:
+            # Like pymongo, the generated _id is added to the caller's document
+            document["_id"] = _object_id()
+        self._insert(copy_value(document))
+        return document["_id"]
+
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        self._purge_expired()
+        return InsertOneResult(self._insert_document(document))
+
+    async def insert_many(self, documents: Iterable[dict], ordered: bool = True, **kwargs) -> InsertManyResult:
+        from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+        self._purge_expired()
+        inserted_ids, errors = [], []
+        for index, document in enumerate(documents):
+            try:
+                inserted_ids.append(self._insert_document(document))
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e), "op": document})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted_ids), "nUpserted": 0,
+                                  "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []})
+        return InsertManyResult(inserted_ids)
+
+    def _update(self, filter: dict, update: dict, upsert: bool) -> Tuple[UpdateResult, List[int]]:
+        self._purge_expired()
+        seqs = self._select_seqs(filter, limit=1)
+        if not seqs:
+            if not upsert:
+                return UpdateResult(0, 0), []
+            document = _upsert_seed(filter)
+            apply_update(document, update, inserting=True)
+            document.setdefault("_id", _object_id())
+            self._insert(document)
+            return UpdateResult(0, 0, document["_id"]), [self._by_id_seq(document["_id"])]
+        modified = 0
+        for seq in seqs:
+            current = self._documents[seq]
+            document = copy_value(current)
+            apply_update(document, update, inserting=False)
+            if document != current:
+                self._replace(seq, document)
+                modified += 1
+        return UpdateResult(len(seqs), modified), seqs
+
+    def _by_id_seq(self, _id) -> int:
+        return next(iter(self._by_id.entries[hashable((_id,))]))
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return self._update(filter, update, upsert)[0]
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        self._purge_expired()
+        seqs = self._select_seqs(filter, limit=1)
+        if not seqs:
+            if not upsert:
+                return UpdateResult(0, 0)
+            document = copy_value(replacement)
+            document.setdefault("_id", _upsert_seed(filter).get("_id") or _object_id())
+            self._insert(document)
+            return UpdateResult(0, 0, document["_id"])
+        document = copy_value(replacement)
+        document["_id"] = self._documents[seqs[0]]["_id"]
+        self._replace(seqs[0], document)
+        return UpdateResult(1, 1)
+
+    async def find_one_and_update(self, filter: dict, update: dict, projection: Optional[dict] = None,
+                                  upsert: bool = False, return_document: bool = False,
+                                  **kwargs) -> Optional[dict]:
+        if not return_document:
+            raise ValueError("Only return_document=ReturnDocument.AFTER is supported")
+        _, updated = self._update(filter, update, upsert)
+        return project(self._documents[updated[0]], projection) if updated else None
+
+    async def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
+        seqs = self._select_seqs(filter, limit=1)
+        for seq in seqs:
+            self._delete(seq)
+        return DeleteResult(len(seqs))
+
+    async def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        seqs = self._select_seqs(filter)
+        for seq in seqs:
+            self._delete(seq)
+        return DeleteResult(len(seqs))
+
+    async def bulk_write(self, requests: List, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        from pymongo import ReplaceOne, UpdateOne
+        from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+        result = BulkWriteResult()
+        errors = []
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, ReplaceOne):
+                    outcome = await self.replace_one(request._filter, request._doc, request._upsert)
+                elif isinstance(request, UpdateOne):
+                    outcome, _ = self._update(request._filter, request._doc, request._upsert)
+                else:
+                    raise TypeError(f"Unsupported bulk write request {request!r}")
+                result.matched_count += outcome.matched_count
+                result.modified_count += outcome.modified_count
+                if outcome.upserted_id is not None:
+                    result.upserted_count += 1
+                    result.upserted_ids[index] = outcome.upserted_id
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, **result.bulk_api_result})
+        return result
+
+    def aggregate(self, pipeline: List[dict], **kwargs) -> MemoryAggregateCursor:
+        return MemoryAggregateCursor(self, pipeline)
+
+    def add_index(self, spec: dict) -> str:
+        """Declare an index from its pymongo IndexModel document"""
+        keys = list(spec["key"].items())
+        fields = tuple(field for field, _ in keys)
+        name = spec.get("name") or "_".join(f"{field}_{direction}" for field, direction in keys)
+        if name in self._index_names:
+            return name
+        self._index_names.add(name)
+        new_indexes = []
+        if spec.get("unique"):
+            new_indexes.append(HashIndex(name, fields, unique=True))
+        if not any(index.fields == fields[:1] for index in self._hash_indexes + new_indexes):
+            new_indexes.append(HashIndex(name if not spec.get("unique") else f"{name}_prefix", fields[:1]))
+        for index in new_indexes:
+            for seq, document in self._documents.items():
+                if index.unique and index.conflict(document, seq):
+                    self._index_names.discard(name)
+                    from pymongo.errors import DuplicateKeyError
+
+                    raise DuplicateKeyError(f"E11000 duplicate key error building index {name}", 11000)
+                index.add(document, seq)
+            self._hash_indexes.append(index)
+        if all(isinstance(direction, int) for _, direction in keys):
+            index = SortedIndex(name, keys)
+            for seq, document in self._documents.items():
+                index.add(document, seq)
+            self._sorted_indexes.append(index)
+        if spec.get("expireAfterSeconds") is not None:
+            self._ttl.append((fields[0], float(spec["expireAfterSeconds"])))
+        return name
+
+    async def create_indexes(self, indexes: List, **kwargs) -> List[str]:
+        return [self.add_index(index.document) for index in indexes]
+
+
+# Persistence
+
+class AppendOnlyLog:
+    """BSON records appended to a file, replayed to rebuild the database"""
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._file = None
+
+    def replay(self) -> Iterator[dict]:
+        import bson
+
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            data = f.read()
+        position = 0
+        while position + 4 <= len(data):
+            size, = struct.unpack_from("<i", data, position)
+            if size < 5 or position + size > len(data):
+                break
+            try:
+                record = bson.decode(data[position:position + size])
+            except Exception:
+                break
+            position += size
+            yield record
+        # A record cut short by a crash is dropped
+        if position < len(data):
+            with open(self.path, "r+b") as f:
+                f.truncate(position)
+
+    def append(self, record: dict) -> None:
+        import bson
+
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        self._file.write(bson.encode(record))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def rewrite(self, records: Iterable[dict]) -> None:
+        """Replace the log by `records`, atomically"""
+        import bson
+
+        self.close()
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as f:
+            for record in records:
+                f.write(bson.encode(record))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class MemoryDatabase:
+    def __init__(self, name: str, path: Optional[str] = None, fsync: bool = False):
+        self.name = name
+        self.started_at = utc_now()
+        self._collections: Dict[str, MemoryCollection] = {}
+        self._journal: Optional[AppendOnlyLog] = None
+        if path:
+            journal = AppendOnlyLog(path, fsync)
+            self._load(journal)
+            self._journal = journal
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = MemoryCollection(self, name)
+        return collection
+
+    def _log(self, collection: str, operation: str, document: dict) -> None:
+        if self._journal is not None:
+            self._journal.append({"c": collection, "o": operation, "d": document})
+
+    def _load(self, journal: AppendOnlyLog) -> None:
+        count = 0
+        for record in journal.replay():
+            collection = self[record["c"]]
+            document = record["d"]
+            existing = collection._by_id.entries.get(hashable((document["_id"],))) if "_id" in document else None
+            if existing:
+                seq = next(iter(existing))
+                if record["o"] == "delete":
+                    collection._delete(seq, log=False)
+                else:
+                    old = collection._documents[seq]
+                    for index in collection._indexes():
+                        index.remove(old, seq)
+                        index.add(document, seq)
+                    collection._documents[seq] = document
+            elif record["o"] == "put":
+                collection._insert(document, log=False)
+            count += 1
+        if count:
+            # Compact: one record per live document
+            journal.rewrite(
+                {"c": name, "o": "put", "d": document}
+                for name, collection in self._collections.items()
+                for document in collection._documents.values()
+            )
+
+    async def command(self, command, **kwargs) -> dict:
+        if command != "ping" and command != {"ping": 1}:
+            raise ValueError(f"Unsupported command {command}")
+        return {"ok": 1.0}
+
+    def close(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
@@ -0,0 +1,261 @@
+"""Lightweight request and database instrumentation
+
+Per-route latency histograms, request counters and in-flight gauges are
+recorded by `MetricsMiddleware`, and every Motor call made through an
+`instrument_collection` proxy is timed per collection and operation. All of
+it is rendered in the Prometheus text format by `MetricsRegistry.render`.
+Recording is a few dict lookups and a bisect per observation, cheap enough
+to leave on in production.
+"""
+import bisect
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from logging_config import log_event
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            # One count per bucket plus +Inf, then the sum
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.request_latency = Histogram()
+        self.requests_total: Dict[Tuple[str, str, str], int] = {}
+        self.requests_in_flight: Dict[Tuple[str], int] = {}
+        self.db_latency = Histogram()
+        self.db_errors: Dict[Tuple[str, str], int] = {}
+        # Extra gauges provided by other components, e.g. cache hit counters
+        self.collectors: Dict[str, Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]] = {}
+
+    def render(self) -> str:
+        lines = []
+        self._render_histogram(lines, "http_request_duration_seconds", "HTTP request latency",
+                               ("method", "route"), self.request_latency)
+        self._render_counter(lines, "http_requests_total", "HTTP requests", ("method", "route", "status"),
+                             self.requests_total, "counter")
+        self._render_counter(lines, "http_requests_in_flight", "HTTP requests being served",
+                             ("method",), self.requests_in_flight, "gauge")
+        self._render_histogram(lines, "mongo_operation_duration_seconds", "MongoDB call latency",
+                               ("collection", "operation"), self.db_latency)
+        self._render_counter(lines, "mongo_operation_errors_total", "Failed MongoDB calls",
+                             ("collection", "operation"), self.db_errors, "counter")
+        for name, collect in self.collectors.items():
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in collect().items():
+                lines.append(f"{name}{_labels(dict(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histogram(lines, name, help_text, label_names, histogram: Histogram) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, series in sorted(histogram.series.items()):
+            base = dict(zip(label_names, labels))
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_labels({**base, 'le': le})} {cumulative}")
+            lines.append(f"{name}_sum{_labels(base)} {series[-1]}")
+            lines.append(f"{name}_count{_labels(base)} {cumulative}")
+
+    @staticmethod
+    def _render_counter(lines, name, help_text, label_names, values, metric_type) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in sorted(values.items()):
+            lines.append(f"{name}{_labels(dict(zip(label_names, labels)))} {value}")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and in-flight count per route
+
+    Routes are labelled by their path template (`/api/game/{game_id}`), so
+    label cardinality stays bounded. Requests matching no route are grouped
+    under `unmatched`. When PROFILE_SAMPLE_RATE is set, that fraction of
+    requests runs under cProfile and the profile of any sampled request
+    slower than PROFILE_SLOW_REQUEST_MS is passed to `slow_request_hook`,
+    which logs it by default.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = registry, exclude_paths: Iterable[str] = ()):
+        self.app = app
+        self.registry = registry
+        self.exclude_paths = frozenset(exclude_paths)
+        self.profile_sample_rate = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+        self.slow_request_seconds = float(os.environ.get('PROFILE_SLOW_REQUEST_MS', '500')) / 1000
+        self.slow_request_hook: Callable[[str, float, cProfile.Profile], None] = log_profile
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = "500"
+        in_flight = self.registry.requests_in_flight
+        # The route is only known after routing, so in-flight is tracked per method
+        flight_key = (method,)
+        in_flight[flight_key] = in_flight.get(flight_key, 0) + 1
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        profiler = None
+        if self.profile_sample_rate and random.random() < self.profile_sample_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another sampled request is already being profiled
+                profiler = None
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+            in_flight[flight_key] -= 1
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            self.registry.request_latency.observe((method, route_path), elapsed)
+            key = (method, route_path, status)
+            self.registry.requests_total[key] = self.registry.requests_total.get(key, 0) + 1
+            if profiler is not None and elapsed >= self.slow_request_seconds:
+                self.slow_request_hook(f"{method} {route_path}", elapsed, profiler)
+
+
+def log_profile(request: str, elapsed: float, profiler: cProfile.Profile) -> None:
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(20)
+    log_event("slow_request", logging.WARNING, request=request, duration_ms=round(elapsed * 1000, 1),
+              profile=output.getvalue())
+
+
+# Motor methods that return awaitables, and those that return cursors
+ASYNC_METHODS = frozenset({
+    "insert_one", "insert_many", "find_one", "find_one_and_update", "find_one_and_replace",
+    "find_one_and_delete", "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+    "count_documents", "estimated_document_count", "bulk_write", "create_index", "create_indexes",
+})
+CURSOR_METHODS = frozenset({"find", "aggregate"})
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor, collection_name: str, operation: str, registry: MetricsRegistry):
+        self._cursor = cursor
+        self._labels = (collection_name, operation)
+        self._registry = registry
+
+    def __getattr__(self, name):
+        attribute = getattr(self._cursor, name)
+        if name in ("sort", "limit", "skip", "batch_size", "hint"):
+            def chain(*args, **kwargs):
+                attribute(*args, **kwargs)
+                return self
+            return chain
+        return attribute
+
+    async def __aiter__(self):
+        # One observation per iteration: the time spent waiting on the cursor,
+        # not the time the caller spends on each document
+        iterator = self._cursor.__aiter__()
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    document = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                except Exception:
+                    errors = self._registry.db_errors
+                    errors[self._labels] = errors.get(self._labels, 0) + 1
+                    raise
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield document
+        finally:
+            self._registry.db_latency.observe(self._labels, elapsed)
+
+    async def to_list(self, length: Optional[int]):
+        return await _timed(self._registry, self._labels, self._cursor.to_list(length))
+
+    async def explain(self):
+        return await self._cursor.explain()
+
+
+class InstrumentedCollection:
+    """Proxy around a Motor collection timing every database call"""
+
+    def __init__(self, collection, registry: MetricsRegistry = registry):
+        self._collection = collection
+        self._registry = registry
+        self.name = collection.name
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if name in ASYNC_METHODS:
+            labels = (self.name, name)
+
+            async def timed(*args, **kwargs):
+                return await _timed(self._registry, labels, attribute(*args, **kwargs))
+            return timed
+        if name in CURSOR_METHODS:
+            def cursor(*args, **kwargs):
+                return InstrumentedCursor(attribute(*args, **kwargs), self.name, name, self._registry)
+            return cursor
+        return attribute
+
+
+async def _timed(registry: MetricsRegistry, labels: Tuple[str, str], awaitable):
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    except Exception:
+        registry.db_errors[labels] = registry.db_errors.get(labels, 0) + 1
+        raise
+    finally:
+        registry.db_latency.observe(labels, time.perf_counter() - start)
+
+
+def instrument_collection(collection, registry: MetricsRegistry = registry):
+    """Wrap a collection so its calls are timed, unless METRICS_ENABLED=0"""
+    if os.environ.get('METRICS_ENABLED', '1') == '0':
+        return collection
+    return InstrumentedCollection(collection, registry)
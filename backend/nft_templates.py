@@ -0,0 +1,79 @@
+"""Memoized NFT metadata templates
+
+NFT metadata depends only on the dice combination and the game mode, so it
+is built once per (combination, mode), frozen, and kept in a bounded LRU
+cache. Stored games and NFTs refer to a template by its id (for example
+`std-3-3` or `fhe-1-2-3`) instead of embedding the metadata.
+"""
+import os
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping, Sequence, Tuple
+
+import score_table
+
+TEMPLATE_CACHE_SIZE = int(os.environ.get('NFT_TEMPLATE_CACHE_SIZE', '4096'))
+
+
+def template_id(dice_results: Sequence[int], game_mode: str = "standard") -> str:
+    """Id of the template for a combination, also used as the image slug"""
+    mode_prefix = "fhe" if game_mode == "fhe" else "std"
+    return f"{mode_prefix}-{'-'.join(map(str, dice_results))}"
+
+
+def parse_template_id(nft_template_id: str) -> Tuple[Tuple[int, ...], str]:
+    """Inverse of `template_id`, raising ValueError on malformed ids"""
+    mode_prefix, _, combination = nft_template_id.partition("-")
+    if mode_prefix not in ("std", "fhe") or not combination:
+        raise ValueError(f"Invalid NFT template id: {nft_template_id}")
+    dice_results = tuple(int(value) for value in combination.split("-"))
+    return dice_results, "fhe" if mode_prefix == "fhe" else "standard"
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def get_template(dice_results: Tuple[int, ...], game_mode: str = "standard") -> Mapping:
+    """Frozen NFT metadata for a combination"""
+    rarity = score_table.rarity(dice_results, game_mode)
+    dice_list = list(dice_results)
+
+    # Generate unique attributes
+    attributes = MappingProxyType({
+        "dice_combination": dice_results,
+        "total_score": sum(dice_results),
+        "rarity": rarity,
+        "special_combo": len(set(dice_results)) == 1,
+        "creator": "dropxtor",
+        "network": "sepolia",
+        "game_mode": game_mode,
+        "fhe_enabled": game_mode == "fhe"
+    })
+
+    # Generate image URL based on combination and mode
+    image_url = f"https://api.dicenft.game/images/{template_id(dice_results, game_mode)}.png"
+
+    nft_name = f"{'🔐 FHE ' if game_mode == 'fhe' else ''}Dice NFT #{'-'.join(map(str, dice_results))}"
+    description = f"A {'privacy-preserving ' if game_mode == 'fhe' else ''}unique NFT generated from dice roll: {dice_list}. Rarity: {rarity}"
+
+    return MappingProxyType({
+        "name": nft_name,
+        "description": description,
+        "image": image_url,
+        "attributes": attributes,
+        "creator": "dropxtor",
+        "twitter": "@0xDropxtor",
+        "powered_by": "Zama FHE" if game_mode == "fhe" else "Standard RNG"
+    })
+
+
+def render(template: Mapping) -> dict:
+    """Mutable, JSON-ready copy of a template"""
+    metadata = dict(template)
+    attributes = dict(template["attributes"])
+    attributes["dice_combination"] = list(attributes["dice_combination"])
+    metadata["attributes"] = attributes
+    return metadata
+
+
+def render_template_id(nft_template_id: str) -> dict:
+    """Metadata for a stored template reference"""
+    return render(get_template(*parse_template_id(nft_template_id)))
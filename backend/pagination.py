@@ -0,0 +1,56 @@
+import base64
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+MAX_PAGE_SIZE = 100
+
+# Fields a client may request through `fields`; `id` and `timestamp` are
+# always returned because the cursor is built from them
+GAME_FIELDS = frozenset({
+    "id", "player_address", "dice_results", "total_score", "timestamp", "network",
+    "nft_generated", "nft_metadata", "nft_id", "game_mode", "environment_id", "fhe_data",
+})
+CURSOR_FIELDS = ("timestamp", "id")
+
+
+def encode_cursor(game: dict) -> str:
+    """Encode the (timestamp, id) position of a game as an opaque cursor"""
+    raw = f"{game['timestamp'].isoformat()}|{game['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Decode a cursor produced by `encode_cursor`, raising ValueError if malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, game_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(timestamp), game_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def keyset_filter(cursor: Optional[str]) -> dict:
+    """Filter selecting the games strictly after `cursor` in (timestamp, id) descending order"""
+    if not cursor:
+        return {}
+    timestamp, game_id = decode_cursor(cursor)
+    return {"$or": [
+        {"timestamp": {"$lt": timestamp}},
+        {"timestamp": timestamp, "id": {"$lt": game_id}},
+    ]}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Dict[str, int]]:
+    """Turn a comma-separated field list into a Mongo projection"""
+    if not fields:
+        return None
+    requested: List[str] = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = set(requested) - GAME_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    projection = {field: 1 for field in requested}
+    projection.update({field: 1 for field in CURSOR_FIELDS})
+    if "nft_metadata" in projection:
+        # Games store their NFT metadata by template reference
+        projection["nft_template_id"] = 1
+    return projection
@@ -0,0 +1,169 @@
+import asyncio
+import sys
+import uuid
+from typing import Dict, Iterable, List
+
+from archive import union_archive
+
+BACKFILL_BATCH_SIZE = 1000
+DUPLICATE_KEY_ERROR = 11000
+TOTALS_PROJECTION = {"_id": 0, "wallet_address": 1, "total_score": 1, "games_played": 1}
+
+
+def totals(user: dict) -> dict:
+    return {"_id": user["wallet_address"], "total_score": user["total_score"], "games_played": user["games_played"]}
+
+
+def stats_mode(game_mode: str) -> str:
+    # Modes are used in field names, so anything unknown is counted as standard
+    return "fhe" if game_mode == "fhe" else "standard"
+
+
+class PlayerStats:
+    """Per-player aggregates kept on the user document
+
+    Every play applies a single upsert per player that `$inc`s games played,
+    total score and NFTs owned, overall and per game mode, and `$max`es the
+    best roll and last play time, so `GET /api/user/{wallet}` answers "how is
+    this player doing" without touching the games. These are the only stored
+    per-player totals: the all-time leaderboard ranks them. Players who play before
+    creating a profile get a user document without a username, which is not
+    counted in `total_users` until they register one.
+    """
+
+    def __init__(self, users_collection, games_collection, archive_collection=None):
+        self.users_collection = users_collection
+        self.games_collection = games_collection
+        self.archive_collection = archive_collection
+
+    @staticmethod
+    def updates(games: Iterable) -> Dict[str, dict]:
+        """Update document per player for a set of games (GameResult-like objects)"""
+        updates: Dict[str, dict] = {}
+        for game in games:
+            if not game.player_address:
+                continue
+            update = updates.get(game.player_address)
+            if update is None:
+                update = updates[game.player_address] = {
+                    "$inc": {}, "$max": {}, "$setOnInsert": {"id": str(uuid.uuid4())}
+                }
+            mode = stats_mode(game.game_mode)
+            increments = update["$inc"]
+            maxima = update["$max"]
+            for prefix in ("", f"modes.{mode}."):
+                increments[f"{prefix}games_played"] = increments.get(f"{prefix}games_played", 0) + 1
+                increments[f"{prefix}total_score"] = increments.get(f"{prefix}total_score", 0) + game.total_score
+                maxima[f"{prefix}best_roll"] = max(maxima.get(f"{prefix}best_roll", 0), game.total_score)
+            increments["nfts_owned"] = increments.get("nfts_owned", 0) + int(game.nft_generated)
+            maxima["last_played_at"] = max(maxima.get("last_played_at", game.timestamp), game.timestamp)
+        return updates
+
+    async def record_games(self, games: Iterable) -> List[dict]:
+        """Apply the games to their players' aggregates, returning each player's updated totals
+
+        Totals are {"_id": wallet address, "total_score", "games_played"}, as
+        ranked by the leaderboard.
+        """
+        from pymongo import ReturnDocument, UpdateOne
+        from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+        updates = self.updates(games)
+        if not updates:
+            return []
+        if len(updates) == 1:
+            (player, update), = updates.items()
+            try:
+                user = await self.users_collection.find_one_and_update(
+                    {"wallet_address": player}, update, TOTALS_PROJECTION,
+                    upsert=True, return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                # Two first plays raced to create the user; the other insert won
+                user = await self.users_collection.find_one_and_update(
+                    {"wallet_address": player}, update, TOTALS_PROJECTION, return_document=ReturnDocument.AFTER
+                )
+            return [totals(user)]
+
+        players = list(updates.items())
+        operations = [UpdateOne({"wallet_address": player}, update, upsert=True) for player, update in players]
+        try:
+            await self.users_collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            for error in errors:
+                player, update = players[error["index"]]
+                await self.users_collection.update_one({"wallet_address": player}, update)
+        users = await self.users_collection.find({"wallet_address": {"$in": list(updates)}},
+                                                 TOTALS_PROJECTION).to_list(len(updates))
+        return [totals(user) for user in users]
+
+    async def backfill(self) -> Dict[str, int]:
+        """Recompute every player's aggregates from the stored games, archived ones included
+
+        Aggregates are `$set`, so running it again is harmless, but games
+        played while it runs may be counted twice or not at all.
+        """
+        from pymongo import UpdateOne
+
+        pipeline = [
+            *union_archive(self.archive_collection),
+            {"$match": {"player_address": {"$ne": None}}},
+            {"$group": {
+                "_id": {
+                    "player": "$player_address",
+                    "mode": {"$cond": [{"$eq": ["$game_mode", "fhe"]}, "fhe", "standard"]},
+                },
+                "games_played": {"$sum": 1},
+                "total_score": {"$sum": "$total_score"},
+                "best_roll": {"$max": "$total_score"},
+                "nfts_owned": {"$sum": {"$cond": ["$nft_generated", 1, 0]}},
+                "last_played_at": {"$max": "$timestamp"},
+            }},
+        ]
+        players: Dict[str, dict] = {}
+        async for group in self.games_collection.aggregate(pipeline):
+            player = players.setdefault(group["_id"]["player"], {
+                "games_played": 0, "total_score": 0, "best_roll": 0, "nfts_owned": 0, "last_played_at": None
+            })
+            player["games_played"] += group["games_played"]
+            player["total_score"] += group["total_score"]
+            player["nfts_owned"] += group["nfts_owned"]
+            player["best_roll"] = max(player["best_roll"], group["best_roll"])
+            if player["last_played_at"] is None or group["last_played_at"] > player["last_played_at"]:
+                player["last_played_at"] = group["last_played_at"]
+            player[f"modes.{group['_id']['mode']}"] = {
+                "games_played": group["games_played"],
+                "total_score": group["total_score"],
+                "best_roll": group["best_roll"],
+            }
+
+        created = 0
+        operations: List = []
+        for index, (player, aggregates) in enumerate(players.items(), 1):
+            operations.append(UpdateOne(
+                {"wallet_address": player},
+                {"$set": aggregates, "$setOnInsert": {"id": str(uuid.uuid4())}},
+                upsert=True,
+            ))
+            if len(operations) == BACKFILL_BATCH_SIZE or index == len(players):
+                result = await self.users_collection.bulk_write(operations, ordered=False)
+                created += result.upserted_count
+                operations = []
+        return {"players": len(players), "created": created}
+
+
+async def _main(argv: List[str]) -> None:
+    from server import player_stats
+
+    if argv[1:] != ["backfill"]:
+        print("Usage: python player_stats.py backfill")
+        sys.exit(2)
+    result = await player_stats.backfill()
+    print(f"Player stats backfilled: {result['players']} players, {result['created']} user documents created")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv))
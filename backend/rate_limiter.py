@@ -0,0 +1,178 @@
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+
+class RateLimiter(ABC):
+    """Base class for rate limiter backends"""
+
+    def __init__(self, max_requests: int, window_seconds: int):
+        if max_requests < 1 or window_seconds <= 0:
+            raise ValueError("max_requests and window_seconds must be positive")
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+
+    @abstractmethod
+    async def hit(self, key: str, cost: int = 1) -> bool:
+        """Record `cost` requests for `key`, return False if the limit is exceeded"""
+
+    def _estimate(self, now: float, window: int, current: int, previous: int) -> float:
+        # Sliding window counter: weight the previous window by how much of it
+        # still overlaps the sliding window ending at `now`
+        elapsed = now - window * self.window_seconds
+        overlap = max(0.0, 1.0 - elapsed / self.window_seconds)
+        return previous * overlap + current
+
+
+class InMemoryRateLimiter(RateLimiter):
+    """Sliding window counter limiter kept in process memory
+
+    Each key holds a fixed-size (window, current, previous) entry, so a hit is
+    O(1) whatever the traffic. Keys are kept in least-recently-used order:
+    idle keys are evicted from the head once their windows have expired, and
+    the whole store is capped at `max_keys` entries.
+    """
+
+    def __init__(self, max_requests: int, window_seconds: int, max_keys: int = 100_000):
+        super().__init__(max_requests, window_seconds)
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def hit(self, key: str, cost: int = 1) -> bool:
+        return self.hit_sync(key, cost)
+
+    def hit_sync(self, key: str, cost: int = 1, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        window_seconds = self.window_seconds
+        window = int(now // window_seconds)
+        entries = self._entries
+
+        entry = entries.get(key)
+        if entry is None:
+            entry = entries[key] = [window, 0, 0]
+            self._evict(window)
+        else:
+            entries.move_to_end(key)
+            if entry[0] != window:
+                entry[2] = entry[1] if entry[0] == window - 1 else 0
+                entry[1] = 0
+                entry[0] = window
+                self._evict(window)
+
+        # Sliding window estimate, inlined from RateLimiter._estimate
+        overlap = 1.0 - (now - window * window_seconds) / window_seconds
+        if entry[2] * overlap + entry[1] + cost > self.max_requests:
+            return False
+        entry[1] += cost
+        return True
+
+    def _evict(self, window: int) -> None:
+        # Entries older than the previous window no longer affect any estimate;
+        # only called when a key is added or rolls over, so idle keys are
+        # reclaimed without a per-hit scan
+        entries = self._entries
+        while entries:
+            oldest_key = next(iter(entries))
+            if entries[oldest_key][0] >= window - 1 and len(entries) <= self.max_keys:
+                break
+            entries.popitem(last=False)
+
+
+class LocalCounterStore:
+    """In-process stand-in for a shared counter store (tests, single worker)"""
+
+    def __init__(self):
+        self._counters: Dict[str, Tuple[int, float]] = {}
+
+    async def incr(self, key: str, amount: int, ttl_seconds: float) -> int:
+        now = time.time()
+        value, expires_at = self._counters.get(key, (0, 0.0))
+        if expires_at <= now:
+            value, expires_at = 0, now + ttl_seconds
+        value += amount
+        self._counters[key] = (value, expires_at)
+        return value
+
+    async def get(self, key: str) -> int:
+        value, expires_at = self._counters.get(key, (0, 0.0))
+        return value if expires_at > time.time() else 0
+
+
+class MongoCounterStore:
+    """Shared counter store backed by a MongoDB collection
+
+    Counters are single documents updated with `$inc`, so every worker sees
+    the same counts. Documents carry an `expires_at` field that a TTL index
+    uses to drop finished windows; like every TTL field it is naive UTC,
+    which is how MongoDB reads datetimes.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def incr(self, key: str, amount: int, ttl_seconds: float) -> int:
+        from pymongo import ReturnDocument
+
+        expires_at = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=ttl_seconds)
+        doc = await self.collection.find_one_and_update(
+            {"_id": key},
+            {
+                "$inc": {"count": amount},
+                "$setOnInsert": {"expires_at": expires_at},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc["count"]
+
+    async def get(self, key: str) -> int:
+        doc = await self.collection.find_one({"_id": key})
+        return doc["count"] if doc else 0
+
+
+class SharedRateLimiter(RateLimiter):
+    """Sliding window counter limiter on top of a shared counter store
+
+    Keeps limits consistent across several uvicorn workers. Each hit costs one
+    increment and one read; rejected hits are rolled back so they do not count
+    against the client.
+    """
+
+    def __init__(self, max_requests: int, window_seconds: int, store=None):
+        super().__init__(max_requests, window_seconds)
+        self.store = store if store is not None else LocalCounterStore()
+
+    def _key(self, key: str, window: int) -> str:
+        return f"rl:{self.max_requests}:{self.window_seconds}:{key}:{window}"
+
+    async def hit(self, key: str, cost: int = 1) -> bool:
+        now = time.time()
+        window = int(now // self.window_seconds)
+        ttl = self.window_seconds * 2
+
+        current = await self.store.incr(self._key(key, window), cost, ttl)
+        previous = await self.store.get(self._key(key, window - 1))
+
+        if self._estimate(now, window, current, previous) > self.max_requests:
+            await self.store.incr(self._key(key, window), -cost, ttl)
+            return False
+        return True
+
+
+def create_rate_limiter(max_requests: int, window_seconds: int, backend: Optional[str] = None,
+                        collection=None) -> RateLimiter:
+    """Build a limiter for the configured backend (RATE_LIMIT_BACKEND=memory|shared)"""
+    backend = backend or os.environ.get("RATE_LIMIT_BACKEND", "memory")
+    if backend == "memory":
+        max_keys = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+        return InMemoryRateLimiter(max_requests, window_seconds, max_keys=max_keys)
+    if backend == "shared":
+        store = MongoCounterStore(collection) if collection is not None else LocalCounterStore()
+        return SharedRateLimiter(max_requests, window_seconds, store=store)
+    raise ValueError(f"Unknown rate limit backend: {backend}")
@@ -0,0 +1,127 @@
+"""Precomputed score and rarity of every dice combination
+
+With 1 to 6 six-faced dice there are 55,986 ordered outcomes. Each one is
+encoded as a single integer (a base-6 number offset by the dice count) and
+the table stores its score and standard/FHE rarity codes in NumPy arrays,
+about 220 KB in total. Scalar lookups go through a dict keyed by the dice
+tuple, which is faster than encoding in Python.
+
+The table is built from the vectorized engine the first time it is used.
+Until then scalar lookups are computed and memoized one combination at a
+time, so a cold process serving single plays never imports NumPy.
+"""
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from scoring import calculate_score, determine_nft_rarity
+
+if TYPE_CHECKING:
+    import numpy as np
+
+MAX_DICE = 6
+FACES = 6
+
+# OFFSETS[n - 1] is the code of the first combination of n dice
+OFFSETS = [0]
+for _n in range(1, MAX_DICE + 1):
+    OFFSETS.append(OFFSETS[-1] + FACES ** _n)
+TABLE_SIZE = OFFSETS[-1]
+
+
+def encode(dice: Sequence[int]) -> int:
+    """Encode an ordered combination of 1 to 6 dice as a table index"""
+    code = 0
+    for value in dice:
+        code = code * FACES + value - 1
+    return OFFSETS[len(dice) - 1] + code
+
+
+def encode_batch(dice: "np.ndarray") -> "np.ndarray":
+    """Encode every row of an (n_games, n_dice) array as table indexes"""
+    import numpy as np
+
+    n_dice = dice.shape[1]
+    weights = FACES ** np.arange(n_dice - 1, -1, -1, dtype=np.int64)
+    return OFFSETS[n_dice - 1] + (dice.astype(np.int64) - 1) @ weights
+
+
+def all_combinations(n_dice: int) -> "np.ndarray":
+    """Every ordered combination of `n_dice` dice, row `i` having code OFFSETS[n_dice - 1] + i"""
+    import numpy as np
+
+    return np.indices((FACES,) * n_dice, dtype=np.int8).reshape(n_dice, -1).T + 1
+
+
+class ScoreTable:
+    def __init__(self):
+        import numpy as np
+
+        from dice_engine import RARITIES, rarity_codes_batch, score_batch
+
+        self.scores = np.empty(TABLE_SIZE, dtype=np.int16)
+        self.standard_rarity = np.empty(TABLE_SIZE, dtype=np.uint8)
+        self.fhe_rarity = np.empty(TABLE_SIZE, dtype=np.uint8)
+        self._by_combination: Dict[Tuple[int, ...], Tuple[int, str, str]] = {}
+
+        for n_dice in range(1, MAX_DICE + 1):
+            dice = all_combinations(n_dice)
+            codes = slice(OFFSETS[n_dice - 1], OFFSETS[n_dice])
+            self.scores[codes] = score_batch(dice)
+            self.standard_rarity[codes] = rarity_codes_batch(dice, "standard")
+            self.fhe_rarity[codes] = rarity_codes_batch(dice, "fhe")
+
+            rows = zip(
+                map(tuple, dice.tolist()),
+                self.scores[codes].tolist(),
+                self.standard_rarity[codes].tolist(),
+                self.fhe_rarity[codes].tolist(),
+            )
+            for combination, score, standard, fhe in rows:
+                self._by_combination[combination] = (score, RARITIES[standard], RARITIES[fhe])
+
+    def lookup(self, dice: Sequence[int]) -> Tuple[int, str, str]:
+        """(score, standard rarity, FHE rarity) of a combination"""
+        return self._by_combination[tuple(dice)]
+
+    def lookup_batch(self, dice: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+        """Scores and rarity codes of every row of an (n_games, n_dice) array"""
+        codes = encode_batch(dice)
+        return self.scores[codes], self.standard_rarity[codes], self.fhe_rarity[codes]
+
+
+_table: Optional[ScoreTable] = None
+# Scalar entries computed before the table is built
+_memo: Dict[Tuple[int, ...], Tuple[int, str, str]] = {}
+
+
+def get_table() -> ScoreTable:
+    global _table
+    if _table is None:
+        _table = ScoreTable()
+        _memo.clear()
+    return _table
+
+
+def lookup(dice: Sequence[int]) -> Tuple[int, str, str]:
+    """(score, standard rarity, FHE rarity), from the table once it is built"""
+    if _table is not None:
+        return _table.lookup(dice)
+    combination = tuple(dice)
+    entry = _memo.get(combination)
+    if entry is None:
+        entry = _memo[combination] = (
+            calculate_score(dice),
+            determine_nft_rarity(dice, "standard"),
+            determine_nft_rarity(dice, "fhe"),
+        )
+    return entry
+
+
+def score(dice: List[int]) -> int:
+    """Table-backed equivalent of `calculate_score`"""
+    return lookup(dice)[0]
+
+
+def rarity(dice: List[int], game_mode: str = "standard") -> str:
+    """Table-backed equivalent of `determine_nft_rarity`"""
+    entry = lookup(dice)
+    return entry[2] if game_mode == "fhe" else entry[1]
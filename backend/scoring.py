@@ -0,0 +1,25 @@
+"""Reference scoring rules, kept free of heavy imports"""
+from typing import List
+
+
+def calculate_score(dice_results: List[int]) -> int:
+    """Calculate game score based on dice results"""
+    total = sum(dice_results)
+    # Bonus for special combinations
+    if len(set(dice_results)) == 1:  # All same
+        total *= 2
+    elif sorted(dice_results) == list(range(min(dice_results), max(dice_results) + 1)):  # Sequence
+        total += 10
+    return total
+
+
+def determine_nft_rarity(dice_results: List[int], game_mode: str = "standard") -> str:
+    """Determine NFT rarity based on dice results and game mode"""
+    if len(set(dice_results)) == 1:  # All same
+        return "Legendary" if game_mode == "fhe" else "Epic"
+    elif sum(dice_results) >= 10:
+        return "Rare" if game_mode == "fhe" else "Uncommon"
+    elif sum(dice_results) >= 7:
+        return "Uncommon" if game_mode == "fhe" else "Common"
+    else:
+        return "Common"
@@ -0,0 +1,51 @@
+"""Fast JSON responses
+
+Handlers return `FastJSONResponse` instances directly, which FastAPI sends
+as-is, skipping the `jsonable_encoder` pass it runs over returned dicts.
+Content is encoded straight to bytes with orjson when it is installed and
+with the standard library otherwise; both render datetimes in ISO format
+like `jsonable_encoder` does. BSON ObjectIds and Decimal128s are rendered
+as strings; any other type that JSON cannot represent raises TypeError.
+"""
+import json
+import sys
+from datetime import date, datetime
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    # Only check BSON types once pymongo is loaded: importing bson here would slow cold starts
+    bson = sys.modules.get("bson")
+    if bson is not None:
+        if isinstance(value, bson.ObjectId):
+            return str(value)
+        if isinstance(value, bson.Decimal128):
+            return str(value.to_decimal())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any, sort_keys: bool = False) -> bytes:
+    """Encode `content` as JSON bytes, with object keys sorted if `sort_keys`"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(content, default=_default, option=option)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":"),
+                      sort_keys=sort_keys).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,41 +1,40 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
 import os
 from typing import Optional, List, Dict, Any
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime
 import random
-import json
 import time
+import hmac
+import logging
 
-app = FastAPI()
+from archive import GameArchive
+from cache import LRUCache, TTLCache
+import database
+from database import LazyCollection, get_db
+from events import EventHub
+from fhe_worker import FHEVerificationTimeout, FHEVerifierBusy, create_fhe_verifier
+from idempotency import (MAX_KEY_LENGTH, IdempotencyConflict, IdempotencyKeyReused, IdempotencyStore, fingerprint,
+                         outstanding)
+from leaderboard import GAME_MODES, WINDOW_DAYS, Leaderboard, WindowedLeaderboard
+from logging_config import RequestIdMiddleware, log_event, setup_logging
+from metrics import MetricsMiddleware, instrument_collection, registry as metrics_registry
+import nft_templates
+from player_stats import PlayerStats
+from pagination import MAX_PAGE_SIZE, encode_cursor, keyset_filter, parse_fields
+from rate_limiter import RateLimiter, create_rate_limiter
+import score_table
+from serialization import FastJSONResponse
+from write_behind import create_write_behind_buffer
+from stats import StatsCounters
 
-# Rate limiting dictionary
-rate_limit_store = {}
+setup_logging()
 
-def rate_limit(request: Request, max_requests: int = 10, window_seconds: int = 60):
-    """Improved rate limiting implementation"""
-    client_ip = request.client.host
-    current_time = time.time()
-    
-    # Clean old entries
-    if client_ip in rate_limit_store:
-        rate_limit_store[client_ip] = [
-            timestamp for timestamp in rate_limit_store[client_ip]
-            if current_time - timestamp < window_seconds
-        ]
-    else:
-        rate_limit_store[client_ip] = []
-    
-    # Check if limit exceeded
-    if len(rate_limit_store[client_ip]) >= max_requests:
-        return False
-    
-    # Add current request
-    rate_limit_store[client_ip].append(current_time)
-    return True
+app = FastAPI()
 
 # CORS configuration
 app.add_middleware(
@@ -46,13 +45,99 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# MongoDB connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client['zama_dice_game']
-games_collection = db['games']
-users_collection = db['users']
-nfts_collection = db['nfts']
+# Per-route latency and in-flight metrics, exposed at /api/metrics
+app.add_middleware(MetricsMiddleware, exclude_paths=["/api/stream", "/api/metrics", "/api/export/games"])
+# Request ids for log records; outermost so every layer logs with it
+app.add_middleware(RequestIdMiddleware)
+
+# MongoDB collections; the client is only created by the first database call,
+# then reused for the life of the process (see database.py).
+# Collections are wrapped so every Motor call is timed per collection and operation
+games_collection = instrument_collection(LazyCollection('games'))
+games_archive_collection = instrument_collection(LazyCollection('games_archive'))
+users_collection = instrument_collection(LazyCollection('users'))
+nfts_collection = instrument_collection(LazyCollection('nfts'))
+rate_limits_collection = instrument_collection(LazyCollection('rate_limits'))
+leaderboard_rollups_collection = instrument_collection(LazyCollection('leaderboard_rollups'))
+leaderboard_days_collection = instrument_collection(LazyCollection('leaderboard_days'))
+counters_collection = instrument_collection(LazyCollection('counters'))
+idempotency_keys_collection = instrument_collection(LazyCollection('idempotency_keys'))
+
+# Serverless mode: skip startup work that every cold start would pay for.
+# Indexes are then created by `python indexes.py` at deploy time.
+LAZY_INIT = os.environ.get('LAZY_INIT', '1' if os.environ.get('VERCEL') else '0') == '1'
+
+# All-time top players, ranked from the per-player totals that player_stats keeps on the users
+leaderboard = Leaderboard(users_collection)
+# Daily/weekly and per-mode rankings, from daily top-K buckets updated on each play
+windowed_leaderboard = WindowedLeaderboard(
+    leaderboard_rollups_collection, leaderboard_days_collection, users_collection,
+    retention_days=int(os.environ.get('LEADERBOARD_RETENTION_DAYS', '35'))
+)
+# Optional write-behind persistence of games and NFTs (GAMES_WRITE_BEHIND=1)
+games_writer = create_write_behind_buffer(games_collection)
+nfts_writer = create_write_behind_buffer(nfts_collection)
+stats_counters = StatsCounters(counters_collection, games_collection, users_collection,
+                               archive_collection=games_archive_collection)
+player_stats = PlayerStats(users_collection, games_collection, games_archive_collection)
+# Games older than ARCHIVE_AFTER_DAYS are moved to games_archive by `python archive.py`
+game_archive = GameArchive(games_collection, games_archive_collection,
+                           older_than_days=float(os.environ.get('ARCHIVE_AFTER_DAYS', '90')))
+def pool_gauges() -> Dict[tuple, int]:
+    """Connection pool gauges for /api/metrics"""
+    # Summed over servers: the endpoint is public, so it must not name the database hosts
+    totals = database.pool_stats.totals()
+    return {(("state", state),): totals.get(state, 0) for state in ("open", "in_use", "idle", "waiting")}
+
+metrics_registry.collectors["mongo_pool_connections"] = pool_gauges
+# Read-through caches: games never change once written, so they are kept in an
+# LRU filled on write; users change on every play and are cached briefly.
+# Lookups that found nothing are remembered for NEGATIVE_CACHE_TTL_SECONDS.
+NEGATIVE_CACHE_TTL_SECONDS = float(os.environ.get('NEGATIVE_CACHE_TTL_SECONDS', '5'))
+games_cache = LRUCache(int(os.environ.get('GAME_CACHE_SIZE', '10000')), NEGATIVE_CACHE_TTL_SECONDS)
+users_cache = TTLCache(float(os.environ.get('USER_CACHE_TTL_SECONDS', '5')),
+                       max_size=int(os.environ.get('USER_CACHE_SIZE', '10000')),
+                       negative_ttl_seconds=NEGATIVE_CACHE_TTL_SECONDS)
+caches = {"games": games_cache, "users": users_cache}
+metrics_registry.collectors["cache_requests"] = lambda: {
+    (("cache", name), ("result", result)): count
+    for name, cache in caches.items() for result, count in cache.counters().items()
+}
+metrics_registry.collectors["cache_entries"] = lambda: {
+    (("cache", name),): len(cache) for name, cache in caches.items()
+}
+# Results of plays sent with an Idempotency-Key, replayed when the client retries
+idempotency_store = IdempotencyStore(idempotency_keys_collection,
+                                     ttl_seconds=float(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400')))
+# Ciphertext verification for FHE plays, on a worker pool started on first use
+fhe_verifier = create_fhe_verifier()
+metrics_registry.collectors["fhe_verifications"] = lambda: {
+    (("state", state),): count for state, count in fhe_verifier.counters().items()
+}
+# Live feed for /api/stream, fed from the play and user write paths
+event_hub = EventHub()
+
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+def require_admin(request: Request):
+    """Reject admin calls unless ADMIN_TOKEN is configured and matches X-Admin-Token"""
+    token = request.headers.get("X-Admin-Token", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+# Rate limiting - one limiter per (max_requests, window_seconds) rule
+rate_limiters: Dict[tuple, RateLimiter] = {}
+
+async def rate_limit(request: Request, max_requests: int = 10, window_seconds: int = 60, cost: int = 1,
+                     scope: str = "") -> bool:
+    """Sliding window rate limiting per client IP, counted separately for each `scope`"""
+    rule = (max_requests, window_seconds)
+    limiter = rate_limiters.get(rule)
+    if limiter is None:
+        limiter = create_rate_limiter(max_requests, window_seconds, collection=rate_limits_collection)
+        rate_limiters[rule] = limiter
+    key = f"{scope}:{request.client.host}" if scope else request.client.host
+    return await limiter.hit(key, cost)
 
 # Pydantic models
 class GameResult(BaseModel):
@@ -64,6 +149,8 @@ class GameResult(BaseModel):
     network: str = "sepolia"
     nft_generated: bool = False
     nft_metadata: Optional[dict] = None
+    nft_id: Optional[str] = None
+    nft_template_id: Optional[str] = None  # Stored instead of nft_metadata, see nft_templates
     game_mode: str = "standard"  # "standard" or "fhe"
     environment_id: Optional[str] = None
     fhe_data: Optional[dict] = None
@@ -71,10 +158,23 @@ class GameResult(BaseModel):
 class User(BaseModel):
     id: str
     wallet_address: str
-    username: str
+    username: Optional[str] = None  # Unset for players who played before creating a profile
     games_played: int = 0
     total_score: int = 0
     nfts_owned: int = 0
+    best_roll: int = 0
+    modes: Dict[str, Dict[str, int]] = {}  # Per game mode: games_played, total_score, best_roll
+    last_played_at: Optional[datetime] = None
+
+class GameSpec(BaseModel):
+    player_address: Optional[str] = None
+    num_dice: int = 2
+    game_mode: str = "standard"
+    encrypted_data: Optional[Dict[str, Any]] = None
+    environment_id: Optional[str] = None
+
+class BatchPlayRequest(BaseModel):
+    games: List[GameSpec]
 
 class NFTMetadata(BaseModel):
     id: str
@@ -83,7 +183,9 @@ class NFTMetadata(BaseModel):
     dice_combination: List[int]
     rarity: str
     image_url: str
-    attributes: dict
+    attributes: Optional[dict] = None  # Rendered from the template on read
+    template_id: Optional[str] = None
+    game_id: Optional[str] = None
     created_at: datetime
 
 # Game logic
@@ -96,182 +198,531 @@ def roll_dice(num_dice: int = 2) -> List[int]:
         num_dice = 6  # Cap at maximum
     return [random.randint(1, 6) for _ in range(num_dice)]
 
-def calculate_score(dice_results: List[int]) -> int:
-    """Calculate game score based on dice results"""
-    total = sum(dice_results)
-    # Bonus for special combinations
-    if len(set(dice_results)) == 1:  # All same
-        total *= 2
-    elif sorted(dice_results) == list(range(min(dice_results), max(dice_results) + 1)):  # Sequence
-        total += 10
-    return total
-
-def determine_nft_rarity(dice_results: List[int], game_mode: str = "standard") -> str:
-    """Determine NFT rarity based on dice results and game mode"""
-    if len(set(dice_results)) == 1:  # All same
-        return "Legendary" if game_mode == "fhe" else "Epic"
-    elif sum(dice_results) >= 10:
-        return "Rare" if game_mode == "fhe" else "Uncommon"
-    elif sum(dice_results) >= 7:
-        return "Uncommon" if game_mode == "fhe" else "Common"
-    else:
-        return "Common"
-
 def generate_nft_metadata(dice_results: List[int], player_address: str, game_mode: str = "standard") -> dict:
     """Generate NFT metadata based on dice results and game mode"""
-    rarity = determine_nft_rarity(dice_results, game_mode)
+    return nft_templates.render(nft_templates.get_template(tuple(dice_results), game_mode))
+
+def game_document(game_result: GameResult) -> dict:
+    """Document stored for a game; NFT metadata is kept by template reference"""
+    return game_result.model_dump(exclude={"nft_metadata"})
+
+def nft_document(game_result: GameResult) -> dict:
+    """Document stored in the NFT collection for a game that generated an NFT"""
+    return NFTMetadata.model_construct(
+        id=game_result.nft_id,
+        owner_address=game_result.player_address,
+        dice_combination=game_result.dice_results,
+        rarity=game_result.nft_metadata["attributes"]["rarity"],
+        image_url=game_result.nft_metadata["image"],
+        template_id=game_result.nft_template_id,
+        game_id=game_result.id,
+        created_at=game_result.timestamp
+    ).model_dump(exclude={"attributes"})
+
+async def save_games(game_results: List[GameResult]):
+    """Persist games and their NFTs, through the write-behind buffers when enabled"""
+    games = [game_document(game_result) for game_result in game_results]
+    nfts = [nft_document(game_result) for game_result in game_results if game_result.nft_generated]
+    for collection, writer, documents in ((games_collection, games_writer, games),
+                                          (nfts_collection, nfts_writer, nfts)):
+        if not documents:
+            continue
+        if writer is not None:
+            for document in documents:
+                await writer.put(document)
+        elif len(documents) == 1:
+            await collection.insert_one(documents[0])
+        else:
+            await collection.insert_many(documents)
+    for game in games:
+        # The insert added an _id to the document; the API never returns it
+        games_cache.set(game["id"], {key: value for key, value in game.items() if key != "_id"})
+
+async def publish_games(game_results: List[GameResult], leaderboard_changed: bool):
+    """Push new games, the stats delta and leaderboard changes to stream subscribers"""
+    if not event_hub.subscriber_count:
+        return
+    for game_result in game_results:
+        event_hub.publish("game", {
+            "id": game_result.id,
+            "player_address": game_result.player_address,
+            "dice_results": game_result.dice_results,
+            "total_score": game_result.total_score,
+            "nft_generated": game_result.nft_generated,
+            "game_mode": game_result.game_mode,
+            "timestamp": game_result.timestamp
+        })
+    event_hub.publish("stats", {
+        "total_games": len(game_results),
+        "total_nfts": sum(game_result.nft_generated for game_result in game_results)
+    })
+    if leaderboard_changed:
+        event_hub.publish("leaderboard", {"leaderboard": await leaderboard.top(10)})
+
+def hydrate_game(game: dict) -> dict:
+    """Render the NFT metadata of a stored game from its template reference"""
+    if game.get("nft_template_id") and not game.get("nft_metadata"):
+        game["nft_metadata"] = nft_templates.render_template_id(game["nft_template_id"])
+    return game
+
+@app.on_event("startup")
+async def open_database():
+    """Connect before the first request, unless LAZY_INIT=1 defers it to first use"""
+    if not LAZY_INIT:
+        await database.connect()
+
+@app.on_event("startup")
+async def create_indexes():
+    """Declare the indexes the hot queries rely on (ENSURE_INDEXES=0 or LAZY_INIT=1 to skip)"""
+    if LAZY_INIT or os.environ.get('ENSURE_INDEXES', '1') == '0':
+        return
+    from indexes import ensure_indexes
+    try:
+        await ensure_indexes(get_db())
+    except Exception as e:
+        log_event("ensure_indexes_failed", logging.WARNING, error=str(e))
+
+@app.on_event("startup")
+async def start_write_behind():
+    for writer in (games_writer, nfts_writer):
+        if writer is not None:
+            await writer.start()
+
+@app.on_event("shutdown")
+async def drain_write_behind():
+    """Flush buffered writes before the worker exits"""
+    for writer in (games_writer, nfts_writer):
+        if writer is not None:
+            await writer.drain()
+
+@app.on_event("shutdown")
+async def stop_fhe_verifier():
+    fhe_verifier.shutdown()
+
+@app.on_event("shutdown")
+async def close_database():
+    """Release pooled connections once buffered writes are flushed"""
+    database.close()
+
+@app.on_event("startup")
+async def build_score_table():
+    """Build the score/rarity lookup table before the first play, unless LAZY_INIT=1"""
+    if not LAZY_INIT:
+        score_table.get_table()
+
+# API Routes
+@app.get("/api/health")
+async def health_check(ready: bool = False):
+    """Liveness; with ready=true, also ping the database and report pool statistics"""
+    if not ready:
+        return {"status": "healthy", "service": "zama-dice-game"}
+    report = await database.readiness()
+    healthy = report["status"] == "ok"
+    return FastJSONResponse(
+        {"status": "healthy" if healthy else "unavailable", "service": "zama-dice-game", "database": report},
+        status_code=200 if healthy else 503
+    )
+
+PLAY_RATE_LIMIT = int(os.environ.get('PLAY_RATE_LIMIT', '10'))
+PLAY_RATE_WINDOW = int(os.environ.get('PLAY_RATE_WINDOW', '60'))
+# Games per window played through /api/play/batch, limited apart from single plays
+PLAY_BATCH_RATE_LIMIT = int(os.environ.get('PLAY_BATCH_RATE_LIMIT', '1000'))
+MAX_BATCH_SIZE = 100
+
+def validate_game_params(player_address: Optional[str], num_dice: int, environment_id: Optional[str]):
+    """Validate the parameters of a single game, raising HTTPException on bad input"""
+    if num_dice < 1 or num_dice > 6:
+        raise HTTPException(status_code=400, detail="Number of dice must be between 1 and 6")
     
-    # Generate unique attributes
-    attributes = {
-        "dice_combination": dice_results,
-        "total_score": sum(dice_results),
-        "rarity": rarity,
-        "special_combo": len(set(dice_results)) == 1,
-        "creator": "dropxtor",
-        "network": "sepolia",
-        "game_mode": game_mode,
-        "fhe_enabled": game_mode == "fhe"
-    }
+    if player_address:
+        # Strict wallet address validation
+        if not player_address.startswith("0x") or len(player_address) != 42:
+            raise HTTPException(status_code=400, detail="Invalid wallet address format")
+        
+        # Additional validation - only hexadecimal characters
+        try:
+            int(player_address[2:], 16)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid wallet address format")
     
-    # Generate image URL based on combination and mode
-    mode_prefix = "fhe" if game_mode == "fhe" else "std"
-    image_url = f"https://api.dicenft.game/images/{mode_prefix}-{'-'.join(map(str, dice_results))}.png"
+    # Validate environment_id if provided
+    if environment_id and len(environment_id) > 100:
+        raise HTTPException(status_code=400, detail="Invalid environment ID")
+
+def create_game(player_address: Optional[str], num_dice: int, game_mode: str,
+                encrypted_data: Optional[Dict[str, Any]], environment_id: Optional[str],
+                dice_results: Optional[List[int]] = None, total_score: Optional[int] = None,
+                game_id: Optional[str] = None) -> GameResult:
+    """Roll and score a game, without persisting it
+
+    `dice_results` and `total_score` may be given when the game was already
+    rolled and scored in bulk by the dice engine; FHE games pass the dice
+    verified from their ciphertext (see verify_fhe_dice). `game_id` is given
+    when it had to be known before the game was played.
+    """
+    if game_id is None:
+        game_id = str(uuid.uuid4())
+    
+    # Process game based on mode
+    if dice_results is None:
+        # Standard dice roll
+        dice_results = roll_dice(num_dice)
+    if game_mode == "fhe" and encrypted_data:
+        log_event("fhe_game_processed", game_id=game_id, environment_id=environment_id,
+                  encrypted_bytes=len(encrypted_data.get('dice1', [])))
+    
+    if total_score is None:
+        total_score = score_table.score(dice_results)
     
-    nft_name = f"{'🔐 FHE ' if game_mode == 'fhe' else ''}Dice NFT #{'-'.join(map(str, dice_results))}"
-    description = f"A {'privacy-preserving ' if game_mode == 'fhe' else ''}unique NFT generated from dice roll: {dice_results}. Rarity: {rarity}"
+    # Generate NFT metadata with game mode
+    nft_metadata = None
+    nft_generated = False
+    nft_id = None
+    nft_template_id = None
     
+    if player_address:
+        nft_metadata = generate_nft_metadata(dice_results, player_address, game_mode)
+        nft_generated = True
+        nft_id = str(uuid.uuid4())
+        nft_template_id = nft_templates.template_id(dice_results, game_mode)
+    
+    log_event("game_played", logging.DEBUG, game_id=game_id, game_mode=game_mode,
+              num_dice=num_dice, total_score=total_score)
+    
+    # Internally produced data, so skip validation
+    return GameResult.model_construct(
+        id=game_id,
+        player_address=player_address,
+        dice_results=dice_results,
+        total_score=total_score,
+        timestamp=datetime.now(),
+        nft_generated=nft_generated,
+        nft_metadata=nft_metadata,
+        nft_id=nft_id,
+        nft_template_id=nft_template_id,
+        game_mode=game_mode,
+        environment_id=environment_id,
+        fhe_data={"encrypted": bool(encrypted_data)} if encrypted_data else None
+    )
+
+async def verify_fhe_dice(payloads: List[tuple]) -> List[List[int]]:
+    """Dice verified from each (encrypted_data, num_dice) on the FHE worker pool"""
+    try:
+        return await fhe_verifier.verify(payloads)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid encrypted data: {e}")
+    except FHEVerifierBusy:
+        raise HTTPException(status_code=503, detail="FHE verification is at capacity, retry shortly",
+                            headers={"Retry-After": "1"})
+    except FHEVerificationTimeout:
+        raise HTTPException(status_code=504, detail="FHE verification timed out")
+
+async def find_game(game_id: str) -> Optional[dict]:
+    """Stored game `game_id`, wherever it currently lives"""
+    async def load_game():
+        # Games still queued for write-behind are served from the buffer
+        game = games_writer.get(game_id) if games_writer is not None else None
+        if game is not None:
+            return {key: value for key, value in game.items() if key != '_id'}
+        game = await games_collection.find_one({"id": game_id}, {"_id": 0})
+        if game is None:
+            # Old games have been moved to cold storage
+            game = await game_archive.find_game(game_id)
+        return game
+
+    return await games_cache.get_or_load(game_id, load_game)
+
+# Writes derived from a saved game; a failed one is applied again by a retry with the same Idempotency-Key
+PLAY_ROLLUPS = ("player_stats", "windowed_leaderboard", "stats")
+
+async def record_rollups(game_results: List[GameResult], rollups=PLAY_ROLLUPS) -> tuple:
+    """Apply saved games to the named rollups, returning (leaderboard_changed, failures by rollup)"""
+    writes = {
+        "player_stats": lambda: player_stats.record_games(game_results),
+        "windowed_leaderboard": lambda: windowed_leaderboard.record_games(game_results),
+        "stats": lambda: stats_counters.incr(
+            total_games=len(game_results),
+            total_nfts=sum(game_result.nft_generated for game_result in game_results)
+        ),
+    }
+    # The rollups are independent of each other
+    results = await asyncio.gather(*(writes[name]() for name in rollups), return_exceptions=True)
+    leaderboard_changed = False
+    failures = {}
+    for name, result in zip(rollups, results):
+        if isinstance(result, BaseException):
+            log_event("rollup_failed", logging.ERROR, rollup=name, error=repr(result))
+            failures[name] = result
+        elif name == "player_stats":
+            for totals in result:
+                users_cache.invalidate(totals["_id"])
+            leaderboard_changed = leaderboard.offer(result)
+    return leaderboard_changed, failures
+
+async def apply_play_rollups(idempotency_key: Optional[str], game_result: GameResult, rollups) -> bool:
+    """Apply the rollups of a play and record which ran on its key, raising the first failure"""
+    leaderboard_changed, failures = await record_rollups([game_result], rollups)
+    if idempotency_key is not None:
+        await idempotency_store.finish_rollups(
+            idempotency_key, [name for name in rollups if name not in failures], list(failures)
+        )
+    if failures:
+        raise next(iter(failures.values()))
+    return leaderboard_changed
+
+async def replay_play(idempotency_key: str, record: dict) -> FastJSONResponse:
+    """Stored response of a play, once the rollups earlier attempts failed or abandoned are applied"""
+    rollups = await idempotency_store.take_rollups(idempotency_key, record) if outstanding(record) else []
+    if rollups:
+        game = await find_game(record["response"]["game_id"])
+        if game is None:
+            await idempotency_store.finish_rollups(idempotency_key, [], rollups)
+            raise HTTPException(status_code=500, detail="Game of this Idempotency-Key was not found")
+        await apply_play_rollups(idempotency_key, GameResult(**game), rollups)
+    return FastJSONResponse(record["response"], headers={"Idempotent-Replayed": "true"})
+
+async def idempotent(attempt):
+    """Result of an IdempotencyStore call, with its conflicts as HTTP errors"""
+    try:
+        return await attempt
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+def game_response(game_result: GameResult) -> dict:
+    """Public view of a freshly played game"""
     return {
-        "name": nft_name,
-        "description": description,
-        "image": image_url,
-        "attributes": attributes,
-        "creator": "dropxtor",
-        "twitter": "@0xDropxtor",
-        "powered_by": "Zama FHE" if game_mode == "fhe" else "Standard RNG"
+        "success": True,
+        "game_id": game_result.id,
+        "dice_results": game_result.dice_results,
+        "total_score": game_result.total_score,
+        "nft_generated": game_result.nft_generated,
+        "nft_metadata": game_result.nft_metadata,
+        "network": "sepolia",
+        "game_mode": game_result.game_mode,
+        "fhe_enabled": game_result.game_mode == "fhe",
+        "environment_id": game_result.environment_id
     }
 
-# API Routes
-@app.get("/api/health")
-async def health_check():
-    return {"status": "healthy", "service": "zama-dice-game"}
+@app.get("/api/metrics")
+async def get_metrics():
+    """Prometheus metrics"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/api/play")
 async def play_game(request: Request, player_address: Optional[str] = None, num_dice: int = 2, 
                    game_mode: str = "standard", encrypted_data: Optional[Dict[str, Any]] = None,
                    environment_id: Optional[str] = None):
-    """Play a game of dice with optional FHE support"""
+    """Play a game of dice with optional FHE support
+
+    A retry sent with the same Idempotency-Key header gets the original
+    result back instead of playing again, and applies the rollups the
+    original attempt failed to.
+    """
+    idempotency_key = request.headers.get("Idempotency-Key")
+    request_fingerprint = None
+    if idempotency_key is not None:
+        if not 0 < len(idempotency_key) <= MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+        request_fingerprint = fingerprint(player_address, num_dice, game_mode, encrypted_data, environment_id)
+        # Retries of a finished play are answered before anything else runs
+        record = await idempotent(idempotency_store.lookup(idempotency_key, request_fingerprint))
+        if record is not None:
+            return await replay_play(idempotency_key, record)
+    claimed = False
+    saved = False
     try:
         # Rate limiting - stricter for production
-        if not rate_limit(request, max_requests=10, window_seconds=60):
-            raise HTTPException(status_code=429, detail="Rate limit exceeded. Maximum 10 requests per minute.")
+        if not await rate_limit(request, max_requests=PLAY_RATE_LIMIT, window_seconds=PLAY_RATE_WINDOW):
+            raise HTTPException(status_code=429, detail=f"Rate limit exceeded. Maximum {PLAY_RATE_LIMIT} requests per {PLAY_RATE_WINDOW} seconds.")
         
         # Validate input
-        if num_dice < 1 or num_dice > 6:
-            raise HTTPException(status_code=400, detail="Number of dice must be between 1 and 6")
+        validate_game_params(player_address, num_dice, environment_id)
         
-        if player_address:
-            # Strict wallet address validation
-            if not player_address.startswith("0x") or len(player_address) != 42:
-                raise HTTPException(status_code=400, detail="Invalid wallet address format")
-            
-            # Additional validation - only hexadecimal characters
-            try:
-                int(player_address[2:], 16)
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid wallet address format")
+        # Known before playing, so a claim abandoned after the save still leads to the game
+        game_id = str(uuid.uuid4())
+        if idempotency_key is not None:
+            record = await idempotent(idempotency_store.claim(idempotency_key, request_fingerprint, game_id))
+            if record is not None and record["status"] == "completed":
+                return await replay_play(idempotency_key, record)
+            claimed = True
+            if record is not None:
+                # Took over the claim of an attempt that stopped before completing it
+                game = await find_game(record["game_id"])
+                if game is not None:
+                    saved = True
+                    game_result = GameResult(**hydrate_game(dict(game)))
+                    response = game_response(game_result)
+                    await idempotency_store.complete(idempotency_key, request_fingerprint, response, PLAY_ROLLUPS)
+                    await apply_play_rollups(idempotency_key, game_result, PLAY_ROLLUPS)
+                    return FastJSONResponse(response, headers={"Idempotent-Replayed": "true"})
         
-        # Validate environment_id if provided
-        if environment_id and len(environment_id) > 100:
-            raise HTTPException(status_code=400, detail="Invalid environment ID")
-        
-        # Process game based on mode
+        dice_results = None
         if game_mode == "fhe" and encrypted_data:
-            print(f"🔐 Processing FHE game with environment ID: {environment_id}")
-            
-            # For now, we'll simulate FHE processing
-            # In a full implementation, you'd decrypt and verify the FHE data
-            dice_results = [
-                random.randint(1, 6) for _ in range(num_dice)
-            ]
-            
-            # Log FHE processing
-            print(f"🎲 FHE encrypted dice data received: {len(encrypted_data.get('dice1', []))} bytes")
-            print(f"🎯 Generated dice results: {dice_results}")
-            
-        else:
-            # Standard dice roll
-            print(f"🎲 Processing standard game")
-            dice_results = roll_dice(num_dice)
+            dice_results, = await verify_fhe_dice([(encrypted_data, num_dice)])
+        game_result = create_game(player_address, num_dice, game_mode, encrypted_data, environment_id, dice_results,
+                                  game_id=game_id)
         
-        total_score = calculate_score(dice_results)
+        # Save to database
+        await save_games([game_result])
+        saved = True
+        response = game_response(game_result)
+        if claimed:
+            # Completed before the rollups run, recording them as running. If this fails the
+            # rollups are skipped too: the retry that takes over the claim finds the game and
+            # applies them
+            await idempotency_store.complete(idempotency_key, request_fingerprint, response, PLAY_ROLLUPS)
+        try:
+            leaderboard_changed = await apply_play_rollups(idempotency_key, game_result, PLAY_ROLLUPS)
+        except Exception:
+            # The game is saved either way; subscribers still hear of it
+            await publish_games([game_result], False)
+            raise
+        await publish_games([game_result], leaderboard_changed)
+        return FastJSONResponse(response)
         
-        # Generate NFT metadata with game mode
-        nft_metadata = None
-        nft_generated = False
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    finally:
+        if claimed and not saved:
+            # No game was stored for the key, so a retry may play
+            await idempotency_store.release(idempotency_key)
+
+@app.post("/api/play/batch")
+async def play_batch(request: Request, batch: BatchPlayRequest):
+    """Play several games in one request, persisted with a single insert_many"""
+    try:
+        if not batch.games:
+            raise HTTPException(status_code=400, detail="At least one game is required")
+        # A batch over the rate limit could never be accepted
+        max_batch_size = min(MAX_BATCH_SIZE, PLAY_BATCH_RATE_LIMIT)
+        if len(batch.games) > max_batch_size:
+            raise HTTPException(status_code=400, detail=f"A batch can contain at most {max_batch_size} games")
         
-        if player_address:
-            nft_metadata = generate_nft_metadata(dice_results, player_address, game_mode)
-            nft_generated = True
+        # Batches count their games against a limit of their own
+        if not await rate_limit(request, max_requests=PLAY_BATCH_RATE_LIMIT, window_seconds=PLAY_RATE_WINDOW,
+                                cost=len(batch.games), scope="batch"):
+            raise HTTPException(status_code=429, detail=f"Rate limit exceeded. Maximum {PLAY_BATCH_RATE_LIMIT} "
+                                                        f"batch games per {PLAY_RATE_WINDOW} seconds.")
         
-        # Create game result
-        game_result = GameResult(
-            id=str(uuid.uuid4()),
-            player_address=player_address,
-            dice_results=dice_results,
-            total_score=total_score,
-            timestamp=datetime.now(),
-            nft_generated=nft_generated,
-            nft_metadata=nft_metadata,
-            game_mode=game_mode,
-            environment_id=environment_id,
-            fhe_data={"encrypted": bool(encrypted_data)} if encrypted_data else None
-        )
+        for index, spec in enumerate(batch.games):
+            try:
+                validate_game_params(spec.player_address, spec.num_dice, spec.environment_id)
+            except HTTPException as e:
+                raise HTTPException(status_code=e.status_code, detail=f"games[{index}]: {e.detail}")
+        
+        from dice_engine import roll_dice_batch, score_batch
+        
+        # Roll and score standard games in bulk, one array per dice count
+        rolled: Dict[int, tuple] = {}
+        by_num_dice: Dict[int, List[int]] = {}
+        for index, spec in enumerate(batch.games):
+            if not (spec.game_mode == "fhe" and spec.encrypted_data):
+                by_num_dice.setdefault(spec.num_dice, []).append(index)
+        for num_dice, indexes in by_num_dice.items():
+            dice = roll_dice_batch(len(indexes), num_dice)
+            for index, dice_results, total_score in zip(indexes, dice.tolist(), score_batch(dice).tolist()):
+                rolled[index] = (dice_results, total_score)
+        # FHE games are verified together, spread over the worker pool
+        fhe_indexes = [index for index in range(len(batch.games)) if index not in rolled]
+        if fhe_indexes:
+            verified = await verify_fhe_dice(
+                [(batch.games[index].encrypted_data, batch.games[index].num_dice) for index in fhe_indexes]
+            )
+            for index, dice_results in zip(fhe_indexes, verified):
+                rolled[index] = (dice_results, None)
+        
+        game_results = [
+            create_game(spec.player_address, spec.num_dice, spec.game_mode, spec.encrypted_data, spec.environment_id,
+                        *rolled.get(index, (None, None)))
+            for index, spec in enumerate(batch.games)
+        ]
         
         # Save to database
-        await games_collection.insert_one(game_result.dict())
+        await save_games(game_results)
+        leaderboard_changed, failures = await record_rollups(game_results)
+        await publish_games(game_results, leaderboard_changed)
+        if failures:
+            raise next(iter(failures.values()))
         
-        return {
-            "success": True,
-            "game_id": game_result.id,
-            "dice_results": dice_results,
-            "total_score": total_score,
-            "nft_generated": nft_generated,
-            "nft_metadata": nft_metadata,
-            "network": "sepolia",
-            "game_mode": game_mode,
-            "fhe_enabled": game_mode == "fhe",
-            "environment_id": environment_id
-        }
+        return FastJSONResponse({"success": True, "games": [game_response(game_result) for game_result in game_results]})
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.get("/api/stream")
+async def stream_events(request: Request, last_event_id: Optional[int] = None):
+    """Server-Sent Events feed of new games, stats deltas and leaderboard changes"""
+    header = request.headers.get("Last-Event-ID")
+    if header and header.isdigit():
+        last_event_id = int(header)
+    subscription = event_hub.subscribe(last_event_id)
+    return StreamingResponse(
+        event_hub.stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/games")
-async def get_games(limit: int = 10):
-    """Get recent games"""
+async def get_games(limit: int = 10, cursor: Optional[str] = None, fields: Optional[str] = None):
+    """Get recent games, newest first, paginated by (timestamp, id) cursor"""
     try:
-        games = await games_collection.find().sort("timestamp", -1).limit(limit).to_list(limit)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        try:
+            query = keyset_filter(cursor)
+            projection = parse_fields(fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        games = await games_collection.find(query, {**(projection or {}), "_id": 0}).sort(
+            [("timestamp", -1), ("id", -1)]
+        ).limit(limit).to_list(limit)
         # Convert MongoDB documents to JSON serializable format
-        for game in games:
-            if '_id' in game:
-                del game['_id']
-        return {"games": games}
+        if projection is None or "nft_metadata" in projection:
+            for game in games:
+                hydrate_game(game)
+        next_cursor = encode_cursor(games[-1]) if len(games) == limit else None
+        return FastJSONResponse({"games": games, "next_cursor": next_cursor})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/export/games")
+async def export_game_history(request: Request, format: str = "ndjson", gzip: bool = False,
+                              player: Optional[str] = None, game_mode: Optional[str] = None,
+                              since: Optional[datetime] = None, until: Optional[datetime] = None,
+                              batch_size: int = 1000):
+    """Stream the games matching the filters as NDJSON or CSV, oldest first"""
+    require_admin(request)
+    from export import EXPORT_FORMATS, MAX_BATCH_SIZE, MEDIA_TYPES, export_filter, export_games, gzip_chunks
+
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    chunks = export_games(games_collection, export_filter(player, game_mode, since, until), format,
+                          max(1, min(batch_size, MAX_BATCH_SIZE)), games_archive_collection)
+    filename, media_type = f"games.{format}", MEDIA_TYPES[format]
+    if gzip:
+        # Served as a .gz file rather than Content-Encoding, so clients keep it compressed
+        chunks = gzip_chunks(chunks)
+        filename, media_type = f"{filename}.gz", "application/gzip"
+    return StreamingResponse(chunks, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 @app.get("/api/game/{game_id}")
 async def get_game(game_id: str):
     """Get specific game by ID"""
     try:
-        game = await games_collection.find_one({"id": game_id})
+        game = await find_game(game_id)
         if not game:
             raise HTTPException(status_code=404, detail="Game not found")
-        # Convert MongoDB document to JSON serializable format
-        if '_id' in game:
-            del game['_id']
-        return game
+        return FastJSONResponse(hydrate_game(game))
     except HTTPException:
         raise
     except Exception as e:
@@ -280,6 +731,8 @@ async def get_game(game_id: str):
 @app.post("/api/user")
 async def create_user(wallet_address: str, username: str):
     """Create or update user profile"""
+    from pymongo.errors import DuplicateKeyError
+    
     try:
         # Validate input
         if not wallet_address.startswith("0x") or len(wallet_address) != 42:
@@ -295,60 +748,75 @@ async def create_user(wallet_address: str, username: str):
         )
         
         # Check if user exists
-        existing_user = await users_collection.find_one({"wallet_address": wallet_address})
+        existing_user = await users_collection.find_one({"wallet_address": wallet_address}, {"_id": 0})
         if existing_user:
-            # Update existing user
-            await users_collection.update_one(
-                {"wallet_address": wallet_address},
+            # A wallet that has only played so far is registered by its first username;
+            # conditional, so concurrent requests count it once
+            registered = await users_collection.update_one(
+                {"wallet_address": wallet_address, "username": None},
                 {"$set": {"username": username}}
             )
-            # Convert MongoDB document to JSON serializable format
-            if '_id' in existing_user:
-                del existing_user['_id']
-            return {"success": True, "message": "User updated", "user": existing_user}
+            if registered.modified_count:
+                await stats_counters.incr(total_users=1)
+                event_hub.publish("stats", {"total_users": 1})
+            else:
+                # Update existing user
+                await users_collection.update_one(
+                    {"wallet_address": wallet_address},
+                    {"$set": {"username": username}}
+                )
+            return FastJSONResponse({"success": True, "message": "User updated", "user": existing_user})
         else:
             # Create new user
-            await users_collection.insert_one(user.dict())
-            return {"success": True, "message": "User created", "user": user.dict()}
+            try:
+                await users_collection.insert_one(user.model_dump())
+            except DuplicateKeyError:
+                # Lost a race against a concurrent create for the same wallet
+                await users_collection.update_one(
+                    {"wallet_address": wallet_address},
+                    {"$set": {"username": username}}
+                )
+                existing_user = await users_collection.find_one({"wallet_address": wallet_address}, {"_id": 0})
+                return FastJSONResponse({"success": True, "message": "User updated", "user": existing_user})
+            await stats_counters.incr(total_users=1)
+            event_hub.publish("stats", {"total_users": 1})
+            return FastJSONResponse({"success": True, "message": "User created", "user": user.model_dump()})
             
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    finally:
+        users_cache.invalidate(wallet_address)
 
 @app.get("/api/user/{wallet_address}")
 async def get_user(wallet_address: str):
     """Get user profile"""
     try:
-        user = await users_collection.find_one({"wallet_address": wallet_address})
+        user = await users_cache.get_or_load(
+            wallet_address, lambda: users_collection.find_one({"wallet_address": wallet_address}, {"_id": 0})
+        )
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
-        # Convert MongoDB document to JSON serializable format
-        if '_id' in user:
-            del user['_id']
-        return user
+        return FastJSONResponse(user)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.get("/api/leaderboard")
-async def get_leaderboard(limit: int = 10):
-    """Get top players leaderboard"""
+async def get_leaderboard(limit: int = 10, window: str = "all", game_mode: Optional[str] = None):
+    """Get top players leaderboard, all-time or for the current day/week, optionally for one game mode"""
+    if window != "all" and window not in WINDOW_DAYS:
+        raise HTTPException(status_code=400, detail=f"window must be one of: all, {', '.join(WINDOW_DAYS)}")
+    if game_mode is not None and game_mode not in GAME_MODES:
+        raise HTTPException(status_code=400, detail=f"game_mode must be one of: {', '.join(GAME_MODES)}")
     try:
-        # Get top users by total score
-        pipeline = [
-            {"$group": {
-                "_id": "$player_address",
-                "total_score": {"$sum": "$total_score"},
-                "games_played": {"$sum": 1}
-            }},
-            {"$sort": {"total_score": -1}},
-            {"$limit": limit}
-        ]
-        
-        leaderboard = await games_collection.aggregate(pipeline).to_list(limit)
-        return {"leaderboard": leaderboard}
+        if window == "all" and game_mode is None:
+            ranking = await leaderboard.top(limit)
+        else:
+            ranking = await windowed_leaderboard.top(window, game_mode, limit)
+        return FastJSONResponse({"leaderboard": ranking, "window": window, "game_mode": game_mode})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -356,16 +824,41 @@ async def get_leaderboard(limit: int = 10):
 async def get_stats():
     """Get game statistics"""
     try:
-        total_games = await games_collection.count_documents({})
-        total_users = await users_collection.count_documents({})
-        total_nfts = await games_collection.count_documents({"nft_generated": True})
-        
-        return {
-            "total_games": total_games,
-            "total_users": total_users,
-            "total_nfts": total_nfts,
-            "network": "sepolia"
-        }
+        stats = await stats_counters.get()
+        return FastJSONResponse({**stats, "network": "sepolia"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/admin/stats/reconcile")
+async def reconcile_stats(request: Request):
+    """Recompute the stats counters from the collections"""
+    require_admin(request)
+    try:
+        return await stats_counters.reconcile()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/admin/archive")
+async def archive_games(request: Request, older_than_days: Optional[float] = None):
+    """Move games older than `older_than_days` (default ARCHIVE_AFTER_DAYS) to the archive"""
+    require_admin(request)
+    try:
+        return FastJSONResponse(await game_archive.archive(older_than_days))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/admin/indexes")
+async def get_index_report(request: Request, explain: bool = False):
+    """Report index usage and, optionally, the plans of the hot queries"""
+    require_admin(request)
+    from indexes import explain_hot_queries, index_usage
+    
+    try:
+        db = get_db()
+        report = {"usage": await index_usage(db)}
+        if explain:
+            report["explain"] = await explain_hot_queries(db)
+        return report
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
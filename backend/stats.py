@@ -0,0 +1,56 @@
+from typing import Dict
+
+from cache import TTLCache
+
+STATS_ID = "stats"
+COUNTER_FIELDS = ("total_games", "total_users", "total_nfts")
+
+
+class StatsCounters:
+    """Global game statistics kept as atomic counters
+
+    The write paths `$inc` a single counter document, and reads go through a
+    short TTL cache so a burst of `/api/stats` calls costs at most one
+    `find_one`. `reconcile` recomputes the counters from the real collections,
+    archived games included.
+    """
+
+    def __init__(self, collection, games_collection, users_collection, ttl_seconds: float = 2.0,
+                 archive_collection=None):
+        self.collection = collection
+        self.games_collection = games_collection
+        self.users_collection = users_collection
+        self.archive_collection = archive_collection
+        self._cache = TTLCache(ttl_seconds)
+
+    async def incr(self, total_games: int = 0, total_users: int = 0, total_nfts: int = 0) -> None:
+        deltas = {"total_games": total_games, "total_users": total_users, "total_nfts": total_nfts}
+        deltas = {field: value for field, value in deltas.items() if value}
+        if deltas:
+            await self.collection.update_one({"_id": STATS_ID}, {"$inc": deltas}, upsert=True)
+
+    async def get(self) -> Dict[str, int]:
+        return await self._cache.get_or_load(STATS_ID, self._load)
+
+    async def reconcile(self) -> Dict[str, Dict[str, int]]:
+        """Reset the counters to the real document counts, returning the drift"""
+        before = await self._load()
+        actual = {
+            "total_games": await self.games_collection.count_documents({}),
+            # Players get a user document for their aggregates; only profiles count as users
+            "total_users": await self.users_collection.count_documents({"username": {"$ne": None}}),
+            "total_nfts": await self.games_collection.count_documents({"nft_generated": True}),
+        }
+        if self.archive_collection is not None:
+            actual["total_games"] += await self.archive_collection.count_documents({})
+            actual["total_nfts"] += await self.archive_collection.count_documents({"nft_generated": True})
+        await self.collection.update_one({"_id": STATS_ID}, {"$set": actual}, upsert=True)
+        self._cache.invalidate(STATS_ID)
+        return {
+            "counters": actual,
+            "drift": {field: actual[field] - before[field] for field in COUNTER_FIELDS},
+        }
+
+    async def _load(self) -> Dict[str, int]:
+        doc = await self.collection.find_one({"_id": STATS_ID}) or {}
+        return {field: doc.get(field, 0) for field in COUNTER_FIELDS}
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional
+
+from logging_config import log_event
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class WriteBehindBuffer:
+    """Buffers inserts into a collection and flushes them in the background
+
+    `put` returns as soon as the document is queued; flusher tasks write the
+    queue with `insert_many`, a batch being sent when `max_batch` documents
+    are waiting or `flush_interval` seconds after its first document. When
+    `max_queue` documents are waiting, `put` blocks (backpressure). Queued
+    documents stay readable through `get` until they are written, and
+    `drain` flushes everything on shutdown.
+    """
+
+    def __init__(self, collection, max_batch: int = 500, flush_interval: float = 0.05,
+                 max_queue: int = 10_000, flushers: int = 1, max_retries: int = 3, key: str = "id"):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.flushers = flushers
+        self.max_retries = max_retries
+        self.key = key
+        self.pending: Dict[str, dict] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._batch_ready: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._draining = False
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._draining = False
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._batch_ready = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._flush_loop()) for _ in range(self.flushers)]
+
+    async def put(self, document: dict) -> None:
+        if not self._tasks:
+            await self.start()
+        self.pending[document[self.key]] = document
+        await self._queue.put(document)
+        if self._queue.qsize() >= self.max_batch:
+            self._batch_ready.set()
+
+    def get(self, key: str) -> Optional[dict]:
+        """A queued document that has not been written yet"""
+        document = self.pending.get(key)
+        return dict(document) if document is not None else None
+
+    async def drain(self) -> None:
+        """Write every queued document and stop the flushers"""
+        if not self._tasks:
+            return
+        self._draining = True
+        self._batch_ready.set()
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _flush_loop(self) -> None:
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            if not self._draining and queue.qsize() < self.max_batch - 1:
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._batch_ready.clear()
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                await self._write(batch)
+            finally:
+                for document in batch:
+                    self.pending.pop(document[self.key], None)
+                    queue.task_done()
+
+    async def _write(self, batch: List[dict]) -> None:
+        from pymongo.errors import BulkWriteError
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.collection.insert_many(batch, ordered=False)
+                return
+            except BulkWriteError as e:
+                # Documents already written by an earlier attempt are fine
+                failed = {
+                    error["index"] for error in e.details.get("writeErrors", [])
+                    if error.get("code") != DUPLICATE_KEY_ERROR
+                }
+                batch = [document for index, document in enumerate(batch) if index in failed]
+                if not batch:
+                    return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    log_event("write_behind_dropped", logging.ERROR, collection=self.collection.name,
+                              documents=len(batch), error=str(e))
+                    return
+            await asyncio.sleep(0.1 * 2 ** attempt)
+        log_event("write_behind_dropped", logging.ERROR, collection=self.collection.name,
+                  documents=len(batch), error="write errors after retries")
+
+
+def create_write_behind_buffer(collection) -> Optional[WriteBehindBuffer]:
+    """Buffer for `collection` when GAMES_WRITE_BEHIND=1, otherwise None"""
+    if os.environ.get('GAMES_WRITE_BEHIND', '0') != '1':
+        return None
+    return WriteBehindBuffer(
+        collection,
+        max_batch=int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', '500')),
+        flush_interval=int(os.environ.get('WRITE_BEHIND_FLUSH_MS', '50')) / 1000,
+        max_queue=int(os.environ.get('WRITE_BEHIND_QUEUE_SIZE', '10000')),
+    )
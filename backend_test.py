@@ -1,14 +1,12 @@
 import requests
-import unittest
-import json
+import os
 import sys
-import time
-import concurrent.futures
 from datetime import datetime
 
 class ZamaDiceAPITester:
-    def __init__(self, base_url="https://01e1466d-b420-4c40-938e-50030a4deb08.preview.emergentagent.com"):
-        self.base_url = base_url
+    def __init__(self, base_url=None):
+        # Performance is measured by benchmarks/load_test.py, not here
+        self.base_url = base_url or os.environ.get("BACKEND_URL", "http://localhost:8001")
         self.tests_run = 0
         self.tests_passed = 0
         self.game_id = None
@@ -222,51 +220,6 @@ class ZamaDiceAPITester:
         
         return True  # Return True as we're testing error cases
         
-    def test_performance(self):
-        """Test API performance"""
-        print("\n⚡ Testing API Performance")
-        
-        # Test response time for health endpoint
-        start_time = time.time()
-        success, _ = self.run_test("Health Check Performance", "GET", "/api/health", 200)
-        health_time = time.time() - start_time
-        print(f"Health endpoint response time: {health_time:.4f} seconds")
-        
-        # Test response time for play endpoint
-        start_time = time.time()
-        success, _ = self.run_test(
-            "Play Game Performance", 
-            "POST", 
-            "/api/play", 
-            200, 
-            data={"num_dice": 2}
-        )
-        play_time = time.time() - start_time
-        print(f"Play endpoint response time: {play_time:.4f} seconds")
-        
-        # Test response time for games endpoint
-        start_time = time.time()
-        success, _ = self.run_test("Get Games Performance", "GET", "/api/games", 200)
-        games_time = time.time() - start_time
-        print(f"Games endpoint response time: {games_time:.4f} seconds")
-        
-        # Test concurrent requests
-        print("\nTesting concurrent requests...")
-        num_requests = 10
-        start_time = time.time()
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            futures = [executor.submit(self._concurrent_play_request) for _ in range(num_requests)]
-            results = [future.result() for future in concurrent.futures.as_completed(futures)]
-        
-        total_time = time.time() - start_time
-        success_count = sum(1 for result in results if result)
-        
-        print(f"Completed {num_requests} concurrent requests in {total_time:.4f} seconds")
-        print(f"Success rate: {success_count}/{num_requests} ({success_count/num_requests*100:.1f}%)")
-        
-        return success_count == num_requests
-    
     def test_leaderboard(self):
         """Test getting the leaderboard"""
         success, response = self.run_test(
@@ -282,18 +235,6 @@ class ZamaDiceAPITester:
         
         return success
         
-    def _concurrent_play_request(self):
-        """Helper method for concurrent testing"""
-        try:
-            response = requests.post(
-                f"{self.base_url}/api/play",
-                json={"num_dice": 2},
-                headers={'Content-Type': 'application/json'}
-            )
-            return response.status_code == 200
-        except Exception:
-            return False
-
     def run_all_tests(self):
         """Run all API tests"""
         print("🚀 Starting Zama Dice API Tests")
@@ -309,8 +250,7 @@ class ZamaDiceAPITester:
             self.test_create_user,
             self.test_get_user,
             self.test_leaderboard,
-            self.test_edge_cases,
-            self.test_performance
+            self.test_edge_cases
         ]
         
         for test in tests:
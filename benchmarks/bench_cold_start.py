@@ -0,0 +1,60 @@
+"""Benchmark: cold-start import time of the backend
+
+Imports `server` in fresh interpreters under `python -X importtime` and
+reports the median total import time, the slowest imports and which heavy
+modules were loaded. Run it on two commits to compare cold starts.
+
+Usage: python benchmarks/bench_cold_start.py [--runs 7] [--module server]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+HEAVY_MODULES = ("numpy", "pandas", "boto3", "motor", "pymongo", "dice_engine")
+
+
+def import_times(module: str) -> Dict[str, Tuple[int, int]]:
+    """(self, cumulative) import time in microseconds of every module imported by `module`"""
+    env = {**os.environ, "LOG_LEVEL": "WARNING"}
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main(runs: int, module: str, top: int) -> None:
+    samples: List[Dict[str, Tuple[int, int]]] = [import_times(module) for _ in range(runs)]
+    totals = [sum(self_us for self_us, _ in times.values()) for times in samples]
+    print(f"import {module}: median {statistics.median(totals) / 1000:.1f} ms over {runs} runs "
+          f"(min {min(totals) / 1000:.1f}, max {max(totals) / 1000:.1f})")
+
+    # Top-level packages by cumulative time, from the median run
+    times = sorted(samples, key=lambda s: sum(t for t, _ in s.values()))[runs // 2]
+    packages: Dict[str, int] = {}
+    for name, (self_us, _) in times.items():
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    print(f"\n{'package':<24} {'ms':>8}")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"{package:<24} {self_us / 1000:>8.1f}")
+
+    loaded = [name for name in HEAVY_MODULES if name in times]
+    print(f"\nheavy modules loaded: {', '.join(loaded) or 'none'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=7, help="Fresh interpreters to sample")
+    parser.add_argument("--module", default="server", help="Module to import from backend/")
+    parser.add_argument("--top", type=int, default=12, help="Packages to list")
+    args = parser.parse_args()
+    main(args.runs, args.module, args.top)
@@ -0,0 +1,67 @@
+"""Benchmark: FHE verification inline on the event loop against the worker pool
+
+Verifies a batch of simulated ciphertexts while a ticker measures how late
+the event loop wakes up; inline verification stalls it for the whole batch.
+
+Usage: python benchmarks/bench_fhe_verifier.py [--payloads 64] [--work-factor 20000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from fhe_worker import FHEVerifier, ciphertext, verify_ciphertexts  # noqa: E402
+
+
+async def measure(verify, payloads):
+    lags = []
+
+    async def ticker():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+
+    ticking = asyncio.ensure_future(ticker())
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    await verify(payloads)
+    elapsed = time.perf_counter() - start
+    # Let a tick delayed by a blocked loop record its lag
+    await asyncio.sleep(0.01)
+    ticking.cancel()
+    return elapsed, max(lags) * 1000
+
+
+async def main(args):
+    payloads = [({"dice1": list(os.urandom(32)), "dice2": list(os.urandom(32))}, 2) for _ in range(args.payloads)]
+
+    async def inline(payloads):
+        jobs = [(ciphertext(data), os.urandom(16), num_dice) for data, num_dice in payloads]
+        return verify_ciphertexts(jobs, args.work_factor)
+
+    print(f"{'mode':<8} {'seconds':>8} {'verifications/s':>16} {'max loop lag ms':>16}")
+    verifiers = {
+        name: FHEVerifier(work_factor=args.work_factor, max_pending=args.payloads, timeout_seconds=600,
+                          use_threads=name == "thread")
+        for name in ("process", "thread")
+    }
+    try:
+        for name, verify in [("inline", inline)] + [(name, v.verify) for name, v in verifiers.items()]:
+            if name != "inline":
+                await verify(payloads[:1])  # start the pool
+            elapsed, lag = await measure(verify, payloads)
+            print(f"{name:<8} {elapsed:>8.3f} {args.payloads / elapsed:>16.1f} {lag:>16.1f}")
+    finally:
+        for verifier in verifiers.values():
+            verifier.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payloads", type=int, default=64)
+    parser.add_argument("--work-factor", type=int, default=20000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,50 @@
+"""Microbenchmark: per-request cost of the rate limiter as the number of IPs grows
+
+Usage: python benchmarks/bench_rate_limiter.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from rate_limiter import InMemoryRateLimiter  # noqa: E402
+
+
+def legacy_rate_limit(store, client_ip, current_time, max_requests=10, window_seconds=60):
+    """The original timestamp-list limiter, kept here for comparison"""
+    if client_ip in store:
+        store[client_ip] = [t for t in store[client_ip] if current_time - t < window_seconds]
+    else:
+        store[client_ip] = []
+    if len(store[client_ip]) >= max_requests:
+        return False
+    store[client_ip].append(current_time)
+    return True
+
+
+def bench(num_ips, requests=200_000, span_seconds=3600):
+    step = span_seconds / requests
+    ips = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(num_ips)]
+
+    limiter = InMemoryRateLimiter(max_requests=10, window_seconds=60, max_keys=1_000_000)
+    now = time.time()
+    start = time.perf_counter()
+    for i in range(requests):
+        limiter.hit_sync(ips[i % num_ips], now=now + i * step)
+    engine_ns = (time.perf_counter() - start) / requests * 1e9
+
+    store = {}
+    start = time.perf_counter()
+    for i in range(requests):
+        legacy_rate_limit(store, ips[i % num_ips], now + i * step)
+    legacy_ns = (time.perf_counter() - start) / requests * 1e9
+
+    return engine_ns, legacy_ns, len(limiter), len(store)
+
+
+if __name__ == "__main__":
+    print(f"{'ips':>10} {'engine ns/req':>14} {'legacy ns/req':>14} {'engine keys':>12} {'legacy keys':>12}")
+    for num_ips in (10, 1_000, 100_000, 1_000_000):
+        engine_ns, legacy_ns, engine_keys, legacy_keys = bench(num_ips)
+        print(f"{num_ips:>10} {engine_ns:>14.0f} {legacy_ns:>14.0f} {engine_keys:>12} {legacy_keys:>12}")
@@ -0,0 +1,36 @@
+"""Benchmark: precomputed score/rarity table against calculate_score/determine_nft_rarity
+
+Usage: python benchmarks/bench_score_table.py
+"""
+import os
+import random
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import score_table  # noqa: E402
+from scoring import calculate_score, determine_nft_rarity  # noqa: E402
+
+
+def per_call_ns(func, samples, number=200):
+    return timeit.timeit(lambda: [func(dice) for dice in samples], number=number) / number / len(samples) * 1e9
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    score_table.get_table()
+    print(f"table build: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    rng = random.Random(0)
+    print(f"{'dice':>5} {'functions ns':>13} {'table ns':>9} {'speedup':>8}")
+    for n_dice in range(1, 7):
+        samples = [[rng.randint(1, 6) for _ in range(n_dice)] for _ in range(1000)]
+        functions = per_call_ns(
+            lambda dice: (calculate_score(dice), determine_nft_rarity(dice, "fhe")), samples
+        )
+        table = per_call_ns(
+            lambda dice: (score_table.score(dice), score_table.rarity(dice, "fhe")), samples
+        )
+        print(f"{n_dice:>5} {functions:>13.0f} {table:>9.0f} {functions / table:>7.1f}x")
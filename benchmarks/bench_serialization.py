@@ -0,0 +1,123 @@
+"""Benchmark: requests/second of the /api/games and /api/play response paths
+
+Compares the previous path (validated GameResult, .dict(), deleting `_id`
+in Python, FastAPI's jsonable_encoder) with the current one (model_construct,
+server-side `_id` projection, FastJSONResponse). Database calls are left
+out so only the per-request CPU work is measured.
+
+Usage: python benchmarks/bench_serialization.py
+"""
+import asyncio
+import os
+import sys
+import time
+import uuid
+import warnings
+from datetime import datetime
+
+import httpx
+from fastapi import FastAPI
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import server  # noqa: E402
+from scoring import calculate_score  # noqa: E402
+from serialization import FastJSONResponse  # noqa: E402
+
+PLAYER = "0x742d35Cc6634C0532925a3b844Bc454e4438f44e"
+
+
+def stored_games(n=10):
+    """Documents as /api/games used to load them: full, with an `_id`"""
+    games = []
+    for _ in range(n):
+        game = server.create_game(PLAYER, 2, "standard", None, None)
+        document = game.model_dump()
+        document["_id"] = uuid.uuid4().bytes
+        games.append(document)
+    return games
+
+
+def build_before_app(games):
+    app = FastAPI()
+
+    @app.get("/api/games")
+    async def get_games():
+        page = [dict(game) for game in games]
+        for game in page:
+            if '_id' in game:
+                del game['_id']
+        return {"games": page}
+
+    @app.post("/api/play")
+    async def play_game():
+        dice_results = server.roll_dice(2)
+        total_score = calculate_score(dice_results)
+        nft_metadata = server.generate_nft_metadata(dice_results, PLAYER)
+        game_result = server.GameResult(
+            id=str(uuid.uuid4()), player_address=PLAYER, dice_results=dice_results,
+            total_score=total_score, timestamp=datetime.now(), nft_generated=True,
+            nft_metadata=nft_metadata
+        )
+        game_result.dict()
+        return {"success": True, "game_id": game_result.id, "dice_results": dice_results,
+                "total_score": total_score, "nft_generated": True, "nft_metadata": nft_metadata,
+                "network": "sepolia", "game_mode": "standard", "fhe_enabled": False,
+                "environment_id": None}
+
+    return app
+
+
+def build_after_app(games):
+    app = FastAPI()
+    projected = [{k: v for k, v in game.items() if k != "_id"} for game in games]
+
+    @app.get("/api/games")
+    async def get_games():
+        page = [dict(game) for game in projected]
+        return FastJSONResponse({"games": page, "next_cursor": None})
+
+    @app.post("/api/play")
+    async def play_game():
+        game_result = server.create_game(PLAYER, 2, "standard", None, None)
+        server.game_document(game_result)
+        server.nft_document(game_result)
+        return FastJSONResponse(server.game_response(game_result))
+
+    return app
+
+
+async def requests_per_second(app, method, path, total=3000, concurrency=20):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = total
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                response = await client.request(method, path)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return total / (time.perf_counter() - start)
+
+
+async def main():
+    games = stored_games()
+    apps = {"before": build_before_app(games), "after": build_after_app(games)}
+    results = {}
+    for method, path in (("GET", "/api/games"), ("POST", "/api/play")):
+        results[path] = {name: await requests_per_second(app, method, path) for name, app in apps.items()}
+    return results
+
+
+if __name__ == "__main__":
+    # The "before" path calls the deprecated .dict() on purpose
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        results = asyncio.run(main())
+    print(f"{'endpoint':<12} {'before rps':>11} {'after rps':>10} {'change':>8}")
+    for path, rps in results.items():
+        print(f"{path:<12} {rps['before']:>11.0f} {rps['after']:>10.0f} {rps['after'] / rps['before'] - 1:>+8.0%}")
@@ -0,0 +1,204 @@
+"""Load-testing and benchmark suite for the backend API
+
+Drives concurrent async clients against the play, games, leaderboard, stats
+and user endpoints and reports throughput and p50/p95/p99 latency per
+scenario. By default the app runs in-process (ASGI transport, no network)
+against the database at MONGO_URL, a local mongod by default; pass
+--storage memory to use the in-memory engine instead (no MongoDB needed,
+hermetic and repeatable), or --base-url to target a running server.
+
+Results are written as JSON so runs can be compared between commits:
+
+    python benchmarks/load_test.py --output results/before.json
+    python benchmarks/load_test.py --output results/after.json --compare results/before.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+PLAYERS = [f"0x{i:040x}" for i in range(1, 65)]
+
+
+def scenarios(batch_size: int, game_ids: List[str]) -> Dict[str, Callable[[httpx.AsyncClient, int], object]]:
+    """Request factories per scenario; each receives the client and a request counter"""
+    return {
+        "play": lambda client, i: client.post(
+            "/api/play", params={"player_address": PLAYERS[i % len(PLAYERS)], "num_dice": 2}
+        ),
+        "play_batch": lambda client, i: client.post("/api/play/batch", json={"games": [
+            {"player_address": PLAYERS[(i + j) % len(PLAYERS)], "num_dice": 2} for j in range(batch_size)
+        ]}),
+        "games": lambda client, i: client.get("/api/games", params={"limit": 10}),
+        "games_history_widget": lambda client, i: client.get(
+            "/api/games", params={"limit": 5, "fields": "player_address,dice_results,total_score,nft_generated"}
+        ),
+        "game": lambda client, i: client.get(f"/api/game/{game_ids[i % len(game_ids)]}"),
+        "leaderboard": lambda client, i: client.get("/api/leaderboard", params={"limit": 10}),
+        "stats": lambda client, i: client.get("/api/stats"),
+        "user": lambda client, i: client.get(f"/api/user/{PLAYERS[i % len(PLAYERS)]}"),
+    }
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(client: httpx.AsyncClient, request: Callable, requests: int, concurrency: int,
+                       warmup: int) -> dict:
+    for i in range(warmup):
+        await request(client, i)
+
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await request(client, i)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 4),
+        "rps": round(requests / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+async def seed(client: httpx.AsyncClient) -> List[str]:
+    """Make sure the read scenarios have users and games to read"""
+    for i, player in enumerate(PLAYERS):
+        await client.post("/api/user", params={"wallet_address": player, "username": f"bench{i:03d}"})
+    response = await client.post("/api/play/batch", json={"games": [
+        {"player_address": player, "num_dice": 2} for player in PLAYERS
+    ]})
+    response.raise_for_status()
+    return [game["game_id"] for game in response.json()["games"]]
+
+
+@contextlib.asynccontextmanager
+async def open_client(base_url: Optional[str], storage: str = "mongo"):
+    if base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+            yield client
+        return
+
+    # Benchmarks must not be throttled by the per-IP play limit, nor log every request
+    os.environ.setdefault("PLAY_RATE_LIMIT", "1000000000")
+    os.environ.setdefault("PLAY_BATCH_RATE_LIMIT", "1000000000")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["STORAGE_BACKEND"] = storage
+    sys.path.insert(0, BACKEND_DIR)
+    import server
+    await server.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=30) as client:
+            yield client
+    finally:
+        await server.app.router.shutdown()
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: Dict[str, dict], baseline: Optional[Dict[str, dict]] = None) -> None:
+    header = f"{'scenario':<22} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+    if baseline:
+        header += f" {'rps vs base':>12} {'p99 vs base':>12}"
+    print(header)
+    for name, result in results.items():
+        line = (f"{name:<22} {result['rps']:>9.1f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+                f"{result['p99_ms']:>8.2f} {result['errors']:>7}")
+        base = (baseline or {}).get(name)
+        if base:
+            line += (f" {result['rps'] / base['rps'] - 1:>+12.1%}"
+                     f" {result['p99_ms'] / base['p99_ms'] - 1 if base['p99_ms'] else 0:>+12.1%}")
+        print(line)
+
+
+async def main(args) -> dict:
+    selected = args.scenarios or list(scenarios(args.batch_size, []))
+    unknown = set(selected) - set(scenarios(args.batch_size, []))
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = {}
+    async with open_client(args.base_url, args.storage) as client:
+        available = scenarios(args.batch_size, await seed(client))
+        for name in selected:
+            results[name] = await run_scenario(
+                client, available[name], args.requests, args.concurrency, args.warmup
+            )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="Target a running server instead of the in-process app")
+    parser.add_argument("--storage", choices=("mongo", "memory"), default="mongo",
+                        help="Storage backend of the in-process app")
+    parser.add_argument("--scenarios", nargs="*", help="Scenarios to run (default: all)")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--warmup", type=int, default=50, help="Unmeasured requests per scenario")
+    parser.add_argument("--batch-size", type=int, default=20, help="Games per play_batch request")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Previous JSON results to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["scenarios"]
+    print_report(results, baseline)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({
+                "commit": git_commit(),
+                "date": datetime.now(timezone.utc).isoformat(),
+                "target": args.base_url or f"in-process ({args.storage})",
+                "python": platform.python_version(),
+                "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+                "scenarios": results,
+            }, f, indent=2)
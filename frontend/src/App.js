@@ -1,6 +1,8 @@
 import React, { useState, useEffect } from 'react';
 import './App.css';
 
+const POLL_INTERVAL_MS = 15000;
+
 function App() {
   const [isConnected, setIsConnected] = useState(false);
   const [walletAddress, setWalletAddress] = useState('');
@@ -18,6 +20,9 @@ function App() {
   const [zamaError, setZamaError] = useState('');
 
   const backendUrl = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
+  // 'stream' keeps stats and history live over /api/stream; 'poll' refetches them
+  // periodically instead, for serverless deployments that cannot hold a stream open
+  const liveUpdates = process.env.REACT_APP_LIVE_UPDATES || 'stream';
   const environmentId = 'ead32e7f-5090-4060-9b60-97f68caa3cf8';
 
   useEffect(() => {
@@ -27,6 +32,35 @@ function App() {
     initializeZama();
   }, []);
 
+  useEffect(() => {
+    if (liveUpdates === 'poll' || !window.EventSource) {
+      const timer = setInterval(() => {
+        if (!document.hidden) {
+          fetchStats();
+          fetchGameHistory();
+        }
+      }, POLL_INTERVAL_MS);
+      return () => clearInterval(timer);
+    }
+    // Live feed of every game, this player's included, and the stats deltas
+    const source = new EventSource(`${backendUrl}/api/stream`);
+    source.addEventListener('game', (event) => {
+      const game = JSON.parse(event.data);
+      setGameHistory((history) => [game, ...history.filter((g) => g.id !== game.id)].slice(0, 5));
+    });
+    source.addEventListener('stats', (event) => {
+      const delta = JSON.parse(event.data);
+      setStats((current) => {
+        const next = { ...current };
+        Object.entries(delta).forEach(([key, value]) => {
+          next[key] = (next[key] || 0) + value;
+        });
+        return next;
+      });
+    });
+    return () => source.close();
+  }, []);
+
   const initializeZama = async () => {
     try {
       console.log('🔄 Attempting to initialize Zama FHE...');
@@ -193,9 +227,15 @@ function App() {
         setShowNFTModal(true);
       }
       
-      // Update stats and history without blocking
-      fetchStats();
-      fetchGameHistory();
+      // Shown right away; the stream or the next poll brings the stats along
+      const game = {
+        id: result.game_id,
+        player_address: isConnected ? walletAddress : null,
+        dice_results: result.dice_results,
+        total_score: result.total_score,
+        nft_generated: result.nft_generated,
+      };
+      setGameHistory((history) => [game, ...history.filter((g) => g.id !== game.id)].slice(0, 5));
     } catch (error) {
       console.error('Error playing game:', error);
       setError(error.message || 'Failed to play game. Please try again.');
@@ -224,7 +264,7 @@ function App() {
   const fetchGameHistory = async () => {
     setIsLoadingHistory(true);
     try {
-      const response = await fetch(`${backendUrl}/api/games?limit=5`);
+      const response = await fetch(`${backendUrl}/api/games?limit=5&fields=player_address,dice_results,total_score,nft_generated`);
       if (!response.ok) {
         throw new Error('Failed to fetch game history');
       }
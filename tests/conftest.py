@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The backend modules are imported flat, the same way uvicorn loads `server:app`
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+# Tests run against the in-memory storage engine, no MongoDB needed
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+# Every API test plays from the same client address
+os.environ.setdefault("PLAY_RATE_LIMIT", "1000")
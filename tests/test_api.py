@@ -0,0 +1,222 @@
+import asyncio
+import json
+from datetime import timedelta
+
+import httpx
+
+from idempotency import utc_now
+import server
+
+PLAYER = "0x" + "ab" * 20
+
+
+def call(*requests):
+    """Run requests against the app in-process, on the in-memory storage engine"""
+    async def run():
+        await server.app.router.startup()
+        try:
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return [await request(client) for request in requests]
+        finally:
+            await server.app.router.shutdown()
+    return asyncio.run(run())
+
+
+def test_play_updates_game_history_player_and_stats():
+    # Counters read directly: /api/stats is cached for a couple of seconds
+    before = asyncio.run(server.stats_counters._load())
+    played, game_page, user, ranking = call(
+        lambda client: client.post("/api/play/batch", json={"games": [
+            {"player_address": PLAYER, "num_dice": 3}, {"player_address": PLAYER, "game_mode": "fhe"},
+        ]}),
+        lambda client: client.get("/api/games", params={"limit": 2}),
+        lambda client: client.get(f"/api/user/{PLAYER}"),
+        lambda client: client.get("/api/leaderboard", params={"limit": 100}),
+    )
+    after = asyncio.run(server.stats_counters._load())
+    games = played.json()["games"]
+    assert [game["id"] for game in game_page.json()["games"]] == [games[1]["game_id"], games[0]["game_id"]]
+
+    user = user.json()
+    assert user["games_played"] == 2
+    assert user["total_score"] == sum(game["total_score"] for game in games)
+    assert user["modes"]["fhe"]["games_played"] == 1
+    # The all-time leaderboard ranks the same totals
+    entry = next(entry for entry in ranking.json()["leaderboard"] if entry["_id"] == PLAYER)
+    assert (entry["total_score"], entry["games_played"]) == (user["total_score"], user["games_played"])
+
+    # Playing does not register a user
+    delta = {field: after[field] - before[field] for field in ("total_games", "total_users")}
+    assert delta == {"total_games": 2, "total_users": 0}
+
+
+def test_registering_a_player_counts_one_user():
+    player = "0x" + "ef" * 20
+    before = asyncio.run(server.stats_counters._load())
+    call(
+        lambda client: client.post("/api/play", params={"player_address": player}),
+        lambda client: client.post("/api/user", params={"wallet_address": player, "username": "first"}),
+        lambda client: client.post("/api/user", params={"wallet_address": player, "username": "second"}),
+    )
+    after = asyncio.run(server.stats_counters._load())
+    assert after["total_users"] - before["total_users"] == 1
+    reconciled = asyncio.run(server.stats_counters.reconcile())
+    assert reconciled["counters"]["total_users"] == asyncio.run(
+        server.users_collection.count_documents({"username": {"$ne": None}})
+    )
+
+
+def test_get_game_and_readiness():
+    played, = call(lambda client: client.post("/api/play", params={"num_dice": 2}))
+    game_id = played.json()["game_id"]
+    game, missing, health = call(
+        lambda client: client.get(f"/api/game/{game_id}"),
+        lambda client: client.get("/api/game/unknown"),
+        lambda client: client.get("/api/health", params={"ready": "true"}),
+    )
+    assert game.json()["dice_results"] == played.json()["dice_results"]
+    assert missing.status_code == 404
+    assert health.json()["database"]["backend"] == "memory"
+    assert health.json()["database"]["pool"] == {"servers": 0}
+
+
+def test_windowed_leaderboards_per_mode():
+    player = "0x" + "cd" * 20
+    played, weekly, all_time, invalid = call(
+        lambda client: client.post("/api/play/batch", json={"games": [
+            {"player_address": player, "game_mode": "fhe"}, {"player_address": player, "game_mode": "fhe"},
+        ]}),
+        lambda client: client.get("/api/leaderboard", params={"window": "week", "game_mode": "fhe", "limit": 100}),
+        lambda client: client.get("/api/leaderboard", params={"window": "all", "game_mode": "fhe", "limit": 100}),
+        lambda client: client.get("/api/leaderboard", params={"window": "year"}),
+    )
+    total_score = sum(game["total_score"] for game in played.json()["games"])
+    for ranking in (weekly, all_time):
+        entry = next(entry for entry in ranking.json()["leaderboard"] if entry["_id"] == player)
+        assert entry == {"_id": player, "total_score": total_score, "games_played": 2}
+    assert invalid.status_code == 400
+
+
+def test_export_requires_admin_token(monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_TOKEN", "secret")
+    denied, exported = call(
+        lambda client: client.get("/api/export/games"),
+        lambda client: client.get("/api/export/games", params={"player": PLAYER},
+                                  headers={"X-Admin-Token": "secret"}),
+    )
+    assert denied.status_code == 403
+    assert exported.headers["content-type"] == "application/x-ndjson"
+    assert all(json.loads(line)["player_address"] == PLAYER for line in exported.text.splitlines())
+
+
+def test_batches_larger_than_the_play_limit_are_accepted(monkeypatch):
+    monkeypatch.setattr(server, "PLAY_RATE_LIMIT", 2)
+    monkeypatch.setattr(server, "PLAY_BATCH_RATE_LIMIT", 8)
+    batch = {"games": [{"num_dice": 2}] * 5}
+    first, second, oversized, single = call(
+        lambda client: client.post("/api/play/batch", json=batch),
+        lambda client: client.post("/api/play/batch", json=batch),
+        lambda client: client.post("/api/play/batch", json={"games": [{"num_dice": 2}] * 9}),
+        lambda client: client.post("/api/play"),
+    )
+    # Five games are over the single play limit but within the batch one, which counts games
+    assert first.status_code == 200 and len(first.json()["games"]) == 5
+    assert second.status_code == 429
+    assert oversized.status_code == 400
+    # Batches are not counted against single plays
+    assert single.status_code == 200
+
+
+def test_fhe_plays_verify_the_ciphertext(monkeypatch):
+    monkeypatch.setattr(server.fhe_verifier, "work_factor", 10)
+    encrypted = {"dice1": [1] * 32, "dice2": [2] * 32, "mode": "fhe"}
+    single, batch, invalid = call(
+        lambda client: client.post("/api/play", params={"game_mode": "fhe"}, json=encrypted),
+        lambda client: client.post("/api/play/batch", json={"games": [
+            {"game_mode": "fhe", "encrypted_data": encrypted}, {"num_dice": 3},
+        ]}),
+        lambda client: client.post("/api/play", params={"game_mode": "fhe"}, json={"dice1": [300]}),
+    )
+    assert single.json()["game_mode"] == "fhe" and len(single.json()["dice_results"]) == 2
+    assert [len(game["dice_results"]) for game in batch.json()["games"]] == [2, 3]
+    assert invalid.status_code == 400
+
+
+def test_play_retries_with_an_idempotency_key_are_replayed():
+    before = asyncio.run(server.stats_counters._load())
+    headers = {"Idempotency-Key": "retry-test"}
+    params = {"player_address": PLAYER}
+    first, retry, reused = call(
+        lambda client: client.post("/api/play", params=params, headers=headers),
+        lambda client: client.post("/api/play", params=params, headers=headers),
+        lambda client: client.post("/api/play", params={"num_dice": 3}, headers=headers),
+    )
+    after = asyncio.run(server.stats_counters._load())
+    assert retry.json() == first.json() and retry.headers["Idempotent-Replayed"] == "true"
+    assert reused.status_code == 422
+    assert after["total_games"] - before["total_games"] == 1
+
+
+def test_play_retry_applies_the_rollup_that_failed(monkeypatch):
+    player = "0x" + "12" * 20
+    incr = server.stats_counters.incr
+    calls = []
+
+    async def failing_once(**counters):
+        calls.append(counters)
+        if len(calls) == 1:
+            raise RuntimeError("counters unavailable")
+        await incr(**counters)
+
+    monkeypatch.setattr(server.stats_counters, "incr", failing_once)
+    before = asyncio.run(server.stats_counters._load())
+    headers = {"Idempotency-Key": "rollup-failure-test"}
+    failed, retry, again = call(
+        lambda client: client.post("/api/play", params={"player_address": player}, headers=headers),
+        lambda client: client.post("/api/play", params={"player_address": player}, headers=headers),
+        lambda client: client.post("/api/play", params={"player_address": player}, headers=headers),
+    )
+    after = asyncio.run(server.stats_counters._load())
+    # The game was saved before the rollup failed: the retry gets it back and applies only the failed rollup
+    assert failed.status_code == 500
+    assert retry.status_code == 200 and retry.headers["Idempotent-Replayed"] == "true"
+    assert again.json() == retry.json() and len(calls) == 2
+    assert after["total_games"] - before["total_games"] == 1
+    assert asyncio.run(server.games_collection.count_documents({"player_address": player})) == 1
+    assert asyncio.run(server.games_collection.find_one({"player_address": player}))["id"] == retry.json()["game_id"]
+    assert asyncio.run(server.users_collection.find_one({"wallet_address": player}))["games_played"] == 1
+
+
+def test_play_retry_recovers_the_game_of_an_uncompleted_key(monkeypatch):
+    player = "0x" + "34" * 20
+    complete = server.idempotency_store.complete
+    calls = []
+
+    async def failing_once(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("idempotency store unavailable")
+        return await complete(*args, **kwargs)
+
+    async def expire_claim(client):
+        await server.idempotency_keys_collection.update_one(
+            {"_id": "complete-failure-test"}, {"$set": {"expires_at": utc_now() - timedelta(seconds=1)}}
+        )
+
+    monkeypatch.setattr(server.idempotency_store, "complete", failing_once)
+    before = asyncio.run(server.stats_counters._load())
+    headers = {"Idempotency-Key": "complete-failure-test"}
+    failed, _, retry = call(
+        lambda client: client.post("/api/play", params={"player_address": player}, headers=headers),
+        expire_claim,
+        lambda client: client.post("/api/play", params={"player_address": player}, headers=headers),
+    )
+    after = asyncio.run(server.stats_counters._load())
+    # The rollups were skipped with the failed complete; the retry finds the saved game and applies them
+    assert failed.status_code == 500
+    assert retry.status_code == 200 and retry.headers["Idempotent-Replayed"] == "true"
+    assert after["total_games"] - before["total_games"] == 1
+    assert asyncio.run(server.games_collection.count_documents({"player_address": player})) == 1
+    assert asyncio.run(server.games_collection.find_one({"player_address": player}))["id"] == retry.json()["game_id"]
+    assert asyncio.run(server.users_collection.find_one({"wallet_address": player}))["games_played"] == 1
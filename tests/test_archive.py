@@ -0,0 +1,49 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from archive import GameArchive, compact_game, expand_game
+from leaderboard import Leaderboard
+from memory_store import MemoryDatabase
+from player_stats import PlayerStats
+from stats import StatsCounters
+
+
+def game(i, age_days):
+    return {
+        "id": f"game-{i}", "player_address": "0xa" if i % 2 else None, "dice_results": [i % 6 + 1, 1],
+        "total_score": i % 6 + 2, "timestamp": datetime.now() - timedelta(days=age_days), "network": "sepolia",
+        "nft_generated": i == 3, "nft_metadata": None, "nft_id": "nft-3" if i == 3 else None,
+        "nft_template_id": "t-3" if i == 3 else None, "game_mode": "fhe" if i % 3 == 0 else "standard",
+        "environment_id": None, "fhe_data": {"encrypted": True} if i % 3 == 0 else None,
+    }
+
+
+def test_compact_game_round_trip():
+    original = game(4, 100)
+    document = compact_game(original)
+    assert document["_id"] == "game-4"
+    assert not {"id", "network", "game_mode", "nft_generated", "nft_id", "fhe_data"} & set(document)
+    assert expand_game(document) == original
+
+
+def test_archive_moves_old_games_and_keeps_rollups():
+    db = MemoryDatabase("test")
+    games, archive = db["games"], db["games_archive"]
+    asyncio.run(games.insert_many([game(i, 100 + i) for i in range(7)] + [game(i, 1) for i in range(7, 10)]))
+    game_archive = GameArchive(games, archive, older_than_days=90, batch_size=3)
+    player_stats = PlayerStats(db["users"], games, archive_collection=archive)
+    leaderboard = Leaderboard(db["users"])
+    counters = StatsCounters(db["counters"], games, db["users"], archive_collection=archive)
+
+    async def run():
+        result = await game_archive.archive()
+        await player_stats.backfill()
+        return (result["archived"], await games.count_documents({}), await game_archive.find_game("game-3"),
+                await leaderboard.top(1), (await counters.reconcile())["counters"])
+
+    archived, hot, old_game, top, totals = asyncio.run(run())
+    assert (archived, hot) == (7, 3)
+    assert old_game["nft_template_id"] == "t-3" and old_game["fhe_data"] == {"encrypted": True}
+    odd = [i for i in range(10) if i % 2]
+    assert top == [{"_id": "0xa", "total_score": sum(i % 6 + 2 for i in odd), "games_played": len(odd)}]
+    assert totals["total_games"] == 10 and totals["total_nfts"] == 1
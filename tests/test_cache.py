@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from cache import LRUCache, TTLCache
+
+
+def test_ttl_cache_single_flight():
+    cache = TTLCache(ttl_seconds=60)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"total_games": 42}
+
+    async def run():
+        return await asyncio.gather(*[cache.get_or_load("stats", loader) for _ in range(50)])
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(result == {"total_games": 42} for result in results)
+
+
+def test_ttl_cache_expiry_and_invalidate():
+    cache = TTLCache(ttl_seconds=0)
+    values = iter(range(10))
+
+    async def loader():
+        return next(values)
+
+    async def run():
+        first = await cache.get_or_load("k", loader)
+        second = await cache.get_or_load("k", loader)
+        return first, second
+
+    assert asyncio.run(run()) == (0, 1)
+
+
+def test_ttl_cache_propagates_loader_errors():
+    cache = TTLCache(ttl_seconds=60)
+
+    async def loader():
+        raise RuntimeError("backend down")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get_or_load("k", loader))
+
+
+def test_lru_cache_eviction_and_negative_entries():
+    cache = LRUCache(max_size=2, negative_ttl_seconds=60)
+    loads = []
+
+    async def loader(key):
+        loads.append(key)
+        return None if key == "missing" else {"id": key}
+
+    async def run():
+        for key in ("a", "b", "a", "c", "a", "missing", "missing", "b"):
+            await cache.get_or_load(key, lambda: loader(key))
+
+    asyncio.run(run())
+    # "c" evicted "b", the least recently used, then "missing" evicted "c"
+    assert loads == ["a", "b", "c", "missing", "b"]
+    assert cache.counters() == {"hit": 2, "negative_hit": 1, "miss": 5}
+
+    # Filling on write replaces a cached miss
+    cache.set("missing", {"id": "missing"})
+    assert asyncio.run(cache.get_or_load("missing", lambda: loader("missing"))) == {"id": "missing"}
@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+
+import database
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+
+def test_importing_server_defers_heavy_modules():
+    code = ("import sys, server; "
+            "print(','.join(m for m in ('numpy', 'motor', 'pymongo') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True,
+                            env={**os.environ, "LOG_LEVEL": "WARNING"}, check=True)
+    assert result.stdout.strip() == ""
+
+
+def test_lazy_collection_resolves_on_first_use(monkeypatch):
+    monkeypatch.setattr(database, "STORAGE_BACKEND", "mongo")
+    monkeypatch.setattr(database, "_client", None)
+    collection = database.LazyCollection("games")
+    assert collection.name == "games" and database._client is None
+
+    assert collection.full_name == "zama_dice_game.games"
+    assert database._client is not None
+    assert database.get_client() is database._client
+
+
+def test_client_options_from_environment(monkeypatch):
+    monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "10")
+    monkeypatch.setenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "250")
+    monkeypatch.setenv("MONGO_COMPRESSORS", "zlib,unknown")
+    options = database.client_options()
+    assert options["maxPoolSize"] == 10
+    assert options["waitQueueTimeoutMS"] == 250
+    assert options["serverSelectionTimeoutMS"] == 5000
+    assert options["compressors"] == ["zlib"]
+
+
+def test_pool_stats_track_connections():
+    class Event:
+        address = ("db", 27017)
+
+    stats = database.PoolStats()
+    event = Event()
+    for handler in ("pool_created", "connection_created", "connection_created",
+                    "connection_check_out_started", "connection_checked_out",
+                    "connection_check_out_started", "connection_checked_out", "connection_checked_in",
+                    "connection_check_out_started"):
+        getattr(stats, handler)(event)
+
+    pool = stats.snapshot()["db:27017"]
+    assert (pool["open"], pool["in_use"], pool["idle"], pool["waiting"]) == (2, 1, 1, 1)
+    assert pool["check_outs"] == 2
+    totals = stats.totals()
+    assert totals["servers"] == 1 and totals["in_use"] == 1
+    assert "db" not in repr(totals)
+
+
+def test_pool_metrics_do_not_name_servers(monkeypatch):
+    import server
+
+    class Event:
+        address = ("db.internal", 27017)
+
+    stats = database.PoolStats()
+    stats.pool_created(Event())
+    stats.connection_created(Event())
+    monkeypatch.setattr(database, "pool_stats", stats)
+    rendered = server.metrics_registry.render()
+    assert 'mongo_pool_connections{state="open"} 1' in rendered
+    assert "db.internal" not in rendered
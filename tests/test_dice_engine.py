@@ -0,0 +1,27 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from dice_engine import rarity_batch, roll_dice_batch, score_batch
+from scoring import calculate_score, determine_nft_rarity
+
+
+@pytest.mark.parametrize("n_dice", range(1, 7))
+def test_batch_scoring_matches_scalar_functions_for_every_combination(n_dice):
+    combinations = list(itertools.product(range(1, 7), repeat=n_dice))
+    dice = np.array(combinations, dtype=np.int8)
+
+    assert score_batch(dice).tolist() == [calculate_score(list(c)) for c in combinations]
+    for game_mode in ("standard", "fhe"):
+        assert rarity_batch(dice, game_mode).tolist() == [
+            determine_nft_rarity(list(c), game_mode) for c in combinations
+        ]
+
+
+def test_roll_dice_batch_shape_and_range():
+    dice = roll_dice_batch(1000, 9, np.random.default_rng(1))
+    assert dice.shape == (1000, 6)
+    assert dice.min() >= 1 and dice.max() <= 6
+    with pytest.raises(ValueError):
+        roll_dice_batch(10, 0)
@@ -0,0 +1,33 @@
+import asyncio
+
+from events import EventHub
+
+
+def test_publish_fans_out_and_replays_after_last_event_id():
+    async def run():
+        hub = EventHub(replay_size=10, queue_size=10)
+        live = hub.subscribe()
+        first = hub.publish("game", {"id": "a"})
+        hub.publish("stats", {"total_games": 1})
+        late = hub.subscribe(last_event_id=first)
+        return [live.queue.qsize(), late.queue.get_nowait()]
+
+    live_count, replayed = asyncio.run(run())
+    assert live_count == 2
+    assert replayed == b'id: 2\nevent: stats\ndata: {"total_games":1}\n\n'
+
+
+def test_slow_consumers_are_dropped():
+    async def run():
+        hub = EventHub(queue_size=2)
+        slow = hub.subscribe()
+        for i in range(3):
+            hub.publish("game", {"id": i})
+        chunks = [chunk async for chunk in hub.stream(slow)]
+        return hub.subscriber_count, slow.dropped.is_set(), len(chunks)
+
+    subscribers, dropped, chunks = asyncio.run(run())
+    assert subscribers == 0
+    assert dropped
+    # The retry hint plus the two events that fit in the queue
+    assert chunks == 3
@@ -0,0 +1,79 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+
+import export
+from archive import compact_game
+from memory_store import MemoryDatabase
+
+
+def games_collection(count):
+    collection = MemoryDatabase("test")["games"]
+    start = datetime(2024, 1, 1)
+    asyncio.run(collection.insert_many([{
+        "id": f"game-{i:04d}", "timestamp": start + timedelta(minutes=i),
+        "player_address": f"0x{i % 3}", "game_mode": "fhe" if i % 2 else "standard",
+        "dice_results": [1, i % 6 + 1], "total_score": i % 6 + 2, "nft_generated": False,
+    } for i in range(count)]))
+    return collection
+
+
+async def collect(chunks):
+    return b"".join([chunk async for chunk in chunks])
+
+
+def test_ndjson_export_filters_and_streams_in_chunks(monkeypatch):
+    monkeypatch.setattr(export, "CHUNK_BYTES", 256)
+    collection = games_collection(100)
+    query = export.export_filter(player="0x1", mode="fhe", since=datetime(2024, 1, 1, 0, 10),
+                                 until=datetime(2024, 1, 1, 1))
+
+    async def run():
+        return [chunk async for chunk in export.export_games(collection, query, batch_size=7)]
+
+    chunks = asyncio.run(run())
+    games = [json.loads(line) for line in b"".join(chunks).splitlines()]
+    assert len(chunks) > 1
+    # Odd indexes 10 <= i < 60 with i % 3 == 1
+    assert [game["id"] for game in games] == [f"game-{i:04d}" for i in range(10, 60) if i % 2 and i % 3 == 1]
+    assert "_id" not in games[0]
+
+
+def test_gzipped_csv_export():
+    collection = games_collection(5)
+    data = asyncio.run(collect(export.gzip_chunks(export.export_games(collection, {}, "csv"))))
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(data).decode())))
+    assert [row["id"] for row in rows] == [f"game-{i:04d}" for i in range(5)]
+    assert rows[2]["dice_results"] == "1 3" and rows[2]["timestamp"] == "2024-01-01T00:02:00"
+
+
+def test_export_streams_archived_games_first():
+    db = MemoryDatabase("test")
+    games, archive = db["games"], db["games_archive"]
+    start = datetime(2024, 1, 1)
+    asyncio.run(games.insert_many([{
+        "id": f"game-{i:04d}", "timestamp": start + timedelta(minutes=i), "player_address": "0xa",
+        "game_mode": "fhe" if i % 2 else "standard", "dice_results": [1, 1], "total_score": 2,
+        "nft_generated": False, "network": "sepolia",
+    } for i in range(6)]))
+
+    async def run():
+        # Games 0-3 are archived and game 4 is caught between its copy and its deletion
+        moved = await games.find({"timestamp": {"$lt": start + timedelta(minutes=4)}}).to_list(None)
+        await archive.insert_many([compact_game(game) for game in moved])
+        await games.delete_many({"id": {"$in": [game["id"] for game in moved]}})
+        await archive.insert_one(compact_game(await games.find_one({"id": "game-0004"})))
+        everything = await collect(export.export_games(games, {}, archive_collection=archive))
+        standard = await collect(export.export_games(games, export.export_filter(mode="standard"),
+                                                     archive_collection=archive))
+        return everything, standard
+
+    everything, standard = asyncio.run(run())
+    games = [json.loads(line) for line in everything.splitlines()]
+    assert [game["id"] for game in games] == [f"game-{i:04d}" for i in range(6)]
+    # Archived games come back with their defaulted fields
+    assert games[0]["game_mode"] == "standard" and games[0]["nft_id"] is None
+    assert [json.loads(line)["id"] for line in standard.splitlines()] == ["game-0000", "game-0002", "game-0004"]
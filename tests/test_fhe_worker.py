@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+import pytest
+
+from fhe_worker import (FHEVerificationTimeout, FHEVerifier, FHEVerifierBusy, ciphertext, create_fhe_verifier,
+                        verify_ciphertexts)
+
+PAYLOAD = {"dice1": list(range(32)), "dice2": list(range(32, 64)), "mode": "fhe"}
+
+
+def test_dice_depend_on_the_server_nonce():
+    data = ciphertext(PAYLOAD)
+    assert data == bytes(range(64))
+    rolls = verify_ciphertexts([(data, bytes([nonce]), 3) for nonce in range(20)], work_factor=10)
+    assert all(len(dice) == 3 and all(1 <= die <= 6 for die in dice) for dice in rolls)
+    # The same ciphertext does not always roll the same dice
+    assert len({tuple(dice) for dice in rolls}) > 1
+    for invalid in ({"mode": "fhe"}, {"dice1": [256]}, {"dice1": ["a"]}):
+        with pytest.raises(ValueError):
+            ciphertext(invalid)
+
+
+def test_process_pool_keeps_the_event_loop_responsive():
+    verifier = FHEVerifier(max_workers=2, work_factor=200000, timeout_seconds=30)
+    payloads = [({"dice1": [i]}, 2) for i in range(8)]
+
+    async def run():
+        gaps = []
+
+        async def ticker():
+            last = time.perf_counter()
+            while True:
+                await asyncio.sleep(0.005)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        ticking = asyncio.ensure_future(ticker())
+        try:
+            return await verifier.verify(payloads), gaps
+        finally:
+            ticking.cancel()
+
+    try:
+        results, gaps = asyncio.run(run())
+    finally:
+        verifier.shutdown()
+    assert len(results) == 8 and all(len(dice) == 2 and all(1 <= die <= 6 for die in dice) for dice in results)
+    assert gaps and max(gaps) < 0.1
+    assert verifier.pending == 0
+
+
+def test_queue_depth_and_timeout_are_bounded():
+    verifier = FHEVerifier(max_workers=1, max_pending=2, work_factor=2000000, timeout_seconds=0.01,
+                           use_threads=True)
+
+    async def run():
+        with pytest.raises(FHEVerifierBusy):
+            await verifier.verify([(PAYLOAD, 2)] * 3)
+        with pytest.raises(FHEVerificationTimeout):
+            await verifier.verify([(PAYLOAD, 1)])
+        # Still being verified after the caller gave up
+        return verifier.pending
+
+    try:
+        assert asyncio.run(run()) == 1
+    finally:
+        verifier.shutdown()
+    assert verifier.counters()["rejected"] == 3 and verifier.counters()["timeouts"] == 1
+
+
+def test_falls_back_to_threads_without_process_support(monkeypatch):
+    import concurrent.futures
+
+    def no_semaphores(*args, **kwargs):
+        raise OSError(38, "Function not implemented")
+
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", no_semaphores)
+    verifier = FHEVerifier(max_workers=1, work_factor=10)
+    try:
+        dice, = asyncio.run(verifier.verify([(PAYLOAD, 2)]))
+    finally:
+        verifier.shutdown()
+    assert len(dice) == 2 and verifier.use_threads
+
+    monkeypatch.setenv("VERCEL", "1")
+    monkeypatch.delenv("FHE_EXECUTOR", raising=False)
+    assert create_fhe_verifier().use_threads
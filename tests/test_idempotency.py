@@ -0,0 +1,87 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from idempotency import (IdempotencyConflict, IdempotencyKeyReused, IdempotencyStore, fingerprint, outstanding,
+                         utc_now)
+from memory_store import MemoryDatabase
+
+
+def test_claim_complete_and_replay():
+    collection = MemoryDatabase("test")["idempotency_keys"]
+    store = IdempotencyStore(collection)
+
+    async def run():
+        assert await store.lookup("k1", "fp") is None
+        assert await store.claim("k1", "fp") is None
+        with pytest.raises(IdempotencyConflict):
+            await store.lookup("k1", "fp")
+        with pytest.raises(IdempotencyConflict):
+            await store.claim("k1", "fp")
+        await store.complete("k1", "fp", {"game_id": "g1"})
+        assert (await IdempotencyStore(collection).lookup("k1", "fp"))["response"] == {"game_id": "g1"}
+        # A fresh worker has an empty cache and reads the record back
+        other_worker = IdempotencyStore(collection)
+        replays = [await store.claim("k1", "fp"), await other_worker.claim("k1", "fp")]
+        with pytest.raises(IdempotencyKeyReused):
+            await other_worker.claim("k1", "other")
+        return [replay["response"] for replay in replays]
+
+    assert asyncio.run(run()) == [{"game_id": "g1"}, {"game_id": "g1"}]
+
+
+def test_failed_and_abandoned_claims_can_be_retried():
+    collection = MemoryDatabase("test")["idempotency_keys"]
+    store = IdempotencyStore(collection)
+
+    async def run():
+        await store.claim("failed", "fp")
+        await store.release("failed")
+        retried = await store.claim("failed", "fp")
+        await store.claim("crashed", "fp")
+        await collection.update_one({"_id": "crashed"},
+                                    {"$set": {"expires_at": utc_now() - timedelta(seconds=1)}})
+        return retried, await store.claim("crashed", "fp")
+
+    assert asyncio.run(run()) == (None, None)
+
+
+def test_abandoned_claim_names_its_game():
+    collection = MemoryDatabase("test")["idempotency_keys"]
+    store = IdempotencyStore(collection)
+
+    async def run():
+        await store.claim("k1", "fp", "g1")
+        await collection.update_one({"_id": "k1"}, {"$set": {"expires_at": utc_now() - timedelta(seconds=1)}})
+        taken_over = await store.claim("k1", "fp", "g2")
+        with pytest.raises(IdempotencyConflict):
+            await store.claim("k1", "fp", "g3")
+        return taken_over
+
+    assert asyncio.run(run())["game_id"] == "g1"
+
+
+def test_failed_rollups_are_taken_once():
+    collection = MemoryDatabase("test")["idempotency_keys"]
+    store = IdempotencyStore(collection)
+
+    async def run():
+        await store.claim("k1", "fp", "g1")
+        await store.complete("k1", "fp", {"game_id": "g1"}, ["stats", "player_stats"])
+        await store.finish_rollups("k1", ["player_stats"], ["stats"])
+        record = await store.lookup("k1", "fp")
+        taken = [await store.take_rollups("k1", record), await store.take_rollups("k1", record)]
+        # Running rollups are taken again once their attempt is given up on
+        await collection.update_one({"_id": "k1"}, {"$set": {"rollups_until": utc_now() - timedelta(seconds=1)}})
+        taken.append(await store.take_rollups("k1", record))
+        await store.finish_rollups("k1", ["stats"])
+        settled = await store.lookup("k1", "fp")
+        return taken, outstanding(record), outstanding(settled)
+
+    assert asyncio.run(run()) == ([["stats"], [], ["stats"]], True, False)
+
+
+def test_fingerprint_ignores_key_order():
+    assert fingerprint("0xa", {"dice1": [1], "dice2": [2]}) == fingerprint("0xa", {"dice2": [2], "dice1": [1]})
+    assert fingerprint("0xa", {"dice1": [1]}) != fingerprint("0xb", {"dice1": [1]})
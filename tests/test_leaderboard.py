@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from leaderboard import Leaderboard, WindowedLeaderboard
+from memory_store import MemoryDatabase
+
+
+def test_top_k_keeps_highest_totals_in_order():
+    board = Leaderboard(users_collection=None, max_size=3)
+    assert board.offer({"_id": player, "total_score": score, "games_played": 1}
+                       for player, score in [("0xa", 10), ("0xb", 30), ("0xc", 20), ("0xd", 5)])
+    assert [entry["_id"] for entry in board._top] == ["0xb", "0xc", "0xa"]
+
+    # A player's growing total moves them up instead of duplicating them
+    board._offer({"_id": "0xa", "total_score": 40, "games_played": 2})
+    assert [entry["_id"] for entry in board._top] == ["0xa", "0xb", "0xc"]
+
+    # An outsider that overtakes the minimum pushes it out
+    board._offer({"_id": "0xd", "total_score": 25, "games_played": 2})
+    assert not board.offer([{"_id": "0xe", "total_score": 1, "games_played": 1}])
+    assert [entry["_id"] for entry in board._top] == ["0xa", "0xb", "0xd"]
+
+
+def test_windowed_rollups_group_games_by_mode_day_and_player():
+    board = WindowedLeaderboard(collection=None, buckets_collection=None, users_collection=None, retention_days=35)
+    day = datetime(2024, 3, 1, 15, 30)
+    games = [
+        SimpleNamespace(player_address="0xa", game_mode="fhe", total_score=8, timestamp=day),
+        SimpleNamespace(player_address="0xa", game_mode="fhe", total_score=4, timestamp=day),
+        SimpleNamespace(player_address="0xb", game_mode="fhe", total_score=6, timestamp=day),
+        SimpleNamespace(player_address="0xa", game_mode="other", total_score=5, timestamp=day),
+        SimpleNamespace(player_address=None, game_mode="fhe", total_score=9, timestamp=day),
+    ]
+    updates = board.updates(games)
+    assert sorted(updates) == ["fhe:2024-03-01:0xa", "fhe:2024-03-01:0xb", "standard:2024-03-01:0xa"]
+    fhe = updates["fhe:2024-03-01:0xa"]
+    assert fhe["$inc"] == {"total_score": 12, "games_played": 2}
+    assert fhe["$setOnInsert"]["player"] == "0xa" and fhe["$setOnInsert"]["mode"] == "fhe"
+
+    # Expiry is in UTC, 36 local days after the start of the rollup's day
+    expires_at = fhe["$setOnInsert"]["expires_at"]
+    assert expires_at.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None) == datetime(2024, 4, 6)
+
+
+def test_windowed_buckets_keep_the_top_k_of_each_day():
+    db = MemoryDatabase("test")
+    board = WindowedLeaderboard(db["leaderboard_rollups"], db["leaderboard_days"], db["users"],
+                                max_size=2, bucket_size=2, cache_seconds=0)
+    today = datetime.now()
+    yesterday = today - timedelta(days=1)
+
+    def play(player, score, timestamp=today):
+        return SimpleNamespace(player_address=player, game_mode="fhe", total_score=score, timestamp=timestamp)
+
+    async def run():
+        await board.record_games([play("0xa", 5), play("0xb", 9), play("0xc", 7)])
+        # Below the full bucket's lowest total: only the rollup is written
+        await board.record_games([play("0xd", 3)])
+        # A player climbing into the top-K pushes the lowest one out
+        await board.record_games([play("0xa", 6)])
+        await board.record_games([play("0xc", 4, yesterday)])
+        buckets = await db["leaderboard_days"].find().to_list(None)
+        return buckets, await board.top("day", "fhe"), await board.top("week", "fhe")
+
+    buckets, daily, weekly = asyncio.run(run())
+    assert sorted(len(bucket["top"]) for bucket in buckets) == [1, 2]
+    assert daily == [{"_id": "0xa", "total_score": 11, "games_played": 2},
+                     {"_id": "0xb", "total_score": 9, "games_played": 1}]
+    # Merged from two buckets, whatever the number of players
+    assert [entry["_id"] for entry in weekly] == ["0xa", "0xb"]
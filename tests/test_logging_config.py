@@ -0,0 +1,50 @@
+import io
+import json
+import logging
+
+import logging_config
+
+
+def capture():
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging_config.JSONFormatter())
+    return stream, handler
+
+
+def test_events_are_json_lines_with_request_id(monkeypatch):
+    stream, handler = capture()
+    monkeypatch.setattr(logging_config.logger, "handlers", [logging_config._DeferredQueueHandler(_Forward(handler))])
+    monkeypatch.setattr(logging_config.logger, "level", logging.INFO)
+    token = logging_config.request_id_var.set("req-1")
+    try:
+        logging_config.log_event("game_played", game_id="g1", dice_results=[1, 2])
+    finally:
+        logging_config.request_id_var.reset(token)
+
+    entry = json.loads(stream.getvalue())
+    assert entry["event"] == "game_played"
+    assert entry["request_id"] == "req-1"
+    assert entry["game_id"] == "g1" and entry["dice_results"] == [1, 2]
+
+
+def test_level_gating_and_sampling(monkeypatch):
+    stream, handler = capture()
+    monkeypatch.setattr(logging_config.logger, "handlers", [handler])
+    monkeypatch.setattr(logging_config.logger, "level", logging.INFO)
+    monkeypatch.setattr(logging_config, "_sample_rates", logging_config.parse_sample_rates("noisy=0, kept=1"))
+
+    logging_config.log_event("debug_only", logging.DEBUG)
+    logging_config.log_event("noisy")
+    logging_config.log_event("kept")
+    assert [json.loads(line)["event"] for line in stream.getvalue().splitlines()] == ["kept"]
+
+
+class _Forward:
+    """Queue stand-in handing records straight to a handler"""
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def put_nowait(self, record):
+        self.handler.handle(record)
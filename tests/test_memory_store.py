@@ -0,0 +1,273 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from archive import archive_filter
+from export import export_filter
+from indexes import INDEXES
+from memory_store import MemoryDatabase
+from pagination import encode_cursor, keyset_filter
+
+START = datetime(2024, 1, 1)
+
+
+def games_collection(db):
+    games = db["games"]
+    asyncio.run(games.create_indexes([
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)], name="timestamp_id"),
+    ]))
+    return games
+
+
+def test_keyset_pages_are_served_from_the_sorted_index():
+    games = games_collection(MemoryDatabase("test"))
+    start = datetime(2024, 1, 1)
+
+    async def run():
+        await games.insert_many([
+            {"id": f"g{i:03d}", "timestamp": start + timedelta(seconds=i // 2), "total_score": i}
+            for i in range(50)
+        ])
+        pages, cursor = [], None
+        while True:
+            query = games.find(keyset_filter(cursor), {"_id": 0}).sort([("timestamp", -1), ("id", -1)]).limit(20)
+            page = await query.to_list(20)
+            pages.append([game["id"] for game in page])
+            if len(page) < 20:
+                return pages, await query.explain()
+            cursor = encode_cursor(page[-1])
+
+    pages, plan = asyncio.run(run())
+    assert sum(pages, []) == [f"g{i:03d}" for i in range(49, -1, -1)]
+    assert plan["queryPlanner"]["winningPlan"]["inputStage"]["indexName"] == "timestamp_id"
+
+
+def app_database():
+    """Collections indexed the way indexes.py declares them, with a few documents of each kind"""
+    db = MemoryDatabase("test")
+
+    async def seed():
+        for name, indexes in INDEXES.items():
+            await db[name].create_indexes(indexes)
+        await db["games"].insert_many([
+            {"id": f"g{i:02d}", "timestamp": START + timedelta(hours=i // 2),
+             "player_address": ["0xa", "0xb", None][i % 3], "game_mode": "fhe" if i % 2 else "standard",
+             "total_score": i, "nft_generated": i % 3 != 2}
+            for i in range(30)
+        ])
+        await db["games_archive"].insert_many([
+            {"_id": f"a{i}", "timestamp": START - timedelta(days=i + 1), "total_score": i,
+             **({"player_address": "0xa", "game_mode": "fhe"} if i % 2 else {})}
+            for i in range(6)
+        ])
+        await db["users"].insert_many([
+            {"wallet_address": f"0x{i}", "username": f"user{i}" if i % 2 else None, "total_score": i % 4,
+             "modes": {"fhe": {"total_score": i % 3}}}
+            for i in range(10)
+        ])
+        await db["leaderboard_days"].insert_many([
+            {"_id": f"{mode}:{day}", "mode": mode, "day": START + timedelta(days=day), "top": []}
+            for mode in ("standard", "fhe") for day in range(5)
+        ])
+
+    asyncio.run(seed())
+    return db
+
+
+# Every query shape the app issues: (collection, filter, sort, limit, expected index or None for a scan)
+APP_QUERIES = {
+    "get_game": ("games", {"id": "g07"}, [], 1, "id_unique"),
+    "get_games": ("games", {}, [("timestamp", -1), ("id", -1)], 10, "timestamp_id"),
+    "get_games_page": ("games", keyset_filter(encode_cursor({"timestamp": START + timedelta(hours=9), "id": "g19"})),
+                       [("timestamp", -1), ("id", -1)], 10, "timestamp_id"),
+    "player_games": ("games", {"player_address": "0xa"}, [("timestamp", -1)], 10, "player_timestamp"),
+    "archive_batch": ("games", {"timestamp": {"$lt": START + timedelta(hours=5)}}, [("timestamp", 1), ("id", 1)], 4,
+                      "timestamp_id"),
+    "export": ("games", export_filter("0xb", "fhe", START, START + timedelta(hours=12)),
+               [("timestamp", 1), ("id", 1)], 0, "player_timestamp"),
+    "export_after_archive": ("games", {"$and": [export_filter(None, None, None, None), {"$or": [
+        {"timestamp": {"$gt": START + timedelta(hours=3)}},
+        {"timestamp": START + timedelta(hours=3), "id": {"$gt": "g06"}},
+    ]}]}, [("timestamp", 1), ("id", 1)], 0, "timestamp_id"),
+    "export_archive": ("games_archive",
+                       archive_filter(export_filter(None, "standard", START - timedelta(days=4), None)),
+                       [("timestamp", 1), ("_id", 1)], 0, "timestamp_id"),
+    "rebuild_windows": ("games", {"timestamp": {"$gte": START + timedelta(hours=10)}, "player_address": {"$ne": None}},
+                        [], 0, None),
+    "player_totals": ("users", {"wallet_address": {"$in": ["0x3", "0x8", "0xf"]}}, [], 0, "wallet_address_unique"),
+    "get_leaderboard": ("users", {"total_score": {"$gt": 0}}, [("total_score", -1), ("wallet_address", 1)], 5,
+                        "total_score"),
+    "get_mode_leaderboard": ("users", {"modes.fhe.total_score": {"$gt": 0}},
+                             [("modes.fhe.total_score", -1), ("wallet_address", 1)], 5, "fhe_total_score"),
+    "total_users": ("users", {"username": {"$ne": None}}, [], 0, None),
+    "total_nfts": ("games", {"nft_generated": True}, [], 0, None),
+    "get_weekly_leaderboard": ("leaderboard_days", {"mode": {"$in": ["standard", "fhe"]},
+                                                    "day": {"$gte": START + timedelta(days=2)}}, [], 0, "mode_day"),
+}
+
+
+def field_value(document, field):
+    for part in field.split("."):
+        document = document.get(part) if isinstance(document, dict) else None
+    return document
+
+
+def matches_expected(document, query):
+    # The filters above, evaluated independently of the engine
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(matches_expected(document, branch) for branch in condition):
+                return False
+            continue
+        if field == "$or":
+            if not any(matches_expected(document, branch) for branch in condition):
+                return False
+            continue
+        value = field_value(document, field)
+        tests = condition.items() if isinstance(condition, dict) else [("$eq", condition)]
+        for operator, target in tests:
+            if operator in ("$gt", "$gte", "$lt", "$lte") and value is None:
+                return False
+            if not {"$eq": lambda: value == target, "$ne": lambda: value != target, "$in": lambda: value in target,
+                    "$gt": lambda: value > target, "$gte": lambda: value >= target,
+                    "$lt": lambda: value < target, "$lte": lambda: value <= target}[operator]():
+                return False
+    return True
+
+
+@pytest.mark.parametrize("name", list(APP_QUERIES))
+def test_app_query_shapes(name):
+    db = app_database()
+    collection, query, sort, limit, index = APP_QUERIES[name]
+
+    async def run():
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(None), await cursor.explain(), await db[collection].find().to_list(None)
+
+    found, plan, everything = asyncio.run(run())
+    expected = [document for document in everything if matches_expected(document, query)]
+    for field, direction in reversed(sort):
+        expected.sort(key=lambda document: field_value(document, field), reverse=direction < 0)
+    if not sort:
+        found.sort(key=lambda document: document["_id"])
+        expected.sort(key=lambda document: document["_id"])
+    assert found == (expected[:limit] if limit else expected) and found
+    input_stage = plan["queryPlanner"]["winningPlan"].get("inputStage", {})
+    assert input_stage.get("indexName") == index
+
+
+def test_in_lookups_and_deletes_use_the_id_index():
+    db = MemoryDatabase("test")
+    games = db["games"]
+
+    async def run():
+        await games.insert_many([{"_id": i, "id": f"g{i}"} for i in range(100)])
+        accesses = games._by_id.accesses
+        plan = await games.find({"_id": {"$in": [3, 5, 200]}}).explain()
+        deleted = await games.delete_many({"_id": {"$in": [3, 5, 200]}})
+        return plan, deleted.deleted_count, games._by_id.accesses - accesses, await games.count_documents({})
+
+    plan, deleted, lookups, remaining = asyncio.run(run())
+    assert plan["queryPlanner"]["winningPlan"]["inputStage"]["indexName"] == "_id_"
+    # One lookup per value for explain and one per value for the delete, no scan
+    assert (deleted, lookups, remaining) == (2, 6, 98)
+
+
+def test_unique_index_and_upserts():
+    users = MemoryDatabase("test")["users"]
+
+    async def run():
+        await users.create_indexes([IndexModel([("wallet_address", ASCENDING)], unique=True)])
+        await users.insert_one({"wallet_address": "0xa", "username": "alice"})
+        with pytest.raises(DuplicateKeyError):
+            await users.insert_one({"wallet_address": "0xa", "username": "again"})
+
+        update = {"$inc": {"games_played": 1, "modes.fhe.total_score": 9}, "$max": {"best_roll": 9},
+                  "$setOnInsert": {"id": "new"}}
+        created = await users.update_one({"wallet_address": "0xb"}, update, upsert=True)
+        await users.update_one({"wallet_address": "0xb"}, {**update, "$max": {"best_roll": 4}}, upsert=True)
+        with pytest.raises(BulkWriteError) as error:
+            await users.bulk_write([UpdateOne({"wallet_address": "0xc"}, {"$set": {"wallet_address": "0xa"}},
+                                              upsert=True)], ordered=False)
+        return created, await users.find_one({"wallet_address": "0xb"}, {"_id": 0}), error.value
+
+    created, user, error = asyncio.run(run())
+    assert created.upserted_id is not None
+    assert user == {"wallet_address": "0xb", "games_played": 2, "modes": {"fhe": {"total_score": 18}},
+                    "best_roll": 9, "id": "new"}
+    assert error.details["writeErrors"][0]["code"] == 11000
+
+
+def test_aggregation_union_group_sort_and_limit():
+    db = MemoryDatabase("test")
+
+    async def run():
+        await db["games"].insert_many([
+            {"player_address": player, "total_score": score, "game_mode": mode}
+            for player, score, mode in [("0xa", 5, "fhe"), ("0xa", 7, "standard"), ("0xb", 3, "fhe"), (None, 9, "fhe")]
+        ])
+        await db["games_archive"].insert_many([{"player_address": "0xc", "total_score": 4}])
+        groups = await db["games"].aggregate([
+            {"$unionWith": "games_archive"},
+            {"$match": {"player_address": {"$ne": None}}},
+            {"$group": {"_id": "$player_address", "total_score": {"$sum": "$total_score"},
+                        "best_roll": {"$max": "$total_score"},
+                        "fhe_games": {"$sum": {"$cond": [{"$eq": ["$game_mode", "fhe"]}, 1, 0]}}}},
+            {"$sort": {"total_score": -1}},
+            {"$limit": 2},
+        ]).to_list(None)
+        with pytest.raises(ValueError):
+            await db["games"].aggregate([{"$out": "totals"}]).to_list(None)
+        return groups
+
+    assert asyncio.run(run()) == [{"_id": "0xa", "total_score": 12, "best_roll": 7, "fhe_games": 1},
+                                  {"_id": "0xc", "total_score": 4, "best_roll": 4, "fhe_games": 0}]
+
+
+def test_ttl_purge_compares_in_utc():
+    db = MemoryDatabase("test")
+    keys = db["idempotency_keys"]
+    now = datetime.now(timezone.utc)
+
+    async def run():
+        await keys.create_indexes([
+            IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        ])
+        await keys.insert_many([
+            {"_id": "expired", "expires_at": (now - timedelta(minutes=1)).replace(tzinfo=None)},
+            {"_id": "expired_aware", "expires_at": now - timedelta(minutes=1)},
+            {"_id": "live", "expires_at": (now + timedelta(minutes=1)).replace(tzinfo=None)},
+            {"_id": "live_aware", "expires_at": (now + timedelta(minutes=1)).astimezone()},
+        ])
+        keys._next_purge = 0.0
+        return [key["_id"] for key in await keys.find().to_list(None)]
+
+    assert asyncio.run(run()) == ["live", "live_aware"]
+
+
+def test_append_only_file_is_replayed(tmp_path):
+    path = str(tmp_path / "store.bson")
+    db = MemoryDatabase("test", path)
+
+    async def write():
+        await db["users"].insert_one({"_id": "a", "games_played": 1})
+        await db["users"].insert_one({"_id": "b", "games_played": 1})
+        await db["users"].update_one({"_id": "a"}, {"$inc": {"games_played": 2}})
+        await db["users"].delete_one({"_id": "b"})
+
+    asyncio.run(write())
+    db.close()
+    # A record cut short by a crash is dropped on replay
+    with open(path, "ab") as f:
+        f.write(b"\x40\x00\x00\x00partial")
+
+    reopened = MemoryDatabase("test", path)
+    assert asyncio.run(reopened["users"].find().to_list(None)) == [{"_id": "a", "games_played": 3}]
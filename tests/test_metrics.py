@@ -0,0 +1,75 @@
+import asyncio
+
+from metrics import InstrumentedCollection, MetricsRegistry
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, *args):
+        return self
+
+    def limit(self, n):
+        self.documents = self.documents[:n]
+        return self
+
+    async def to_list(self, length):
+        return list(self.documents)
+
+    async def __aiter__(self):
+        for document in self.documents:
+            yield document
+
+
+class FakeCollection:
+    name = "games"
+
+    async def insert_one(self, document):
+        return document
+
+    async def find_one(self, query):
+        raise RuntimeError("boom")
+
+    def find(self, query=None):
+        return FakeCursor([{"id": "a"}, {"id": "b"}])
+
+
+def test_instrumented_collection_times_calls_and_counts_errors():
+    registry = MetricsRegistry()
+    games = InstrumentedCollection(FakeCollection(), registry)
+
+    async def run():
+        await games.insert_one({"id": "a"})
+        try:
+            await games.find_one({"id": "a"})
+        except RuntimeError:
+            pass
+        return await games.find().sort("timestamp", -1).limit(1).to_list(1)
+
+    assert asyncio.run(run()) == [{"id": "a"}]
+    assert set(registry.db_latency.series) == {("games", "insert_one"), ("games", "find_one"), ("games", "find")}
+    assert registry.db_errors == {("games", "find_one"): 1}
+
+
+def test_iterated_cursors_are_timed():
+    registry = MetricsRegistry()
+    games = InstrumentedCollection(FakeCollection(), registry)
+
+    async def run():
+        return [game["id"] async for game in games.find()]
+
+    assert asyncio.run(run()) == ["a", "b"]
+    # A single observation for the whole iteration
+    assert sum(registry.db_latency.series[("games", "find")][:-1]) == 1
+
+
+def test_render_prometheus_histogram():
+    registry = MetricsRegistry()
+    registry.request_latency.observe(("GET", "/api/game/{game_id}"), 0.003)
+    registry.request_latency.observe(("GET", "/api/game/{game_id}"), 20.0)
+    text = registry.render()
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/game/{game_id}",le="0.0025"} 0' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/game/{game_id}",le="0.005"} 1' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/game/{game_id}",le="+Inf"} 2' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/game/{game_id}"} 2' in text
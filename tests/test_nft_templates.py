@@ -0,0 +1,42 @@
+import pytest
+
+import nft_templates
+
+
+def test_template_content():
+    metadata = nft_templates.render(nft_templates.get_template((3, 3), "fhe"))
+    assert metadata == {
+        "name": "🔐 FHE Dice NFT #3-3",
+        "description": "A privacy-preserving unique NFT generated from dice roll: [3, 3]. Rarity: Legendary",
+        "image": "https://api.dicenft.game/images/fhe-3-3.png",
+        "attributes": {
+            "dice_combination": [3, 3],
+            "total_score": 6,
+            "rarity": "Legendary",
+            "special_combo": True,
+            "creator": "dropxtor",
+            "network": "sepolia",
+            "game_mode": "fhe",
+            "fhe_enabled": True
+        },
+        "creator": "dropxtor",
+        "twitter": "@0xDropxtor",
+        "powered_by": "Zama FHE"
+    }
+
+
+def test_rendered_copies_do_not_leak_into_the_cached_template():
+    first = nft_templates.render(nft_templates.get_template((1, 2), "standard"))
+    first["attributes"]["dice_combination"].append(6)
+    first["name"] = "changed"
+    second = nft_templates.render(nft_templates.get_template((1, 2), "standard"))
+    assert second["name"] == "Dice NFT #1-2"
+    assert second["attributes"]["dice_combination"] == [1, 2]
+
+
+def test_template_id_round_trip():
+    assert nft_templates.template_id([1, 2, 3], "standard") == "std-1-2-3"
+    assert nft_templates.parse_template_id("fhe-6-6") == ((6, 6), "fhe")
+    assert nft_templates.render_template_id("std-1-2-3")["image"].endswith("/std-1-2-3.png")
+    with pytest.raises(ValueError):
+        nft_templates.parse_template_id("gold-1-2")
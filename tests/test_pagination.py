@@ -0,0 +1,27 @@
+from datetime import datetime
+
+import pytest
+
+from pagination import decode_cursor, encode_cursor, keyset_filter, parse_fields
+
+
+def test_cursor_round_trip():
+    game = {"timestamp": datetime(2025, 1, 2, 3, 4, 5, 678000), "id": "abc-123"}
+    assert decode_cursor(encode_cursor(game)) == (game["timestamp"], "abc-123")
+
+
+def test_keyset_filter_breaks_timestamp_ties_on_id():
+    game = {"timestamp": datetime(2025, 1, 2), "id": "b"}
+    assert keyset_filter(encode_cursor(game)) == {"$or": [
+        {"timestamp": {"$lt": datetime(2025, 1, 2)}},
+        {"timestamp": datetime(2025, 1, 2), "id": {"$lt": "b"}},
+    ]}
+    assert keyset_filter(None) == {}
+
+
+def test_invalid_cursor_and_fields_are_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+    with pytest.raises(ValueError):
+        parse_fields("dice_results,password")
+    assert parse_fields("dice_results") == {"dice_results": 1, "timestamp": 1, "id": 1}
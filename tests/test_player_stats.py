@@ -0,0 +1,29 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from player_stats import PlayerStats
+
+
+def game(player, total_score, game_mode="standard", nft_generated=True, minute=0):
+    return SimpleNamespace(player_address=player, total_score=total_score, game_mode=game_mode,
+                           nft_generated=nft_generated, timestamp=datetime(2024, 1, 1, 0, minute))
+
+
+def test_updates_are_one_document_per_player():
+    updates = PlayerStats.updates([
+        game("0xa", 7), game("0xa", 12, "fhe", minute=5), game("0xb", 4, nft_generated=False),
+        game(None, 9), game("0xa", 3, "$where", minute=2),
+    ])
+    assert set(updates) == {"0xa", "0xb"}
+
+    update = updates["0xa"]
+    assert update["$inc"] == {
+        "games_played": 3, "total_score": 22, "nfts_owned": 3,
+        "modes.standard.games_played": 2, "modes.standard.total_score": 10,
+        "modes.fhe.games_played": 1, "modes.fhe.total_score": 12,
+    }
+    assert update["$max"] == {
+        "best_roll": 12, "modes.standard.best_roll": 7, "modes.fhe.best_roll": 12,
+        "last_played_at": datetime(2024, 1, 1, 0, 5),
+    }
+    assert updates["0xb"]["$inc"]["nfts_owned"] == 0
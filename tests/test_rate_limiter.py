@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from rate_limiter import InMemoryRateLimiter, LocalCounterStore, SharedRateLimiter, create_rate_limiter
+
+
+def test_in_memory_limits_per_key():
+    limiter = InMemoryRateLimiter(max_requests=3, window_seconds=60)
+    now = 6000.0
+    assert [limiter.hit_sync("a", now=now) for _ in range(4)] == [True, True, True, False]
+    assert limiter.hit_sync("b", now=now)
+
+
+def test_in_memory_sliding_window_weights_previous_window():
+    limiter = InMemoryRateLimiter(max_requests=10, window_seconds=60)
+    for _ in range(10):
+        assert limiter.hit_sync("a", now=6000.0)
+    # Halfway through the next window, half of the previous window still counts
+    assert [limiter.hit_sync("a", now=6090.0) for _ in range(6)] == [True] * 5 + [False]
+
+
+def test_in_memory_evicts_idle_keys_and_caps_size():
+    limiter = InMemoryRateLimiter(max_requests=5, window_seconds=60, max_keys=100)
+    for i in range(50):
+        limiter.hit_sync(f"ip-{i}", now=6000.0)
+    assert len(limiter) == 50
+    limiter.hit_sync("late", now=6000.0 + 180)
+    assert len(limiter) == 1
+
+    for i in range(500):
+        limiter.hit_sync(f"ip-{i}", now=9000.0)
+    assert len(limiter) == 100
+
+
+def test_cost_counts_against_limit():
+    limiter = InMemoryRateLimiter(max_requests=10, window_seconds=60)
+    assert limiter.hit_sync("a", cost=8, now=6000.0)
+    assert not limiter.hit_sync("a", cost=3, now=6000.0)
+    assert limiter.hit_sync("a", cost=2, now=6000.0)
+
+
+def test_shared_limiter_is_consistent_across_instances():
+    store = LocalCounterStore()
+    workers = [SharedRateLimiter(max_requests=4, window_seconds=60, store=store) for _ in range(2)]
+
+    async def run():
+        return [await workers[i % 2].hit("a") for i in range(6)]
+
+    results = asyncio.run(run())
+    assert results.count(True) <= 4
+    assert results[-1] is False
+
+
+def test_create_rate_limiter_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        create_rate_limiter(10, 60, backend="carrier-pigeon")
@@ -0,0 +1,30 @@
+import itertools
+
+import numpy as np
+
+import score_table
+from scoring import calculate_score, determine_nft_rarity
+
+
+def test_encoding_is_dense_and_unique():
+    codes = [
+        score_table.encode(combination)
+        for n_dice in range(1, 7)
+        for combination in itertools.product(range(1, 7), repeat=n_dice)
+    ]
+    assert sorted(codes) == list(range(score_table.TABLE_SIZE)) == list(range(55986))
+
+
+def test_table_matches_scalar_functions():
+    for n_dice in range(1, 7):
+        for combination in itertools.product(range(1, 7), repeat=n_dice):
+            dice = list(combination)
+            assert score_table.score(dice) == calculate_score(dice)
+            assert score_table.rarity(dice) == determine_nft_rarity(dice)
+            assert score_table.rarity(dice, "fhe") == determine_nft_rarity(dice, "fhe")
+
+
+def test_batch_lookup_matches_scalar_lookup():
+    dice = np.random.default_rng(7).integers(1, 7, size=(500, 3))
+    scores, _, _ = score_table.get_table().lookup_batch(dice)
+    assert scores.tolist() == [score_table.score(row) for row in dice.tolist()]
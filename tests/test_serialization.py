@@ -0,0 +1,17 @@
+import json
+from datetime import datetime
+
+import pytest
+from bson import Decimal128, ObjectId
+
+from serialization import dumps
+
+
+def test_dumps_known_types_and_rejects_others():
+    object_id = ObjectId()
+    content = {"at": datetime(2024, 1, 2, 3, 4), "id": object_id, "amount": Decimal128("1.50"), "dice": (1, 2)}
+    assert json.loads(dumps(content)) == {
+        "at": "2024-01-02T03:04:00", "id": str(object_id), "amount": "1.50", "dice": [1, 2],
+    }
+    with pytest.raises(TypeError):
+        dumps({"value": object()})
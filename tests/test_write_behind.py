@@ -0,0 +1,55 @@
+import asyncio
+
+from write_behind import WriteBehindBuffer
+
+
+class RecordingCollection:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    async def insert_many(self, documents, ordered=True):
+        await asyncio.sleep(self.delay)
+        self.batches.append([document["id"] for document in documents])
+
+
+def test_flushes_by_size_and_keeps_unflushed_writes_readable():
+    collection = RecordingCollection(delay=0.01)
+    buffer = WriteBehindBuffer(collection, max_batch=10, flush_interval=10)
+
+    async def run():
+        for i in range(25):
+            await buffer.put({"id": str(i)})
+        assert buffer.get("24") == {"id": "24"}
+        await buffer.drain()
+
+    asyncio.run(run())
+    assert sorted(int(i) for batch in collection.batches for i in batch) == list(range(25))
+    assert max(len(batch) for batch in collection.batches) <= 10
+    assert buffer.pending == {}
+
+
+def test_flushes_by_time():
+    collection = RecordingCollection()
+    buffer = WriteBehindBuffer(collection, max_batch=100, flush_interval=0.01)
+
+    async def run():
+        await buffer.put({"id": "a"})
+        await asyncio.sleep(0.1)
+        flushed = list(collection.batches)
+        await buffer.drain()
+        return flushed
+
+    assert asyncio.run(run()) == [["a"]]
+
+
+def test_backpressure_when_queue_is_full():
+    collection = RecordingCollection(delay=0.05)
+    buffer = WriteBehindBuffer(collection, max_batch=2, flush_interval=0, max_queue=2)
+
+    async def run():
+        await asyncio.wait_for(asyncio.gather(*[buffer.put({"id": str(i)}) for i in range(10)]), 5)
+        await buffer.drain()
+
+    asyncio.run(run())
+    assert sum(len(batch) for batch in collection.batches) == 10